@@ -0,0 +1,7 @@
+"""
+Benchmarks for the django-gov-notify send pipeline.
+
+Run ``python -m benchmarks --help`` from the repository root. Requests are sent to
+a local stand-in for the Notify API (see ``benchmarks.fake_notify``), never to
+GOV.UK Notify itself.
+"""
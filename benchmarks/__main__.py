@@ -0,0 +1,126 @@
+import argparse
+import json
+import logging
+import sys
+import time
+import tracemalloc
+import uuid
+
+import django
+from django.conf import settings
+
+from benchmarks.fake_notify import FakeNotifyServer
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark the django-gov-notify send pipeline against a "
+        "local stand-in for the Notify API, and print the results as JSON.",
+    )
+    parser.add_argument(
+        "scenarios",
+        nargs="*",
+        help="The scenarios to run (default: all). "
+        "One of single, fanout, many_small, bulk, send_mail, cast, adapt, render.",
+    )
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument(
+        "--alloc-count",
+        type=int,
+        default=50,
+        help="Messages to send again with tracemalloc on, to measure allocation.",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.01, help="Mean server latency, seconds."
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--max-workers", type=int, default=1)
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--retry-max-attempts", type=int, default=3)
+    parser.add_argument("--output", help="Write the JSON results to this file.")
+    return parser.parse_args(argv)
+
+
+def configure(args, server):
+    settings.configure(
+        EMAIL_BACKEND="django_gov_notify.backends.NotifyEmailBackend",
+        # Notify API keys end with a service ID and secret, both UUIDs
+        GOVUK_NOTIFY_API_KEY="benchmark-%s-%s" % (uuid.uuid4(), uuid.uuid4()),
+        GOVUK_NOTIFY_PLAIN_EMAIL_TEMPLATE_ID=str(uuid.uuid4()),
+        GOVUK_NOTIFY_BASE_URL=server.url,
+        GOVUK_NOTIFY_MAX_WORKERS=args.max_workers,
+        GOVUK_NOTIFY_POOL_SIZE=args.pool_size,
+        GOVUK_NOTIFY_RATE_LIMIT=None,
+        GOVUK_NOTIFY_RETRY_MAX_ATTEMPTS=args.retry_max_attempts,
+    )
+    django.setup()
+    # Injected errors would otherwise log a warning each
+    logging.getLogger("notifications_python_client").setLevel(logging.ERROR)
+
+
+def run(name, func, args, server):
+    server.counts.update(sent=0, errors=0, rate_limited=0)
+    started = time.perf_counter()
+    latencies = func(args.count)
+    duration = time.perf_counter() - started
+    server_counts = dict(server.counts)
+
+    tracemalloc.start()
+    func(args.alloc_count)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "scenario": name,
+        "count": args.count,
+        "duration": duration,
+        "messages_per_second": args.count / duration if duration else None,
+        "latency_p50_ms": (percentile(latencies, 0.5) or 0) * 1000,
+        "latency_p99_ms": (percentile(latencies, 0.99) or 0) * 1000,
+        "peak_alloc_bytes_per_message": peak / args.alloc_count,
+        "server": server_counts,
+    }
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    with FakeNotifyServer(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+    ) as server:
+        configure(args, server)
+        from benchmarks.scenarios import SCENARIOS
+
+        names = args.scenarios or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise SystemExit("Unknown scenarios: %s" % ", ".join(sorted(unknown)))
+        report = {
+            "config": {
+                key: value
+                for key, value in vars(args).items()
+                if key not in ("scenarios", "output")
+            },
+            "results": [run(name, SCENARIOS[name], args, server) for name in names],
+        }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TEMPLATE_URL = re.compile(r"^/v2/template/(?P<template_id>[0-9a-f-]+)$")
+
+
+class FakeNotifyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Don't let Nagle's algorithm add delays between the headers and the body
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def injected_error(self):
+        """Send a 429 or 500 response if the server is configured to, and say so."""
+        server = self.server
+        if server.latency:
+            time.sleep(random.uniform(0, 2 * server.latency))
+        roll = random.random()
+        if roll < server.rate_limit_rate:
+            server.count("rate_limited")
+            self.send_json(
+                429,
+                {"errors": [{"error": "RateLimitError"}], "status_code": 429},
+                headers={"Retry-After": str(server.retry_after)},
+            )
+            return True
+        if roll < server.rate_limit_rate + server.error_rate:
+            server.count("errors")
+            self.send_json(
+                500, {"errors": [{"error": "Exception"}], "status_code": 500}
+            )
+            return True
+        return False
+
+    def do_POST(self):
+        data = self.read_json()
+        if self.injected_error():
+            return
+        if self.path not in ("/v2/notifications/email", "/v2/notifications/sms"):
+            self.send_json(404, {"errors": [{"error": "NotFound"}]})
+            return
+        self.server.count("sent")
+        self.send_json(
+            201,
+            {
+                "id": str(uuid.uuid4()),
+                "reference": data.get("reference"),
+                "template": {"id": data.get("template_id"), "version": 1},
+            },
+        )
+
+    def do_GET(self):
+        if self.injected_error():
+            return
+        match = TEMPLATE_URL.match(self.path)
+        if not match:
+            self.send_json(404, {"errors": [{"error": "NotFound"}]})
+            return
+        self.send_json(
+            200,
+            {
+                "id": match["template_id"],
+                "type": "email",
+                "version": 1,
+                "subject": "((subject))",
+                "body": "((body))",
+            },
+        )
+
+
+class FakeNotifyServer(ThreadingHTTPServer):
+    """
+    A local HTTP server that answers like the Notify API, for benchmarking.
+
+    Each request waits for a random time averaging `latency` seconds. A fraction
+    `rate_limit_rate` of requests get a 429 response, and a fraction `error_rate`
+    get a 500 response.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        latency=0.0,
+        error_rate=0.0,
+        rate_limit_rate=0.0,
+        retry_after=0,
+        address=("127.0.0.1", 0),
+    ):
+        super().__init__(address, FakeNotifyHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.counts = {"sent": 0, "errors": 0, "rate_limited": 0}
+        self._counts_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    def count(self, name):
+        with self._counts_lock:
+            self.counts[name] += 1
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
@@ -0,0 +1,153 @@
+import time
+import uuid
+
+from django.core.mail import EmailMessage, get_connection
+
+from django_gov_notify import signals
+from django_gov_notify.message import (
+    NotifyBulkMessage,
+    NotifyEmailMessage,
+    NotifyPayload,
+)
+from django_gov_notify.utils import cast_to_notify_email_message
+
+SCENARIOS = {}
+
+
+def scenario(func):
+    """
+    Register a scenario. Each takes a message count, does that much work, and returns
+    a list of per-message latencies in seconds.
+    """
+    SCENARIOS[func.__name__] = func
+    return func
+
+
+def notify_message(index, recipients=None):
+    return NotifyEmailMessage(
+        subject="Benchmark %d" % index,
+        body="Message body for benchmark message %d" % index,
+        to=recipients or ["recipient-%d@example.com" % index],
+    )
+
+
+def result_latencies(email_messages):
+    return [
+        result.latency
+        for email_message in email_messages
+        for result in email_message.notify_results
+        if result.latency is not None
+    ]
+
+
+@scenario
+def single(count):
+    """Send messages one at a time with message.send(fail_silently=True), as a view would."""
+    latencies = []
+    for index in range(count):
+        message = notify_message(index)
+        started = time.perf_counter()
+        message.send(fail_silently=True)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+@scenario
+def fanout(count):
+    """Send one message to `count` recipients."""
+    message = notify_message(
+        0, recipients=["recipient-%d@example.com" % index for index in range(count)]
+    )
+    get_connection(fail_silently=True).send_messages([message])
+    return result_latencies([message])
+
+
+@scenario
+def many_small(count):
+    """Send `count` single-recipient messages in one send_messages call."""
+    messages = [notify_message(index) for index in range(count)]
+    get_connection(fail_silently=True).send_messages(messages)
+    return result_latencies(messages)
+
+
+@scenario
+def bulk(count):
+    """Send one template to `count` recipients with NotifyBulkMessage."""
+    latencies = []
+
+    def record(sender, result, **kwargs):
+        latencies.append(result.latency)
+
+    rows = (
+        ("recipient-%d@example.com" % index, {"name": "Recipient %d" % index})
+        for index in range(count)
+    )
+    signals.notification_sent.connect(record)
+    try:
+        NotifyBulkMessage(str(uuid.uuid4()), rows).send(fail_silently=True)
+    finally:
+        signals.notification_sent.disconnect(record)
+    return latencies
+
+
+@scenario
+def send_mail(count):
+    """Send plain Django EmailMessages, as send_mass_mail does."""
+    messages = [
+        EmailMessage(
+            "Benchmark %d" % index,
+            "Message body for benchmark message %d" % index,
+            "from@example.com",
+            ["recipient-%d@example.com" % index],
+        )
+        for index in range(count)
+    ]
+    connection = get_connection(fail_silently=True)
+    connection.send_messages(messages)
+    return result_latencies(messages)
+
+
+@scenario
+def cast(count):
+    """Convert plain EmailMessages to NotifyEmailMessages, without sending."""
+    latencies = []
+    for index in range(count):
+        message = EmailMessage(
+            "Benchmark %d" % index,
+            "Message body",
+            "from@example.com",
+            ["recipient-%d@example.com" % index],
+        )
+        started = time.perf_counter()
+        cast_to_notify_email_message(message, False)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+@scenario
+def adapt(count):
+    """Adapt plain EmailMessages to NotifyPayloads, as the backend does, without sending."""
+    latencies = []
+    for index in range(count):
+        message = EmailMessage(
+            "Benchmark %d" % index,
+            "Message body",
+            "from@example.com",
+            ["recipient-%d@example.com" % index],
+        )
+        started = time.perf_counter()
+        NotifyPayload.from_email_message(message).message()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+@scenario
+def render(count):
+    """Render NotifyEmailMessage.message() payloads, without sending."""
+    latencies = []
+    for index in range(count):
+        message = notify_message(index)
+        started = time.perf_counter()
+        message.message()
+        latencies.append(time.perf_counter() - started)
+    return latencies
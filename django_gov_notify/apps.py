@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class DjangoGovNotifyConfig(AppConfig):
+    name = "django_gov_notify"
+    verbose_name = "GOV.UK Notify"
+    default_auto_field = "django.db.models.BigAutoField"
+
+    def ready(self):
+        if getattr(settings, "GOVUK_NOTIFY_METRICS", False):
+            from django_gov_notify import metrics
+
+            metrics.enable()
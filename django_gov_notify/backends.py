@@ -1,12 +1,65 @@
+import asyncio
+import json
 import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextlib import closing
+from contextvars import copy_context
+from functools import partial
+from types import SimpleNamespace
 
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.core.mail.backends.base import BaseEmailBackend
-from django.core.mail.message import sanitize_address
+from django.utils.module_loading import import_string
 
-from notifications_python_client.notifications import NotificationsAPIClient
+from asgiref.sync import sync_to_async
+from notifications_python_client import __version__ as client_version
+from notifications_python_client.authentication import create_jwt_token
+from notifications_python_client.errors import APIError, HTTP503Error, HTTPError
 
-from django_gov_notify.utils import cast_to_notify_email_message
+from django_gov_notify import signals
+from django_gov_notify.circuitbreaker import CircuitOpenError, get_circuit_breaker
+from django_gov_notify.clients import get_client
+from django_gov_notify.dedup import CacheDedupStore, with_reference
+from django_gov_notify.message import (
+    NotifyPayload,
+    NotifySMSMessage,
+    normalise_phone_number,
+    sanitize_recipient,
+    validate_uuid,
+)
+from django_gov_notify.priority import (
+    BULK,
+    PRIORITIES,
+    TRANSACTIONAL,
+    current_priority,
+    get_scheduler,
+    lane,
+    validate_priority,
+)
+from django_gov_notify.ratelimit import get_rate_limiter
+from django_gov_notify.results import (
+    DUPLICATE,
+    FAILED,
+    QUEUED,
+    SENT,
+    SKIPPED,
+    DeliveryResult,
+    all_sent,
+)
+from django_gov_notify.retry import RetryPolicy
+from django_gov_notify.routing import HASH, Route, Router, get_usage, parse_api_keys
+from django_gov_notify.templates import get_template, validate_personalisation
+
+DEFAULT_BASE_URL = "https://api.notifications.service.gov.uk"
+DEFAULT_TIMEOUT = 30
+
+
+def notification_id(response):
+    """Return the ID from a Notify API response, which is decoded JSON."""
+    return response.get("id") if isinstance(response, dict) else None
 
 
 class NotifyEmailBackend(BaseEmailBackend):
@@ -15,13 +68,235 @@ class NotifyEmailBackend(BaseEmailBackend):
     def __init__(self, *args, **kwargs):
         self._lock = threading.RLock()
         self.client = None
-        self.api_key = kwargs.get("govuk_notify_api_key", settings.GOVUK_NOTIFY_API_KEY)
+        self.rate_limiter = None
+        self.scheduler = None
+        self.router = None
+        self.usage = None
+        if "govuk_notify_api_key" in kwargs:
+            # A backend for one given key does not route between others
+            self.api_keys = None
+            self.api_key = kwargs["govuk_notify_api_key"]
+        else:
+            self.api_keys = kwargs.get(
+                "api_keys", getattr(settings, "GOVUK_NOTIFY_API_KEYS", None)
+            )
+            self.api_key = getattr(settings, "GOVUK_NOTIFY_API_KEY", None)
+            if self.api_key is None and self.api_keys:
+                self.api_key = parse_api_keys(self.api_keys)[0][1]
+        self.routing = kwargs.get(
+            "routing", getattr(settings, "GOVUK_NOTIFY_ROUTING", HASH)
+        )
+        self.template_routes = kwargs.get(
+            "template_routes", getattr(settings, "GOVUK_NOTIFY_TEMPLATE_ROUTES", None)
+        )
+        self.max_workers = kwargs.get(
+            "max_workers", getattr(settings, "GOVUK_NOTIFY_MAX_WORKERS", 1)
+        )
+        self.base_url = kwargs.get(
+            "base_url", getattr(settings, "GOVUK_NOTIFY_BASE_URL", None)
+        )
+        self.pool_size = kwargs.get(
+            "pool_size", getattr(settings, "GOVUK_NOTIFY_POOL_SIZE", 10)
+        )
+        self.rate_limit = kwargs.get(
+            "rate_limit", getattr(settings, "GOVUK_NOTIFY_RATE_LIMIT", 3000)
+        )
+        self.rate_limit_cache = kwargs.get(
+            "rate_limit_cache", getattr(settings, "GOVUK_NOTIFY_RATE_LIMIT_CACHE", None)
+        )
+        self.retry_policy = RetryPolicy(
+            max_attempts=kwargs.get(
+                "retry_max_attempts",
+                getattr(settings, "GOVUK_NOTIFY_RETRY_MAX_ATTEMPTS", 3),
+            ),
+            deadline=kwargs.get(
+                "retry_deadline", getattr(settings, "GOVUK_NOTIFY_RETRY_DEADLINE", 30)
+            ),
+        )
+        self.priority = kwargs.get(
+            "priority",
+            getattr(settings, "GOVUK_NOTIFY_DEFAULT_PRIORITY", TRANSACTIONAL),
+        )
+        validate_priority(self.priority)
+        self.priority_weights = kwargs.get(
+            "priority_weights", getattr(settings, "GOVUK_NOTIFY_PRIORITY_WEIGHTS", None)
+        )
+        self.max_in_flight = kwargs.get(
+            "max_in_flight", getattr(settings, "GOVUK_NOTIFY_MAX_IN_FLIGHT", None)
+        )
+        self.adaptive_concurrency = kwargs.get(
+            "adaptive_concurrency",
+            getattr(settings, "GOVUK_NOTIFY_ADAPTIVE_CONCURRENCY", False),
+        )
+        self.connect_timeout = kwargs.get(
+            "connect_timeout", getattr(settings, "GOVUK_NOTIFY_CONNECT_TIMEOUT", None)
+        )
+        self.read_timeout = kwargs.get(
+            "read_timeout", getattr(settings, "GOVUK_NOTIFY_READ_TIMEOUT", None)
+        )
+        self.send_deadline = kwargs.get(
+            "send_deadline", getattr(settings, "GOVUK_NOTIFY_SEND_DEADLINE", None)
+        )
+        self.batch_threshold = kwargs.get(
+            "batch_threshold", getattr(settings, "GOVUK_NOTIFY_BATCH_THRESHOLD", None)
+        )
+        self.validate_templates = kwargs.get(
+            "validate_templates",
+            getattr(settings, "GOVUK_NOTIFY_VALIDATE_TEMPLATES", False),
+        )
+        self.circuit_failure_threshold = kwargs.get(
+            "circuit_failure_threshold",
+            getattr(settings, "GOVUK_NOTIFY_CIRCUIT_FAILURE_THRESHOLD", None),
+        )
+        self.circuit_reset_timeout = kwargs.get(
+            "circuit_reset_timeout",
+            getattr(settings, "GOVUK_NOTIFY_CIRCUIT_RESET_TIMEOUT", 30),
+        )
+        self.circuit_cache = kwargs.get(
+            "circuit_cache", getattr(settings, "GOVUK_NOTIFY_CIRCUIT_CACHE", None)
+        )
+        self.circuit_fallback = kwargs.get(
+            "circuit_fallback", getattr(settings, "GOVUK_NOTIFY_CIRCUIT_FALLBACK", None)
+        )
+        self.circuit_breaker = None
+        self._fallback_backend = None
+        self.dedup_store = kwargs.get("dedup_store")
+        dedup_cache = getattr(settings, "GOVUK_NOTIFY_DEDUP_CACHE", None)
+        if self.dedup_store is None and dedup_cache:
+            self.dedup_store = CacheDedupStore(
+                dedup_cache, ttl=getattr(settings, "GOVUK_NOTIFY_DEDUP_TTL", 86400)
+            )
         super().__init__(*args, **kwargs)
 
     def open(self):
+        with self._lock:
+            self._open()
+
+    def _open(self):
         if self.client:
             return
-        self.client = NotificationsAPIClient(self.api_key)
+        self.client = self._get_client()
+        self._open_limits()
+
+    def _open_limits(self):
+        """
+        Look up the shared rate limiter, scheduler, circuit breaker and usage
+        counters for this backend's API key, and build its router.
+        """
+        self.rate_limiter = self._get_rate_limiter()
+        self.scheduler = self._get_scheduler()
+        self.circuit_breaker = self._get_circuit_breaker()
+        self.usage = get_usage(self.api_key)
+        self.router = self._get_router()
+
+    def _get_client(self, api_key=None):
+        return get_client(
+            api_key or self.api_key,
+            pool_size=self.pool_size,
+            base_url=self.base_url,
+            timeout=self._timeout(),
+        )
+
+    def _timeout(self):
+        """Return the (connect, read) timeout for requests, or None for the default."""
+        if self.connect_timeout is None and self.read_timeout is None:
+            return None
+        return (
+            DEFAULT_TIMEOUT if self.connect_timeout is None else self.connect_timeout,
+            DEFAULT_TIMEOUT if self.read_timeout is None else self.read_timeout,
+        )
+
+    def _get_deadline(self):
+        """Return the time.monotonic() time by which a send must finish, if any."""
+        if self.send_deadline is None:
+            return None
+        return time.monotonic() + self.send_deadline
+
+    def _get_circuit_breaker(self, api_key=None):
+        if not self.circuit_failure_threshold:
+            return None
+        return get_circuit_breaker(
+            api_key or self.api_key,
+            self.circuit_failure_threshold,
+            self.circuit_reset_timeout,
+            cache_alias=self.circuit_cache,
+        )
+
+    def _get_rate_limiter(self, api_key=None):
+        if not self.rate_limit:
+            return None
+        return get_rate_limiter(
+            api_key or self.api_key, self.rate_limit, cache_alias=self.rate_limit_cache
+        )
+
+    def _get_scheduler(self, api_key=None):
+        if not (self.rate_limit or self.max_in_flight or self.adaptive_concurrency):
+            return None
+        return get_scheduler(
+            api_key or self.api_key,
+            self.priority_weights,
+            max_in_flight=self.max_in_flight,
+            adaptive=self.adaptive_concurrency,
+        )
+
+    @property
+    def concurrency_limit(self):
+        """
+        The number of requests this backend's API key may have in flight at once,
+        as found by adaptive concurrency or set by `max_in_flight`, or None.
+        """
+        return self.scheduler.limit if self.scheduler else None
+
+    def _get_router(self):
+        """
+        Build a Router over the services in `api_keys`, each with its own client,
+        rate limiter, scheduler and circuit breaker, or return None if there is just
+        the one API key.
+        """
+        if not self.api_keys:
+            return None
+        routes = [
+            Route(
+                name,
+                api_key,
+                self._get_client(api_key),
+                rate_limiter=self._get_rate_limiter(api_key),
+                scheduler=self._get_scheduler(api_key),
+                circuit_breaker=self._get_circuit_breaker(api_key),
+                **options,
+            )
+            for name, api_key, options in parse_api_keys(self.api_keys)
+        ]
+        return Router(routes, self.routing, self.template_routes)
+
+    def _priority(self, email_message):
+        """Return the priority to send a message with."""
+        return getattr(email_message, "priority", None) or self.priority
+
+    def close(self):
+        """Release this backend's hold on the shared client."""
+        with self._lock:
+            self.client = None
+
+    def _connect(self):
+        """
+        Open the backend if needed, and return the client to send with.
+
+        Only opening and closing hold the backend's lock. Sends use the client
+        returned here, rather than the `client` attribute, so that many threads can
+        send through one backend at once, and a close in another thread does not
+        pull the client out from under a send already under way.
+
+        NotificationsAPIClient does not promise to be thread-safe. What the parallel
+        sends rely on is narrower: each request builds its own JWT and headers, and
+        goes through the client's one requests.Session, whose HTTPAdapter (mounted
+        by get_client with `pool_size` connections) hands each thread its own
+        connection from a thread-safe urllib3 pool. The client's own attributes are
+        only set when it is created.
+        """
+        with self._lock:
+            self.open()
+            return self.client
 
     def send_messages(self, email_messages):
         """
@@ -33,41 +308,804 @@ class NotifyEmailBackend(BaseEmailBackend):
         adheres to Django's default assumption of one email with multiple recipients
         equalling one "message" sent.
         """
-        if not email_messages:
-            return 0
+        results = self.send_messages_detailed(email_messages)
+        return sum(1 for message_results in results if all_sent(message_results))
 
-        email_messages = [
-            cast_to_notify_email_message(email_message, self.fail_silently)
-            for email_message in email_messages
-        ]
+    def send_messages_detailed(self, email_messages):
+        """
+        Send one or more EmailMessage objects and return a list with, for each
+        message, a list of DeliveryResult objects for its recipients.
+
+        Each message's results are also stored on its `notify_results` attribute.
+        When a recipient fails and `fail_silently` is True, the message's remaining
+        recipients are still sent. Messages with the same rendered content, such as
+        those made by send_mass_mail from datatuples sharing a subject and body, are
+        sent together as one group of recipients.
 
+        If `send_deadline` is set, recipients not yet sent when that many seconds
+        have passed are skipped, with "skipped" results.
+
+        Transactional messages are sent before bulk ones, and each message's requests
+        are scheduled with its priority: a message's `priority` attribute if it has
+        one, or else the backend's.
+        """
         if not email_messages:
-            return 0
+            return []
 
+        deadline = self._get_deadline()
+        timings = {}
+        adapted = self._adapt(email_messages, timings)
+        checked = time.perf_counter()
+        prepared = self._check_templates(adapted)
+        waiting = time.perf_counter()
         with self._lock:
-            self.open()
-            num_sent = 0
-            for message in email_messages:
-                sent = self._send(message)
-                if sent:
+            locked = time.perf_counter()
+            self._open()
+            client = self.client
+        connected = time.perf_counter()
+        prepared = self._coalesce(prepared)
+        prepared.sort(key=lambda p: PRIORITIES.index(self._priority(p[0])))
+        large = []
+        if self.batch_threshold:
+            large = [p for p in prepared if len(p[1]) >= self.batch_threshold]
+            prepared = [p for p in prepared if len(p[1]) < self.batch_threshold]
+        try:
+            if self.max_workers > 1:
+                self._send_concurrently(client, prepared, deadline)
+            else:
+                for email_message, recipients, message in prepared:
+                    with lane(self._priority(email_message)):
+                        self._send_rendered(
+                            client,
+                            recipients,
+                            message,
+                            email_message.notify_results,
+                            deadline,
+                        )
+            for email_message, recipients, message in large:
+                self._send_batch_job(email_message, recipients, message, deadline)
+        finally:
+            self._distribute(prepared + large)
+        finished = time.perf_counter()
+
+        results = [email_message.notify_results for email_message in email_messages]
+        signals.messages_sent.send(
+            sender=self.__class__,
+            results=results,
+            timings=dict(
+                timings,
+                validate=waiting - checked,
+                lock_wait=locked - waiting,
+                connect=connected - locked,
+                send=finished - connected,
+            ),
+        )
+        return results
+
+    def send_bulk(self, template_id, rows, email_reply_to_id=None):
+        """
+        Send one template to many recipients, and return the number sent.
+
+        `rows` is an iterable of (email address, personalisation dict) pairs, which
+        is read lazily, so memory use does not grow with the number of rows. The
+        template ID is validated once, rather than once per recipient.
+        """
+        validate_uuid(template_id, "Template ID must be a UUID string.")
+        validate_uuid(email_reply_to_id, "email_reply_to_id must be a UUID string.")
+        base_message = {"template_id": template_id}
+        if email_reply_to_id:
+            base_message["email_reply_to_id"] = email_reply_to_id
+        encoding = settings.DEFAULT_CHARSET
+
+        items = (
+            (
+                sanitize_recipient(address, encoding),
+                dict(base_message, personalisation=personalisation or {}),
+            )
+            for address, personalisation in rows
+        )
+        return self._send_items(items)
+
+    def _send_items(self, items):
+        """Send an iterable of (recipient, message) pairs, returning the number sent."""
+        if self.validate_templates:
+            items = self._validated(items)
+        num_sent = 0
+        with lane(BULK):
+            for result, message in self._send_stream(self._connect(), items):
+                if result.sent:
                     num_sent += 1
+                elif result.error and not self.fail_silently:
+                    raise result.error
         return num_sent
 
-    def _send(self, email_message):
-        """A helper method that does the actual sending."""
-        if not email_message.recipients():
-            return False
+    def _validated(self, items):
+        """
+        Filter (recipient, message) pairs, dropping those whose personalisation does
+        not fill their template, or whose template could not be fetched, or raising
+        the error unless `fail_silently`.
+        """
+        for recipient, message in items:
+            try:
+                self._validate_personalisation(message)
+            except (ValueError, APIError):
+                if not self.fail_silently:
+                    raise
+                continue
+            yield recipient, message
 
-        encoding = email_message.encoding or settings.DEFAULT_CHARSET
-        recipients = [
-            sanitize_address(addr, encoding) for addr in email_message.recipients()
-        ]
-        message = email_message.message()
-        try:
-            for recipient in recipients:
-                self.client.send_email_notification(email_address=recipient, **message)
-        except Exception:
-            if not self.fail_silently:
+    def _send_stream(self, client, items, deadline=None):
+        """
+        Send (recipient, message) pairs from an iterable, yielding (result, message)
+        pairs in the order they finish.
+
+        With more than one worker, at most twice `max_workers` requests are queued
+        or in flight at once, so the iterable is consumed only as fast as it is sent.
+        """
+        entries = ((recipient, message, None, message) for recipient, message in items)
+        return self._stream(client, entries, deadline)
+
+    def _stream(self, client, entries, deadline=None):
+        """
+        Send (recipient, message, priority, tag) entries from an iterable, yielding
+        (result, tag) pairs in the order they finish, as `_send_stream` does.
+
+        Each request is made in a copy of this context, and in the entry's priority
+        lane if it has a priority.
+        """
+        if self.max_workers <= 1:
+            for recipient, message, priority, tag in entries:
+                yield self._send_in_lane(
+                    priority, client, recipient, message, deadline
+                ), tag
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = set()
+            try:
+                for recipient, message, priority, tag in entries:
+                    future = executor.submit(
+                        copy_context().run,
+                        self._send_in_lane,
+                        priority,
+                        client,
+                        recipient,
+                        message,
+                        deadline,
+                    )
+                    future.tag = tag
+                    pending.add(future)
+                    if len(pending) >= 2 * self.max_workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result(), future.tag
+                for future in as_completed(pending):
+                    yield future.result(), future.tag
+            except GeneratorExit:
+                executor.shutdown(wait=True, cancel_futures=True)
                 raise
+
+    def _send_in_lane(self, priority, client, recipient, message, deadline=None):
+        if priority is None:
+            return self._send_one(client, recipient, message, deadline)
+        with lane(priority):
+            return self._send_one(client, recipient, message, deadline)
+
+    def _prepare(self, email_messages):
+        """
+        Validate and render the messages that have recipients, before anything is
+        sent, returning a list of (email_message, recipients, message) tuples.
+        """
+        return self._check_templates(self._adapt(email_messages))
+
+    def _adapt(self, email_messages, timings=None):
+        """
+        Adapt each message that has recipients to a NotifyPayload, returning a list
+        of (email_message, recipients, message) tuples, and start each message's
+        `notify_results`.
+
+        A message that can't be sent with Notify raises ValueError, unless
+        `fail_silently` is True, when its recipients are given failed results. If a
+        `timings` dict is given, the seconds spent converting messages to payloads
+        and rendering their message dicts are added to it as "convert" and "render".
+        """
+        adapted = []
+        converting = rendering = 0
+        for email_message in email_messages:
+            email_message.notify_results = []
+            if not email_message.recipients():
+                continue
+            started = time.perf_counter()
+            try:
+                payload = NotifyPayload.from_email_message(email_message)
+            except (TypeError, ValueError) as e:
+                self._reject(email_message, email_message.recipients(), e)
+                continue
+            finally:
+                converted = time.perf_counter()
+                converting += converted - started
+            message = payload.message()
+            rendering += time.perf_counter() - converted
+            adapted.append((email_message, payload.recipients, message))
+        if timings is not None:
+            timings.update(convert=converting, render=rendering)
+        return adapted
+
+    def _reject(self, email_message, recipients, error):
+        """
+        Raise an error that means a message can't be sent, or if `fail_silently` is
+        True, give its recipients failed results instead.
+        """
+        if not self.fail_silently:
+            raise error
+        email_message.notify_results.extend(
+            DeliveryResult(recipient, FAILED, error=error) for recipient in recipients
+        )
+
+    def _check_templates(self, adapted):
+        """
+        Check adapted messages' personalisation against their templates, if
+        `validate_templates` is set, and return those that pass. A message whose
+        template can't be fetched is rejected like one that fails the check.
+        """
+        if not self.validate_templates:
+            return adapted
+        prepared = []
+        for email_message, recipients, message in adapted:
+            try:
+                self._validate_personalisation(message)
+            except (ValueError, APIError) as e:
+                self._reject(email_message, recipients, e)
+                continue
+            prepared.append((email_message, recipients, message))
+        return prepared
+
+    def _coalesce(self, prepared):
+        """
+        Merge prepared messages that have the same rendered message into groups,
+        each standing in for its messages with all their recipients. Messages whose
+        content is not repeated are left as they are.
+
+        The priority of a group is the most urgent of its messages'.
+        """
+        keys = defaultdict(list)
+        for entry in prepared:
+            keys[json.dumps(entry[2], sort_keys=True, default=str)].append(entry)
+        if len(keys) == len(prepared):
+            return prepared
+        coalesced = []
+        for entries in keys.values():
+            if len(entries) == 1:
+                coalesced.extend(entries)
+                continue
+            group = SimpleNamespace(
+                notify_results=[],
+                members=entries,
+                priority=min(
+                    (self._priority(entry[0]) for entry in entries),
+                    key=PRIORITIES.index,
+                ),
+            )
+            recipients = [
+                recipient
+                for _, member_recipients, _ in entries
+                for recipient in member_recipients
+            ]
+            coalesced.append((group, recipients, entries[0][2]))
+        return coalesced
+
+    def _distribute(self, coalesced):
+        """Hand the results of each group made by `_coalesce` back to its messages."""
+        for group, recipients, message in coalesced:
+            if not isinstance(group, SimpleNamespace):
+                continue
+            by_recipient = defaultdict(deque)
+            for email_message, member_recipients, _ in group.members:
+                if hasattr(group, "notify_job"):
+                    email_message.notify_job = group.notify_job
+                for recipient in member_recipients:
+                    by_recipient[recipient].append(email_message)
+            for result in group.notify_results:
+                by_recipient[result.recipient].popleft().notify_results.append(result)
+
+    def _validate_personalisation(self, message):
+        """
+        Check a rendered message has personalisation for each of its template's
+        placeholders, fetching the template through the template cache.
+        """
+        template = get_template(self._connect(), message["template_id"])
+        validate_personalisation(template, message["personalisation"])
+
+    def _send_batch_job(self, email_message, recipients, message, deadline=None):
+        """
+        Send a message with very many recipients as a BatchJob, which streams them
+        through a bounded number of requests, and keep the job on the message's
+        `notify_job` attribute to show its progress.
+        """
+        from django_gov_notify.jobs import BatchJob
+
+        email_message.notify_job = BatchJob(
+            message["template_id"],
+            ((recipient, message["personalisation"]) for recipient in recipients),
+            email_reply_to_id=message.get("email_reply_to_id"),
+            reference=message.get("reference"),
+            connection=self,
+            priority=self._priority(email_message),
+            spool=False,
+        )
+        email_message.notify_job.total = len(recipients)
+        email_message.notify_job.run(
+            on_result=email_message.notify_results.append,
+            timeout=None if deadline is None else deadline - time.monotonic(),
+        )
+
+    def _send_rendered(self, client, recipients, message, results=None, deadline=None):
+        """
+        Send a rendered message dict to each of a list of sanitized recipients, and
+        return their results. Results are appended to `results` as they arrive, so
+        that they are kept if an error is raised.
+        """
+        results = [] if results is None else results
+        for recipient in recipients:
+            result = self._send_one(client, recipient, message, deadline)
+            results.append(result)
+            if result.error and not self.fail_silently:
+                raise result.error
+        return results
+
+    def _send_one(self, client, recipient, message, deadline=None):
+        """
+        Send to a single recipient, retrying transient failures.
+
+        If there is a dedup store, the message is given a reference (unless it
+        already has one) and is skipped if the store shows it was sent before. If
+        the `deadline` (a time.monotonic() time) has passed, the recipient is
+        skipped, and no retry waits past it.
+        """
+        started = time.perf_counter()
+        if deadline is not None and time.monotonic() >= deadline:
+            result = DeliveryResult(recipient, SKIPPED)
+            self._sent(result, message)
+            return result
+        if self.dedup_store:
+            message = with_reference(recipient, message)
+            sent_id = self.dedup_store.get(recipient, message["reference"])
+            if sent_id is not None:
+                result = DeliveryResult(
+                    recipient, DUPLICATE, notification_id=sent_id or None
+                )
+                self._sent(result, message)
+                return result
+        try:
+            response = self.retry_policy.call(
+                self._request,
+                client,
+                recipient,
+                message,
+                on_retry=partial(self._retrying, recipient, message),
+                give_up_at=deadline,
+            )
+        except CircuitOpenError as e:
+            result = self._fall_back(recipient, message, e)
+            self._sent(result, message)
+            return result
+        except Exception as e:
+            result = DeliveryResult(
+                recipient, FAILED, latency=time.perf_counter() - started, error=e
+            )
+            self._sent(result, message)
+            return result
+        result = DeliveryResult(
+            recipient,
+            SENT,
+            notification_id=notification_id(response),
+            latency=time.perf_counter() - started,
+        )
+        if self.dedup_store:
+            self.dedup_store.set(
+                recipient, message["reference"], result.notification_id
+            )
+        self._sent(result, message)
+        return result
+
+    def _fall_back(self, recipient, message, error):
+        """
+        Hand a message the circuit breaker stopped to the fallback backend, if there
+        is one, returning a queued result, or else a failed one.
+        """
+        if not self.circuit_fallback:
+            return DeliveryResult(recipient, FAILED, error=error)
+        with self._lock:
+            if self._fallback_backend is None:
+                self._fallback_backend = import_string(self.circuit_fallback)(
+                    fail_silently=self.fail_silently
+                )
+        self._fallback_backend.enqueue([recipient], message, current_priority())
+        return DeliveryResult(recipient, QUEUED)
+
+    def _request(self, client, recipient, message):
+        """
+        Make the API request for a single recipient, through the route chosen for it
+        if there are several API keys.
+        """
+        route = self.router.route(recipient, message) if self.router else None
+        circuit_breaker = route.circuit_breaker if route else self.circuit_breaker
+        if route:
+            client = route.client
+            message = route.translate(message)
+        if circuit_breaker:
+            return circuit_breaker.call(
+                self._send_request, client, recipient, message, route
+            )
+        return self._send_request(client, recipient, message, route)
+
+    def _send_request(self, client, recipient, message, route=None):
+        scheduler = route.scheduler if route else self.scheduler
+        rate_limiter = route.rate_limiter if route else self.rate_limiter
+        if scheduler:
+            waited = scheduler.acquire(current_priority(), rate_limiter)
+        error = None
+        started = time.perf_counter()
+        try:
+            if scheduler and waited:
+                self._rate_limited(recipient, message, waited)
+            signals.notification_sending.send(
+                sender=self.__class__, recipient=recipient, message=message
+            )
+            with (route.usage if route else self.usage).track():
+                return self._deliver(client, recipient, message)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if scheduler:
+                scheduler.release(time.perf_counter() - started, error)
+
+    def _deliver(self, client, recipient, message):
+        """Call the API client to send one notification."""
+        return client.send_email_notification(email_address=recipient, **message)
+
+    def _sent(self, result, message):
+        signals.notification_sent.send(
+            sender=self.__class__, result=result, message=message
+        )
+
+    def _retrying(self, recipient, message, error, attempt, delay):
+        signals.notification_retrying.send(
+            sender=self.__class__,
+            recipient=recipient,
+            message=message,
+            error=error,
+            attempt=attempt,
+            delay=delay,
+        )
+
+    def _rate_limited(self, recipient, message, waited):
+        signals.notification_rate_limited.send(
+            sender=self.__class__, recipient=recipient, message=message, waited=waited
+        )
+
+    def _send_concurrently(self, client, prepared, deadline=None):
+        """
+        Fan the recipients of the prepared messages out across a pool of
+        `max_workers` threads, storing their results on the messages in the order
+        of their recipients.
+
+        Recipients are fed through the bounded window of `_send_stream`, so however
+        many there are, only a few requests per worker are queued at once. If
+        `fail_silently` is False the first error is raised once the requests
+        already in flight have finished.
+        """
+        slots = [[None] * len(recipients) for _, recipients, _ in prepared]
+        entries = (
+            (recipient, message, self._priority(email_message), (number, index))
+            for number, (email_message, recipients, message) in enumerate(prepared)
+            for index, recipient in enumerate(recipients)
+        )
+        try:
+            with closing(self._stream(client, entries, deadline)) as stream:
+                for result, (number, index) in stream:
+                    slots[number][index] = result
+                    if result.error and not self.fail_silently:
+                        raise result.error
+        finally:
+            for (email_message, _, _), results in zip(prepared, slots):
+                email_message.notify_results.extend(
+                    result for result in results if result is not None
+                )
+
+
+class NotifySMSBackend(NotifyEmailBackend):
+    """
+    A backend that sends NotifySMSMessages as text messages.
+
+    It shares NotifyEmailBackend's send path: the pooled client, concurrency, rate
+    limiting, retries, circuit breaker, dedup store and delivery results all work
+    the same way. Each recipient's phone number is normalised and validated once,
+    before anything is sent.
+
+    Messages are never sent as batch jobs, or handed to a circuit breaker fallback,
+    because those only hold emails.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.sms_sender_id = kwargs.get(
+            "sms_sender_id", getattr(settings, "GOVUK_NOTIFY_SMS_SENDER_ID", None)
+        )
+        super().__init__(*args, **kwargs)
+        self.batch_threshold = None
+        self.circuit_fallback = None
+
+    def send_bulk(self, template_id, rows, sms_sender_id=None):
+        """
+        Send one template to many phone numbers, and return the number sent.
+
+        `rows` is an iterable of (phone number, personalisation dict) pairs, which is
+        read lazily, as for NotifyEmailBackend.send_bulk. Invalid numbers raise
+        ValueError, or are skipped if `fail_silently` is True.
+        """
+        validate_uuid(template_id, "Template ID must be a UUID string.")
+        sms_sender_id = sms_sender_id or self.sms_sender_id
+        validate_uuid(sms_sender_id, "sms_sender_id must be a UUID string.")
+        base_message = {"template_id": template_id}
+        if sms_sender_id:
+            base_message["sms_sender_id"] = sms_sender_id
+        return self._send_items(self._bulk_items(base_message, rows))
+
+    def _bulk_items(self, base_message, rows):
+        for number, personalisation in rows:
+            try:
+                number = normalise_phone_number(number)
+            except (TypeError, ValueError):
+                if not self.fail_silently:
+                    raise
+                continue
+            yield number, dict(base_message, personalisation=personalisation or {})
+
+    def _adapt(self, sms_messages, timings=None):
+        adapted = []
+        converting = rendering = 0
+        for sms_message in sms_messages:
+            sms_message.notify_results = []
+            if not sms_message.recipients():
+                continue
+            started = time.perf_counter()
+            try:
+                if not isinstance(sms_message, NotifySMSMessage):
+                    raise TypeError(
+                        "%s can only send NotifySMSMessages." % self.__class__.__name__
+                    )
+                recipients = [
+                    normalise_phone_number(number)
+                    for number in sms_message.recipients()
+                ]
+            except (TypeError, ValueError) as e:
+                self._reject(sms_message, sms_message.recipients(), e)
+                continue
+            finally:
+                converted = time.perf_counter()
+                converting += converted - started
+            message = sms_message.message()
+            if self.sms_sender_id and "sms_sender_id" not in message:
+                message["sms_sender_id"] = self.sms_sender_id
+            rendering += time.perf_counter() - converted
+            adapted.append((sms_message, recipients, message))
+        if timings is not None:
+            timings.update(convert=converting, render=rendering)
+        return adapted
+
+    def _deliver(self, client, recipient, message):
+        return client.send_sms_notification(phone_number=recipient, **message)
+
+
+class AsyncNotifyEmailBackend(NotifyEmailBackend):
+    """
+    A NotifyEmailBackend that can also send messages from async code.
+
+    `asend_messages` posts to the Notify REST API with an httpx AsyncClient instead
+    of the blocking NotificationsAPIClient, signing each request with the same JWT
+    scheme. All the recipients of all the messages are sent at once, with at most
+    `max_concurrency` requests in flight. The synchronous `send_messages` method is
+    inherited unchanged, so this class also works as an EMAIL_BACKEND.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.async_client = None
+        self.max_concurrency = kwargs.get(
+            "max_concurrency", getattr(settings, "GOVUK_NOTIFY_MAX_CONCURRENCY", 50)
+        )
+        super().__init__(*args, **kwargs)
+
+    async def __aenter__(self):
+        await self.aopen()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def aopen(self):
+        """
+        Create the async HTTP client, returning True if a new one was created.
+
+        The rate limiter, scheduler, circuit breaker and router are set up the first
+        time the backend is opened, rather than on every send.
+        """
+        if self.usage is None:
+            self._open_limits()
+        if self.async_client:
             return False
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImproperlyConfigured(
+                "AsyncNotifyEmailBackend requires httpx; "
+                "install django-gov-notify[async]."
+            ) from e
+        connect_timeout, read_timeout = self._timeout() or (DEFAULT_TIMEOUT,) * 2
+        self.async_client = httpx.AsyncClient(
+            base_url=self.base_url or DEFAULT_BASE_URL,
+            limits=httpx.Limits(max_connections=self.max_concurrency),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
         return True
+
+    async def aclose(self):
+        if self.async_client is None:
+            return
+        try:
+            await self.async_client.aclose()
+        finally:
+            self.async_client = None
+
+    async def asend_messages(self, email_messages):
+        """
+        Send one or more EmailMessage objects and return the number of email messages
+        sent, following the same counting rules as `send_messages`.
+        """
+        results = await self.asend_messages_detailed(email_messages)
+        return sum(1 for message_results in results if all_sent(message_results))
+
+    async def asend_messages_detailed(self, email_messages):
+        """The async equivalent of `send_messages_detailed`."""
+        if not email_messages:
+            return []
+
+        deadline = self._get_deadline()
+        prepared = self._adapt(email_messages)
+        if self.validate_templates:
+            # Templates not yet cached are fetched with the blocking client, so
+            # check them off the event loop
+            prepared = await sync_to_async(self._check_templates)(prepared)
+        new_conn_created = await self.aopen()
+        try:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            await asyncio.gather(
+                *(
+                    self._asend(email_message, recipients, message, semaphore, deadline)
+                    for email_message, recipients, message in prepared
+                )
+            )
+        finally:
+            if new_conn_created:
+                await self.aclose()
+        for email_message in email_messages:
+            for result in email_message.notify_results:
+                if result.error and not self.fail_silently:
+                    raise result.error
+        return [email_message.notify_results for email_message in email_messages]
+
+    async def _asend(self, email_message, recipients, message, semaphore, deadline):
+        # The tasks gathered copy this context, and so the message's priority
+        with lane(self._priority(email_message)):
+            email_message.notify_results = await asyncio.gather(
+                *(
+                    self._asend_one(recipient, message, semaphore, deadline)
+                    for recipient in recipients
+                )
+            )
+
+    async def _asend_one(self, recipient, message, semaphore, deadline=None):
+        started = time.perf_counter()
+        if self.dedup_store:
+            message = with_reference(recipient, message)
+            sent_id = await self.dedup_store.aget(recipient, message["reference"])
+            if sent_id is not None:
+                result = DeliveryResult(
+                    recipient, DUPLICATE, notification_id=sent_id or None
+                )
+                self._sent(result, message)
+                return result
+        async with semaphore:
+            if deadline is not None and time.monotonic() >= deadline:
+                result = DeliveryResult(recipient, SKIPPED)
+                self._sent(result, message)
+                return result
+            try:
+                response = await self.retry_policy.acall(
+                    self._arequest,
+                    recipient,
+                    message,
+                    on_retry=partial(self._retrying, recipient, message),
+                    give_up_at=deadline,
+                )
+            except CircuitOpenError as e:
+                result = await sync_to_async(self._fall_back)(recipient, message, e)
+                self._sent(result, message)
+                return result
+            except Exception as e:
+                result = DeliveryResult(
+                    recipient, FAILED, latency=time.perf_counter() - started, error=e
+                )
+                self._sent(result, message)
+                return result
+        result = DeliveryResult(
+            recipient,
+            SENT,
+            notification_id=notification_id(response),
+            latency=time.perf_counter() - started,
+        )
+        if self.dedup_store:
+            await self.dedup_store.aset(
+                recipient, message["reference"], result.notification_id
+            )
+        self._sent(result, message)
+        return result
+
+    async def _arequest(self, recipient, message):
+        route = await self.router.aroute(recipient, message) if self.router else None
+        circuit_breaker = route.circuit_breaker if route else self.circuit_breaker
+        if route:
+            message = route.translate(message)
+        if circuit_breaker:
+            return await circuit_breaker.acall(
+                self._asend_request, recipient, message, route
+            )
+        return await self._asend_request(recipient, message, route)
+
+    async def _asend_request(self, recipient, message, route=None):
+        scheduler = route.scheduler if route else self.scheduler
+        rate_limiter = route.rate_limiter if route else self.rate_limiter
+        if scheduler:
+            waited = await scheduler.aacquire(current_priority(), rate_limiter)
+        error = None
+        started = time.perf_counter()
+        try:
+            if scheduler and waited:
+                self._rate_limited(recipient, message, waited)
+            signals.notification_sending.send(
+                sender=self.__class__, recipient=recipient, message=message
+            )
+            with (route.usage if route else self.usage).track():
+                return await self._apost(
+                    "/v2/notifications/email",
+                    dict(message, email_address=recipient),
+                    api_key=route.api_key if route else None,
+                )
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if scheduler:
+                scheduler.release(time.perf_counter() - started, error)
+
+    async def _apost(self, url, data, api_key=None):
+        """POST to the Notify API, raising the same errors as NotificationsAPIClient."""
+        import httpx
+
+        api_key = api_key or self.api_key
+        service_id = api_key[-73:-37]
+        secret = api_key[-36:]
+        headers = {
+            "Content-type": "application/json",
+            "Authorization": "Bearer %s" % create_jwt_token(secret, service_id),
+            "User-agent": "NOTIFY-API-PYTHON-CLIENT/%s" % client_version,
+        }
+        try:
+            response = await self.async_client.post(url, json=data, headers=headers)
+        except httpx.TransportError as e:
+            raise HTTP503Error(message=str(e)) from e
+        if response.status_code == 503:
+            raise HTTP503Error(response)
+        if response.is_error:
+            raise HTTPError(response)
+        return response.json()
@@ -0,0 +1,299 @@
+import threading
+import time
+
+from django.core.cache import caches
+
+from django_gov_notify import signals
+from django_gov_notify.clients import api_key_id
+from django_gov_notify.retry import is_overload
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+_lock = threading.Lock()
+_breakers = {}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a request while the circuit breaker is open."""
+
+
+def is_outage(error):
+    """
+    Return whether an error suggests Notify is down, rather than a bad request: an
+    overload other than a rate limit, which only means to slow down.
+    """
+    return is_overload(error) and error.status_code != 429
+
+
+class CircuitBreaker:
+    """
+    Stop making requests to Notify for a while after it has failed repeatedly.
+
+    The breaker starts closed. After `failure_threshold` server errors in a row it
+    opens, and requests fail straight away with CircuitOpenError instead of each
+    waiting for a timeout. After `reset_timeout` seconds it is half-open, and lets
+    one trial request through: if that succeeds the breaker closes, and if it fails
+    the breaker opens again.
+
+    If `cache_alias` is given the failure count and open state are shared through
+    that Django cache, so that one process seeing an outage opens the breaker for
+    every process. Half-open trials are still made once per process.
+    """
+
+    def __init__(
+        self,
+        key,
+        failure_threshold=5,
+        reset_timeout=30,
+        cache_alias=None,
+        clock=time.monotonic,
+    ):
+        self.key = "govuk-notify-circuit:%s" % key
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.cache = caches[cache_alias] if cache_alias else None
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._changes = []
+        self._change_count = 0
+
+    @property
+    def state(self):
+        return self._state_from(self._read_shared())
+
+    async def astate(self):
+        """The breaker's state, read without blocking the event loop."""
+        return self._state_from(await self._aread_shared())
+
+    def _state_from(self, shared):
+        with self._lock:
+            state = self._current_state(shared)
+        self._send_changes()
+        return state
+
+    def _read_shared(self):
+        """
+        Return whether the cache says the breaker is open, with the number of state
+        changes before it was read, or None without a cache.
+
+        The cache is read before taking the lock, so that threads do not queue
+        behind a cache round trip; the count shows whether the result is stale once
+        the lock is held.
+        """
+        if self.cache is None:
+            return None
+        change_count = self._change_count
+        return change_count, bool(self.cache.get(self.key + ":open"))
+
+    async def _aread_shared(self):
+        if self.cache is None:
+            return None
+        change_count = self._change_count
+        return change_count, bool(await self.cache.aget(self.key + ":open"))
+
+    def _current_state(self, shared):
+        if shared is not None:
+            change_count, is_open = shared
+            if change_count != self._change_count:
+                # Changed while the cache was being read
+                return self._state
+            if self._state == OPEN and not is_open:
+                self._change(HALF_OPEN)
+            elif self._state != OPEN and is_open:
+                # Opened by another process
+                self._opened_at = self.clock()
+                self._trial = False
+                self._change(OPEN)
+        elif (
+            self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout
+        ):
+            self._change(HALF_OPEN)
+        return self._state
+
+    def allow(self):
+        """Return whether a request may be made now."""
+        return self._allow(self._read_shared())
+
+    async def aallow(self):
+        """Like `allow`, but reads the cache without blocking the event loop."""
+        return self._allow(await self._aread_shared())
+
+    def _allow(self, shared):
+        with self._lock:
+            state = self._current_state(shared)
+            if state == CLOSED:
+                allowed = True
+            elif state == HALF_OPEN and not self._trial:
+                self._trial = True
+                allowed = True
+            else:
+                allowed = False
+        self._send_changes()
+        return allowed
+
+    def record_success(self):
+        if self.cache is not None:
+            self.cache.delete(self.key + ":failures")
+        self._succeeded()
+
+    async def arecord_success(self):
+        if self.cache is not None:
+            await self.cache.adelete(self.key + ":failures")
+        self._succeeded()
+
+    def _succeeded(self):
+        with self._lock:
+            self._trial = False
+            self._failures = 0
+            if self._state != CLOSED:
+                self._change(CLOSED)
+        self._send_changes()
+
+    def record_failure(self):
+        opening = False
+        if self.cache is not None:
+            half_open = self._state == HALF_OPEN
+            self.cache.add(self.key + ":failures", 0, self.reset_timeout)
+            try:
+                failures = self.cache.incr(self.key + ":failures")
+            except ValueError:
+                failures = 1
+            opening = half_open or failures >= self.failure_threshold
+            if opening:
+                # Open the shared breaker before this one, so that no thread sees
+                # this one open but the cache not
+                self.cache.set(self.key + ":open", True, self.reset_timeout)
+                self.cache.delete(self.key + ":failures")
+        self._failed(opening)
+
+    async def arecord_failure(self):
+        opening = False
+        if self.cache is not None:
+            half_open = self._state == HALF_OPEN
+            await self.cache.aadd(self.key + ":failures", 0, self.reset_timeout)
+            try:
+                failures = await self.cache.aincr(self.key + ":failures")
+            except ValueError:
+                failures = 1
+            opening = half_open or failures >= self.failure_threshold
+            if opening:
+                await self.cache.aset(self.key + ":open", True, self.reset_timeout)
+                await self.cache.adelete(self.key + ":failures")
+        self._failed(opening)
+
+    def _failed(self, opening):
+        """
+        Count a failure, opening the breaker if `opening`, which the shared count
+        decides, or else if this process's count reaches the threshold.
+        """
+        with self._lock:
+            self._trial = False
+            if self.cache is None:
+                self._failures += 1
+                opening = (
+                    self._state == HALF_OPEN or self._failures >= self.failure_threshold
+                )
+            if opening:
+                self._open()
+        self._send_changes()
+
+    def _open(self):
+        self._opened_at = self.clock()
+        self._failures = 0
+        if self._state != OPEN:
+            self._change(OPEN)
+
+    def _change(self, state):
+        # Called with the lock held; the signal is sent by _send_changes once it is
+        # released, so that receivers can read the breaker's state
+        self._changes.append((self._state, state))
+        self._state = state
+        self._change_count += 1
+
+    def _send_changes(self):
+        with self._lock:
+            changes, self._changes = self._changes, []
+        for old_state, new_state in changes:
+            signals.circuit_state_changed.send(
+                sender=self.__class__,
+                breaker=self,
+                old_state=old_state,
+                new_state=new_state,
+            )
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call a function that makes a request, raising CircuitOpenError instead if
+        the breaker is open, and recording whether the request failed.
+        """
+        if not self.allow():
+            raise CircuitOpenError("Notify is unavailable; not sending for now.")
+        try:
+            response = func(*args, **kwargs)
+        except Exception as e:
+            self._record(e)
+            raise
+        except BaseException:
+            # Cancelled, so the request says nothing about Notify
+            self._abandon()
+            raise
+        self.record_success()
+        return response
+
+    async def acall(self, func, *args, **kwargs):
+        """
+        The async equivalent of `call`, for a coroutine function. A shared cache is
+        read and written with its async methods, so as not to block the event loop.
+        """
+        if not await self.aallow():
+            raise CircuitOpenError("Notify is unavailable; not sending for now.")
+        try:
+            response = await func(*args, **kwargs)
+        except Exception as e:
+            if is_outage(e):
+                await self.arecord_failure()
+            else:
+                await self.arecord_success()
+            raise
+        except BaseException:
+            # Cancelled, so the request says nothing about Notify
+            self._abandon()
+            raise
+        await self.arecord_success()
+        return response
+
+    def _abandon(self):
+        """Let another trial through, after one that ended without a result."""
+        with self._lock:
+            self._trial = False
+
+    def _record(self, error):
+        if is_outage(error):
+            self.record_failure()
+        else:
+            # Notify answered, so it is up; the request itself was bad
+            self.record_success()
+
+
+def get_circuit_breaker(
+    api_key, failure_threshold=5, reset_timeout=30, cache_alias=None
+):
+    """
+    Return the process-wide circuit breaker for an API key, creating it on first use.
+
+    If `cache_alias` is given the breaker's state is shared through that Django
+    cache; otherwise it applies to this process only.
+    """
+    key = api_key_id(api_key)
+    options = (key, failure_threshold, reset_timeout, cache_alias)
+    with _lock:
+        breaker = _breakers.get(options)
+        if breaker is None:
+            breaker = _breakers[options] = CircuitBreaker(*options)
+        return breaker
@@ -0,0 +1,54 @@
+import hashlib
+import threading
+
+from notifications_python_client.notifications import NotificationsAPIClient
+from requests.adapters import HTTPAdapter
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def api_key_id(api_key):
+    """
+    Return a short ID for an API key, to use in cache keys and names in its place,
+    as the secret key itself must never be stored or shown.
+    """
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+def get_client(api_key, pool_size=10, base_url=None, timeout=None):
+    """
+    Return the process-wide NotificationsAPIClient for an API key, creating it on
+    first use.
+
+    The client's requests session keeps up to `pool_size` keep-alive connections
+    open, so successive sends (from any backend instance, on any thread) reuse an
+    existing TCP and TLS connection instead of making a new one. The pool size is
+    fixed by whichever caller creates the client.
+
+    `base_url` overrides the Notify API's address, for example to use a stand-in
+    service in tests. `timeout` is passed to requests, and may be a
+    (connect, read) tuple; by default the client waits up to 30 seconds.
+    """
+    key = (api_key, base_url, timeout)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            kwargs = {"base_url": base_url} if base_url else {}
+            if timeout is not None:
+                kwargs["timeout"] = timeout
+            client = NotificationsAPIClient(api_key, **kwargs)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            client.request_session.mount("https://", adapter)
+            client.request_session.mount("http://", adapter)
+            _clients[key] = client
+        return client
+
+
+def close_clients():
+    """Close the connections of every shared client, and forget them."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.request_session.close()
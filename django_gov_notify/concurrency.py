@@ -0,0 +1,97 @@
+import threading
+import time
+
+from django_gov_notify import signals
+from django_gov_notify.retry import is_overload
+
+
+class AdaptiveLimiter:
+    """
+    Find how many requests to have in flight to Notify at once, by additive
+    increase and multiplicative decrease (AIMD), from how requests are answered.
+
+    While the limit is in use, each success raises it by 1/limit, or by about one
+    for every limit's worth of requests. A success that takes more than `tolerance`
+    times the baseline round-trip time means requests are queueing at Notify, so
+    the limit is multiplied by `backoff`; a 429 or 5xx error or a failed connection
+    multiplies it by `overload_backoff`. Requests that started before the last
+    decrease cannot lower the limit again, so a burst of slow responses counts
+    once. Other errors, such as a bad request, say nothing about load and are
+    ignored.
+
+    The baseline is the quickest round trip seen, drifting by `baseline_drift` of
+    the difference towards each slower one, so that a lasting change in Notify's
+    speed is followed. The limit stays between `min_limit` and `max_limit`.
+    """
+
+    def __init__(
+        self,
+        key="",
+        initial_limit=10,
+        min_limit=1,
+        max_limit=100,
+        tolerance=2.0,
+        backoff=0.9,
+        overload_backoff=0.5,
+        baseline_drift=0.01,
+        clock=time.monotonic,
+    ):
+        self.key = key
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.overload_backoff = overload_backoff
+        self.baseline_drift = baseline_drift
+        self.clock = clock
+        self.baseline = None
+        self._limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self._decreased_at = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<AdaptiveLimiter %s: limit %d>" % (self.key, self.limit)
+
+    @property
+    def limit(self):
+        """The number of requests that may be in flight at once."""
+        return int(self._limit)
+
+    def record(self, latency, error=None, in_flight=None):
+        """
+        Adjust the limit for a request that took `latency` seconds, failing with
+        `error` if it raised. `in_flight` is the number of requests that were under
+        way, including this one; the limit is only raised while it is nearly used.
+        """
+        with self._lock:
+            old_limit = self.limit
+            if error is not None:
+                if is_overload(error):
+                    self._decrease(self.overload_backoff, latency)
+            else:
+                self._observe(latency, in_flight)
+            new_limit = self.limit
+        if new_limit != old_limit:
+            signals.concurrency_limit_changed.send(
+                sender=self.__class__,
+                limiter=self,
+                old_limit=old_limit,
+                new_limit=new_limit,
+            )
+
+    def _observe(self, latency, in_flight):
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            self.baseline += (latency - self.baseline) * self.baseline_drift
+        if latency > self.baseline * self.tolerance:
+            self._decrease(self.backoff, latency)
+        elif in_flight is None or in_flight >= self._limit / 2:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+    def _decrease(self, factor, latency):
+        now = self.clock()
+        if self._decreased_at is not None and now - latency < self._decreased_at:
+            return
+        self._decreased_at = now
+        self._limit = max(self.min_limit, self._limit * factor)
@@ -0,0 +1,53 @@
+import hashlib
+import json
+
+from django.core.cache import caches
+
+
+def make_reference(recipient, message):
+    """
+    Return a reference that is always the same for sending the same rendered
+    message to the same recipient.
+    """
+    data = json.dumps([recipient, message], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def with_reference(recipient, message):
+    """Return the message dict, adding a generated reference if it has none."""
+    if message.get("reference"):
+        return message
+    return dict(message, reference=make_reference(recipient, message))
+
+
+class CacheDedupStore:
+    """
+    Remember which recipients have been sent which message, in a Django cache.
+
+    Entries are keyed by the recipient and the message's reference, and hold the
+    Notify notification ID. Any object with the same `get` and `set` methods (and
+    `aget` and `aset`, for the async backend) can be used instead.
+    """
+
+    def __init__(self, cache_alias="default", ttl=86400):
+        self.cache = caches[cache_alias]
+        self.ttl = ttl
+
+    def key(self, recipient, reference):
+        digest = hashlib.sha256(("%s\n%s" % (recipient, reference)).encode())
+        return "govuk-notify-sent:%s" % digest.hexdigest()
+
+    def get(self, recipient, reference):
+        """Return the notification ID if this has been sent already, or None."""
+        return self.cache.get(self.key(recipient, reference))
+
+    def set(self, recipient, reference, notification_id):
+        self.cache.set(self.key(recipient, reference), notification_id or "", self.ttl)
+
+    async def aget(self, recipient, reference):
+        return await self.cache.aget(self.key(recipient, reference))
+
+    async def aset(self, recipient, reference, notification_id):
+        await self.cache.aset(
+            self.key(recipient, reference), notification_id or "", self.ttl
+        )
@@ -0,0 +1,226 @@
+import csv
+import json
+import tempfile
+import time
+from itertools import islice
+
+from django.conf import settings
+
+from django_gov_notify.message import sanitize_recipient, validate_uuid
+from django_gov_notify.priority import BULK, lane, validate_priority
+
+EMAIL_ADDRESS_COLUMN = "email address"
+
+PENDING = "pending"
+SPOOLING = "spooling"
+SENDING = "sending"
+FINISHED = "finished"
+FAILED = "failed"
+
+
+def write_csv(rows, fileobj, columns=None, header=True, chunk_size=1000):
+    """
+    Write (email address, personalisation) rows to a file in the CSV format of
+    Notify's 'Upload a list of recipients' page, and return the number written.
+
+    The first column is "email address", followed by a column per placeholder,
+    taken from `columns` or else from the first row's personalisation. Rows are
+    written `chunk_size` at a time, so the rows iterable is never held in memory.
+    Personalisation values are written as text. Pass `header=False` to append to a
+    file that already has a header row.
+    """
+    rows = iter(rows)
+    count = 0
+    writer = None
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        if writer is None:
+            if columns is None:
+                columns = list(chunk[0][1] or {})
+            writer = csv.DictWriter(fileobj, [EMAIL_ADDRESS_COLUMN] + list(columns))
+            if header:
+                writer.writeheader()
+        writer.writerows(
+            dict(personalisation or {}, **{EMAIL_ADDRESS_COLUMN: address})
+            for address, personalisation in chunk
+        )
+        count += len(chunk)
+    return count
+
+
+def read_csv(fileobj):
+    """Yield (email address, personalisation) rows from a file written by write_csv."""
+    for row in csv.DictReader(fileobj):
+        address = row.pop(EMAIL_ADDRESS_COLUMN)
+        yield address, row
+
+
+def write_rows(rows, fileobj):
+    """
+    Write (email address, personalisation) rows to a file as JSON lines, and return
+    the number written.
+
+    Unlike write_csv, this keeps each row's own placeholders and the types of its
+    values, such as lists for bullet points, so the rows read back by read_rows are
+    the rows written.
+    """
+    count = 0
+    for address, personalisation in rows:
+        fileobj.write(json.dumps([address, personalisation or {}]) + "\n")
+        count += 1
+    return count
+
+
+def read_rows(fileobj):
+    """Yield (email address, personalisation) rows from a file written by write_rows."""
+    for line in fileobj:
+        address, personalisation = json.loads(line)
+        yield address, personalisation
+
+
+class BatchJob:
+    """
+    Send one template to a very large stream of recipients, tracking progress.
+
+    GOV.UK Notify only accepts uploaded recipient files through its web interface,
+    not through the API, so a job is sent by this process one request per
+    recipient. By default the rows are first spooled to a temporary file of JSON
+    lines, so that `total` is known before sending starts and the source, such as a
+    database cursor, is not held open while sending. Either way the rows are never
+    all held in memory, and only as many requests as the backend's `max_workers`
+    allows are in flight.
+
+    Recipients that fail are written to `failures`, a file in the same format, so
+    they can be sent again with `BatchJob(template_id, read_rows(job.failures))`.
+
+    Jobs are sent with bulk priority unless given another `priority`, so that
+    transactional messages are not held up behind them.
+    """
+
+    def __init__(
+        self,
+        template_id,
+        rows,
+        email_reply_to_id=None,
+        reference=None,
+        connection=None,
+        spool=True,
+        chunk_size=1000,
+        priority=BULK,
+    ):
+        validate_uuid(template_id, "Template ID must be a UUID string.")
+        validate_uuid(email_reply_to_id, "email_reply_to_id must be a UUID string.")
+        self.template_id = template_id
+        self.rows = rows
+        self.email_reply_to_id = email_reply_to_id
+        self.reference = reference
+        self.connection = connection
+        self.spool = spool
+        self.chunk_size = chunk_size
+        validate_priority(priority)
+        self.priority = priority
+
+        self.status = PENDING
+        self.total = None
+        self.processed = 0
+        self.sent = 0
+        self.failed = 0
+        self.failures = None
+
+    def __repr__(self):
+        return "<BatchJob %s: %s, %d/%s processed>" % (
+            self.template_id,
+            self.status,
+            self.processed,
+            "?" if self.total is None else self.total,
+        )
+
+    @property
+    def progress(self):
+        """The fraction of rows processed, or None if the total is not known."""
+        if not self.total:
+            return None
+        return self.processed / self.total
+
+    def get_connection(self):
+        from django_gov_notify.backends import NotifyEmailBackend
+
+        return self.connection or NotifyEmailBackend()
+
+    def messages(self, rows):
+        base_message = {"template_id": self.template_id}
+        if self.email_reply_to_id:
+            base_message["email_reply_to_id"] = self.email_reply_to_id
+        if self.reference:
+            base_message["reference"] = self.reference
+        encoding = settings.DEFAULT_CHARSET
+        for address, personalisation in rows:
+            yield (
+                sanitize_recipient(address, encoding),
+                dict(base_message, personalisation=personalisation or {}),
+            )
+
+    def run(self, on_progress=None, on_result=None, timeout=None):
+        """
+        Send the job, and return the number of recipients sent.
+
+        `on_progress` is called with the job after every `chunk_size` rows, and
+        `on_result` with each recipient's DeliveryResult. Errors are raised (after
+        marking the job failed) if the connection has `fail_silently` set to False.
+        If `timeout` is given, recipients not sent within that many seconds are
+        skipped, and recorded with the failures.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        connection = self.get_connection()
+        try:
+            rows = self.rows
+            if self.spool:
+                self.status = SPOOLING
+                spooled = tempfile.TemporaryFile("w+")
+                self.total = write_rows(rows, spooled)
+                spooled.seek(0)
+                rows = read_rows(spooled)
+            self.status = SENDING
+            with lane(self.priority):
+                self._send(connection, rows, on_progress, on_result, deadline)
+        except BaseException:
+            self.status = FAILED
+            raise
+        finally:
+            if self.spool:
+                spooled.close()
+        self.status = FINISHED
+        if on_progress:
+            on_progress(self)
+        return self.sent
+
+    def _send(self, connection, rows, on_progress, on_result, deadline):
+        failures = []
+        client = connection._connect()
+        messages = self.messages(rows)
+        for result, message in connection._send_stream(client, messages, deadline):
+            self.processed += 1
+            if result.sent:
+                self.sent += 1
+            else:
+                self.failed += 1
+                failures.append((result.recipient, message["personalisation"]))
+            if on_result:
+                on_result(result)
+            if result.error and not connection.fail_silently:
+                raise result.error
+            if len(failures) >= self.chunk_size:
+                self._record_failures(failures)
+            if on_progress and self.processed % self.chunk_size == 0:
+                on_progress(self)
+        self._record_failures(failures)
+
+    def _record_failures(self, failures):
+        if not failures:
+            return
+        if self.failures is None:
+            self.failures = tempfile.SpooledTemporaryFile(mode="w+")
+        write_rows(failures, self.failures)
+        failures.clear()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from django_gov_notify.status import sync_statuses
+
+
+class Command(BaseCommand):
+    help = "Copy the status of recent notifications from Notify."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--template-type",
+            choices=["email", "sms", "letter"],
+            help="Only sync notifications of this type.",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Fetch every notification Notify holds, not just those since the "
+            "last sync.",
+        )
+
+    def handle(self, *args, **options):
+        count = sync_statuses(
+            template_type=options["template_type"], full=options["full"]
+        )
+        self.stdout.write("Synced %d notifications." % count)
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from django_gov_notify.outbox import drain_outbox
+
+
+class Command(BaseCommand):
+    help = "Send the messages saved by OutboxNotifyEmailBackend."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="The number of messages to claim at a time.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to wait before checking an empty outbox again.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the outbox is empty, instead of waiting for more.",
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = drain_outbox(batch_size=options["batch_size"])
+            total += processed
+            if processed:
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
+        self.stdout.write("Processed %d messages." % total)
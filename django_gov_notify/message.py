@@ -1,8 +1,69 @@
+import re
 import uuid
 from typing import Optional
 
 from django.conf import settings
-from django.core.mail.message import EmailMessage
+from django.core.mail.message import EmailMessage, sanitize_address
+
+from django_gov_notify.priority import validate_priority
+
+# A plain ASCII address with no display name, which sanitize_address would return
+# unchanged, after spending most of the time it takes to send a message parsing it.
+SIMPLE_ADDRESS = re.compile(
+    r"[A-Za-z0-9_+-]+(?:\.[A-Za-z0-9_+-]+)*@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*"
+)
+
+
+def sanitize_recipient(address, encoding):
+    """Sanitize a recipient's address as sanitize_address does, but faster."""
+    if isinstance(address, str) and SIMPLE_ADDRESS.fullmatch(address):
+        return address
+    return sanitize_address(address, encoding)
+
+
+# Characters people put in phone numbers, which are not part of the number
+PHONE_PUNCTUATION = re.compile(r"[\s().\-/]")
+
+
+def normalise_phone_number(number):
+    """
+    Return a phone number in international format, such as "+447700900123",
+    raising ValueError if it can't be a mobile number.
+
+    Numbers are read as Notify reads them. A "(0)" trunk prefix, as in
+    "+44 (0)7700 900123", is dropped, and then spaces, brackets, dots, hyphens and
+    slashes are removed. A number starting with a single 0, or a number of fewer
+    than 11 digits starting with 7, such as "7700900123", is taken to be a UK
+    number, and a leading 00 is read as +.
+    """
+    if not isinstance(number, str):
+        raise TypeError("Phone numbers must be strings.")
+    normalised = PHONE_PUNCTUATION.sub("", number.replace("(0)", ""))
+    if normalised.startswith("00"):
+        normalised = "+" + normalised[2:]
+    elif normalised.startswith("0"):
+        normalised = "+44" + normalised[1:]
+    elif normalised.startswith("7") and len(normalised) < 11:
+        normalised = "+44" + normalised
+    elif not normalised.startswith("+"):
+        normalised = "+" + normalised
+    if not re.fullmatch(r"\+[1-9]\d{7,14}", normalised):
+        raise ValueError("%r is not a valid phone number." % number)
+    if normalised.startswith("+44") and not re.fullmatch(r"\+447\d{9}", normalised):
+        raise ValueError("%r is not a UK mobile number." % number)
+    return normalised
+
+
+def validate_uuid(value, error_message):
+    """Check an optional ID is a UUID string, raising TypeError or ValueError."""
+    if value is None:
+        return
+    if not isinstance(value, str):
+        raise TypeError(error_message)
+    try:
+        uuid.UUID(value)
+    except Exception as e:
+        raise ValueError(error_message) from e
 
 
 class NotifyEmailMessage(EmailMessage):
@@ -23,6 +84,8 @@ class NotifyEmailMessage(EmailMessage):
         template_id: str = None,
         personalisation: Optional[dict] = None,
         email_reply_to_id: Optional[str] = None,
+        reference: Optional[str] = None,
+        priority: Optional[str] = None,
     ):
         if from_email:
             raise ValueError(
@@ -37,26 +100,25 @@ class NotifyEmailMessage(EmailMessage):
         if bcc:
             raise ValueError("BCC recipients are not supported.")
 
-        if template_id is not None:
-            if not isinstance(template_id, str):
-                raise TypeError("Template ID must be a UUID string.")
-            try:
-                uuid.UUID(template_id)
-            except Exception as e:
-                raise ValueError("Template ID must be a UUID string.") from e
+        validate_uuid(template_id, "Template ID must be a UUID string.")
         self.template_id = template_id
 
         self.personalisation = personalisation or {}
 
-        if email_reply_to_id is not None:
-            if not isinstance(email_reply_to_id, str):
-                raise TypeError("email_reply_to_id must be a UUID string.")
-            try:
-                uuid.UUID(email_reply_to_id)
-            except Exception as e:
-                raise ValueError("email_reply_to_id must be a UUID string.") from e
+        validate_uuid(email_reply_to_id, "email_reply_to_id must be a UUID string.")
         self.email_reply_to_id = email_reply_to_id
 
+        if reference is not None and not isinstance(reference, str):
+            raise TypeError("reference must be a string.")
+        self.reference = reference
+
+        # "transactional" or "bulk", or None for the backend's default priority
+        validate_priority(priority)
+        self.priority = priority
+
+        # A list of DeliveryResult objects, one per recipient, set when sent
+        self.notify_results = None
+
         super().__init__(
             subject=subject,
             body=body,
@@ -83,6 +145,19 @@ class NotifyEmailMessage(EmailMessage):
 
         return NotifyEmailBackend(fail_silently=fail_silently)
 
+    async def asend(self, fail_silently=False):
+        """Send the email message from async code, returning the number sent."""
+        from django_gov_notify.backends import AsyncNotifyEmailBackend
+
+        if not self.recipients():
+            # Don't bother creating the network connection if there's nobody to
+            # send to.
+            return 0
+        if hasattr(self.connection, "asend_messages"):
+            return await self.connection.asend_messages([self])
+        async with AsyncNotifyEmailBackend(fail_silently=fail_silently) as connection:
+            return await connection.asend_messages([self])
+
     def validate_fields(self):
         if self.template_id is None:
             if not (self.subject and self.body):
@@ -112,4 +187,187 @@ class NotifyEmailMessage(EmailMessage):
         msg = {"template_id": template_id, "personalisation": personalisation}
         if self.email_reply_to_id:
             msg["email_reply_to_id"] = self.email_reply_to_id
+        if self.reference:
+            msg["reference"] = self.reference
         return msg
+
+
+class NotifyBulkMessage:
+    """
+    One Notify template sent to many recipients, each with their own
+    personalisation.
+
+    `rows` is an iterable of (email address, personalisation dict) pairs. It is read
+    lazily as the message is sent, so it can be a generator (for example over a
+    database query) of any length, without building a message object per row.
+    """
+
+    def __init__(
+        self,
+        template_id: str,
+        rows,
+        email_reply_to_id: Optional[str] = None,
+        connection=None,
+    ):
+        if template_id is None:
+            raise ValueError("A template ID is needed for a bulk message.")
+        validate_uuid(template_id, "Template ID must be a UUID string.")
+        validate_uuid(email_reply_to_id, "email_reply_to_id must be a UUID string.")
+        self.template_id = template_id
+        self.rows = rows
+        self.email_reply_to_id = email_reply_to_id
+        self.connection = connection
+
+    def get_connection(self, fail_silently=False):
+        from django_gov_notify.backends import NotifyEmailBackend
+
+        return NotifyEmailBackend(fail_silently=fail_silently)
+
+    def send(self, fail_silently=False):
+        """Send the message to every row, and return the number of rows sent."""
+        connection = self.connection or self.get_connection(fail_silently)
+        return connection.send_bulk(
+            self.template_id, self.rows, email_reply_to_id=self.email_reply_to_id
+        )
+
+
+class NotifyPayload:
+    """
+    What is sent to Notify for one email message: its template, personalisation and
+    options, and its recipients' addresses, already sanitized.
+
+    Backends adapt each message to a payload once, and send from that, rather than
+    converting plain EmailMessages to NotifyEmailMessages first.
+    """
+
+    __slots__ = (
+        "template_id",
+        "personalisation",
+        "email_reply_to_id",
+        "reference",
+        "recipients",
+    )
+
+    def __init__(
+        self,
+        template_id,
+        personalisation,
+        recipients,
+        email_reply_to_id=None,
+        reference=None,
+    ):
+        self.template_id = template_id
+        self.personalisation = personalisation
+        self.recipients = recipients
+        self.email_reply_to_id = email_reply_to_id
+        self.reference = reference
+
+    @classmethod
+    def from_email_message(cls, email_message):
+        """
+        Adapt a NotifyEmailMessage, or a plain EmailMessage to be sent with the
+        plain template, raising ValueError if it can't be sent with Notify.
+
+        As with cast_to_notify_email_message, a plain message's from_email, headers
+        and reply_to are ignored, because send_mail sets them by default.
+        """
+        if isinstance(email_message, NotifyEmailMessage):
+            message = email_message.message()
+            return cls(
+                message["template_id"],
+                message["personalisation"],
+                cls.sanitize(email_message),
+                email_reply_to_id=message.get("email_reply_to_id"),
+                reference=message.get("reference"),
+            )
+        if email_message.attachments:
+            raise ValueError("Attachments are not supported.")
+        if email_message.cc:
+            raise ValueError("CC recipients are not supported.")
+        if email_message.bcc:
+            raise ValueError("BCC recipients are not supported.")
+        if not (email_message.subject and email_message.body):
+            raise ValueError(
+                "If using the default template, subject and body are needed."
+            )
+        return cls(
+            settings.GOVUK_NOTIFY_PLAIN_EMAIL_TEMPLATE_ID,
+            {"subject": email_message.subject, "body": email_message.body},
+            cls.sanitize(email_message),
+        )
+
+    @staticmethod
+    def sanitize(email_message):
+        encoding = email_message.encoding or settings.DEFAULT_CHARSET
+        return [
+            sanitize_recipient(addr, encoding) for addr in email_message.recipients()
+        ]
+
+    def message(self):
+        """Return the keyword arguments for the API client, as NotifyEmailMessage does."""
+        msg = {"template_id": self.template_id, "personalisation": self.personalisation}
+        if self.email_reply_to_id:
+            msg["email_reply_to_id"] = self.email_reply_to_id
+        if self.reference:
+            msg["reference"] = self.reference
+        return msg
+
+
+class NotifySMSMessage:
+    """A text message sent with a GOV.UK Notify template."""
+
+    def __init__(
+        self,
+        to=None,
+        template_id: str = None,
+        personalisation: Optional[dict] = None,
+        sms_sender_id: Optional[str] = None,
+        reference: Optional[str] = None,
+        connection=None,
+        priority: Optional[str] = None,
+    ):
+        if template_id is None:
+            raise ValueError("A template ID is needed for a text message.")
+        validate_uuid(template_id, "Template ID must be a UUID string.")
+        validate_uuid(sms_sender_id, "sms_sender_id must be a UUID string.")
+        if isinstance(to, str):
+            raise TypeError('"to" argument must be a list or tuple')
+        if reference is not None and not isinstance(reference, str):
+            raise TypeError("reference must be a string.")
+        validate_priority(priority)
+
+        self.to = list(to or [])
+        self.template_id = template_id
+        self.personalisation = personalisation or {}
+        self.sms_sender_id = sms_sender_id
+        self.reference = reference
+        self.connection = connection
+        self.priority = priority
+
+        # A list of DeliveryResult objects, one per recipient, set when sent
+        self.notify_results = None
+
+    def recipients(self):
+        return [number for number in self.to if number]
+
+    def message(self):
+        msg = {"template_id": self.template_id, "personalisation": self.personalisation}
+        if self.sms_sender_id:
+            msg["sms_sender_id"] = self.sms_sender_id
+        if self.reference:
+            msg["reference"] = self.reference
+        return msg
+
+    def get_connection(self, fail_silently=False):
+        from django_gov_notify.backends import NotifySMSBackend
+
+        return NotifySMSBackend(fail_silently=fail_silently)
+
+    def send(self, fail_silently=False):
+        """Send the text message, and return the number of messages sent (0 or 1)."""
+        if not self.recipients():
+            # Don't bother creating the network connection if there's nobody to
+            # send to.
+            return 0
+        connection = self.connection or self.get_connection(fail_silently)
+        return connection.send_messages([self])
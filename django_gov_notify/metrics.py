@@ -0,0 +1,214 @@
+import socket
+import threading
+from bisect import bisect_left
+
+from django_gov_notify import signals
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    """A thread-safe count, split by label values."""
+
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self.values)
+        for label_values, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+
+class Gauge(Counter):
+    """A thread-safe value that can go up and down, split by label values."""
+
+    type = "gauge"
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self.values[label_values] = value
+
+
+class Histogram:
+    """A thread-safe histogram of observed values, split by label values."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # For each set of label values: a count per bucket, plus one for +Inf,
+        # and the sum of the observed values
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self.values.get(
+                label_values, ([0] * (len(self.buckets) + 1), 0.0)
+            )
+            counts[index] += 1
+            self.values[label_values] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = {
+                key: (list(counts), total)
+                for key, (counts, total) in self.values.items()
+            }
+        for label_values, (counts, total) in sorted(values.items()):
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield self.name + "_bucket", dict(labels, le=str(bound)), cumulative
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, cumulative
+
+
+notifications = Counter(
+    "govuk_notify_notifications_total",
+    "Recipients dealt with, by result status.",
+    labels=("status",),
+)
+retries = Counter("govuk_notify_retries_total", "Requests retried after an error.")
+rate_limited = Counter(
+    "govuk_notify_rate_limited_total", "Requests held up by the rate limiter."
+)
+rate_limit_wait = Counter(
+    "govuk_notify_rate_limit_wait_seconds_total",
+    "Seconds spent waiting for the rate limiter.",
+)
+latency = Histogram(
+    "govuk_notify_send_seconds",
+    "Seconds taken to send to a recipient, including retries, by template.",
+    labels=("template_id",),
+)
+concurrency_limit = Gauge(
+    "govuk_notify_concurrency_limit",
+    "Requests allowed in flight by adaptive concurrency, by hashed API key.",
+    labels=("key",),
+)
+METRICS = (
+    notifications,
+    retries,
+    rate_limited,
+    rate_limit_wait,
+    latency,
+    concurrency_limit,
+)
+
+
+def _record_sent(result, message, **kwargs):
+    notifications.inc(result.status)
+    if result.latency is not None:
+        latency.observe(result.latency, message.get("template_id"))
+
+
+def _record_retrying(**kwargs):
+    retries.inc()
+
+
+def _record_rate_limited(waited, **kwargs):
+    rate_limited.inc()
+    rate_limit_wait.inc(amount=waited)
+
+
+def _record_concurrency_limit(limiter, new_limit, **kwargs):
+    concurrency_limit.set(new_limit, limiter.key)
+
+
+def enable():
+    """
+    Start collecting the built-in metrics. This is done when the app is ready if
+    the GOVUK_NOTIFY_METRICS setting is True.
+    """
+    signals.notification_sent.connect(_record_sent, dispatch_uid=__name__)
+    signals.notification_retrying.connect(_record_retrying, dispatch_uid=__name__)
+    signals.notification_rate_limited.connect(
+        _record_rate_limited, dispatch_uid=__name__
+    )
+    signals.concurrency_limit_changed.connect(
+        _record_concurrency_limit, dispatch_uid=__name__
+    )
+
+
+def disable():
+    signals.notification_sent.disconnect(dispatch_uid=__name__)
+    signals.notification_retrying.disconnect(dispatch_uid=__name__)
+    signals.notification_rate_limited.disconnect(dispatch_uid=__name__)
+    signals.concurrency_limit_changed.disconnect(dispatch_uid=__name__)
+
+
+def render_prometheus():
+    """Return the built-in metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.append("# HELP %s %s" % (metric.name, metric.help))
+        lines.append("# TYPE %s %s" % (metric.name, metric.type))
+        for name, labels, value in metric.samples():
+            if labels:
+                label_text = ",".join(
+                    '%s="%s"' % (key, str(value).replace('"', '\\"'))
+                    for key, value in labels.items()
+                )
+                name = "%s{%s}" % (name, label_text)
+            lines.append("%s %s" % (name, value))
+    return "\n".join(lines) + "\n"
+
+
+class StatsdExporter:
+    """
+    Send a StatsD metric over UDP for each signal, as it happens.
+
+    Call `connect()` once, for example in an AppConfig's `ready()` method.
+    """
+
+    def __init__(self, host="localhost", port=8125, prefix="govuk_notify"):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, name, value, metric_type):
+        data = "%s.%s:%s|%s" % (self.prefix, name, value, metric_type)
+        try:
+            self.socket.sendto(data.encode(), self.address)
+        except OSError:
+            # Metrics must never break sending email
+            pass
+
+    def on_sent(self, result, message, **kwargs):
+        self.send("notifications.%s" % result.status, 1, "c")
+        if result.latency is not None:
+            self.send("send", round(result.latency * 1000, 3), "ms")
+
+    def on_retrying(self, **kwargs):
+        self.send("retries", 1, "c")
+
+    def on_rate_limited(self, waited, **kwargs):
+        self.send("rate_limited", 1, "c")
+
+    def on_concurrency_limit_changed(self, new_limit, **kwargs):
+        self.send("concurrency_limit", new_limit, "g")
+
+    def connect(self):
+        signals.notification_sent.connect(self.on_sent, weak=False)
+        signals.notification_retrying.connect(self.on_retrying, weak=False)
+        signals.notification_rate_limited.connect(self.on_rate_limited, weak=False)
+        signals.concurrency_limit_changed.connect(
+            self.on_concurrency_limit_changed, weak=False
+        )
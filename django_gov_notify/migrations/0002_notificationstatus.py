@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_gov_notify", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationStatus",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("notification_id", models.UUIDField(unique=True)),
+                (
+                    "reference",
+                    models.CharField(blank=True, db_index=True, max_length=255),
+                ),
+                ("recipient", models.CharField(blank=True, max_length=255)),
+                ("notification_type", models.CharField(max_length=20)),
+                ("template_id", models.UUIDField(null=True)),
+                ("status", models.CharField(db_index=True, max_length=40)),
+                ("created_at", models.DateTimeField(db_index=True)),
+                ("sent_at", models.DateTimeField(null=True)),
+                ("completed_at", models.DateTimeField(null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name_plural": "notification statuses",
+            },
+        ),
+        migrations.CreateModel(
+            name="StatusSyncState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=64, unique=True)),
+                ("high_water_mark", models.DateTimeField(null=True)),
+                ("last_synced_at", models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_gov_notify", "0002_notificationstatus"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="outboxmessage",
+            name="priority",
+            field=models.CharField(blank=True, max_length=20),
+        ),
+    ]
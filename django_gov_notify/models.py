@@ -0,0 +1,56 @@
+from django.db import models
+from django.utils import timezone
+
+
+class OutboxMessage(models.Model):
+    """A rendered message waiting to be sent by the notify_worker command."""
+
+    # The keyword arguments for send_email_notification, from NotifyEmailMessage.message()
+    payload = models.JSONField()
+    # The sanitized addresses still to be sent to
+    recipients = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # The earliest time the worker may next try to send the message
+    available_at = models.DateTimeField(default=timezone.now, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # "transactional" or "bulk", or blank for the sending backend's default
+    priority = models.CharField(max_length=20, blank=True)
+
+    def __str__(self):
+        return "Outbox message %s (%d recipients)" % (self.pk, len(self.recipients))
+
+
+class NotificationStatus(models.Model):
+    """The latest status of a notification, copied from Notify by notify_sync_status."""
+
+    notification_id = models.UUIDField(unique=True)
+    reference = models.CharField(max_length=255, blank=True, db_index=True)
+    # The email address or phone number
+    recipient = models.CharField(max_length=255, blank=True)
+    notification_type = models.CharField(max_length=20)
+    template_id = models.UUIDField(null=True)
+    status = models.CharField(max_length=40, db_index=True)
+    created_at = models.DateTimeField(db_index=True)
+    sent_at = models.DateTimeField(null=True)
+    completed_at = models.DateTimeField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "notification statuses"
+
+    def __str__(self):
+        return "%s: %s" % (self.notification_id, self.status)
+
+
+class StatusSyncState(models.Model):
+    """How far notify_sync_status has got, for one API key and notification type."""
+
+    key = models.CharField(max_length=64, unique=True)
+    # Notifications created before this had all reached a final status, so later
+    # syncs stop once they reach it
+    high_water_mark = models.DateTimeField(null=True)
+    last_synced_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return "Status sync %s up to %s" % (self.key, self.high_water_mark)
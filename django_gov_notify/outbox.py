@@ -0,0 +1,99 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from django_gov_notify.backends import NotifyEmailBackend
+from django_gov_notify.models import OutboxMessage
+from django_gov_notify.priority import lane
+from django_gov_notify.results import QUEUED, DeliveryResult, all_queued
+
+
+class OutboxNotifyEmailBackend(NotifyEmailBackend):
+    """
+    An email backend that saves messages to the OutboxMessage table instead of
+    sending them, so that the request sending them does not wait for Notify.
+
+    Run the `notify_worker` management command to send the saved messages.
+    """
+
+    def send_messages(self, email_messages):
+        """Save messages to the outbox, and return the number saved."""
+        results = self.send_messages_detailed(email_messages)
+        return sum(1 for message_results in results if all_queued(message_results))
+
+    def enqueue(self, recipients, message, priority=None):
+        """Save a rendered message dict for the given sanitized recipients."""
+        OutboxMessage.objects.create(
+            payload=message, recipients=recipients, priority=priority or ""
+        )
+
+    def send_messages_detailed(self, email_messages):
+        if not email_messages:
+            return []
+
+        rows = []
+        for email_message, recipients, message in self._prepare(email_messages):
+            rows.append(
+                OutboxMessage(
+                    payload=message,
+                    recipients=recipients,
+                    priority=self._priority(email_message),
+                )
+            )
+            email_message.notify_results = [
+                DeliveryResult(recipient, QUEUED) for recipient in recipients
+            ]
+        OutboxMessage.objects.bulk_create(rows)
+        return [email_message.notify_results for email_message in email_messages]
+
+
+def drain_outbox(batch_size=100, backend=None, max_attempts=None):
+    """
+    Send one batch of messages from the outbox, and return the number of messages
+    processed.
+
+    Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several workers can
+    drain the same outbox. A message that is sent to all its recipients is deleted;
+    otherwise it is kept with just the recipients that failed, to be retried with
+    an increasing delay until it has been attempted `max_attempts` times. Each
+    message is sent in the priority lane it was saved with.
+    """
+    if backend is None:
+        # Failed recipients stay in the outbox anyway, so don't fall back to it
+        backend = NotifyEmailBackend(fail_silently=True, circuit_fallback=None)
+    if max_attempts is None:
+        max_attempts = getattr(settings, "GOVUK_NOTIFY_OUTBOX_MAX_ATTEMPTS", 5)
+
+    with transaction.atomic():
+        rows = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(attempts__lt=max_attempts, available_at__lte=timezone.now())
+            .order_by("pk")[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        client = backend._connect()
+        sent = []
+        failed = []
+        for row in rows:
+            with lane(row.priority or backend.priority):
+                results = backend._send_rendered(client, row.recipients, row.payload)
+            failures = [result for result in results if not result.sent]
+            if failures:
+                row.recipients = [result.recipient for result in failures]
+                row.attempts += 1
+                row.last_error = str(failures[0].error)
+                row.available_at = timezone.now() + datetime.timedelta(
+                    minutes=2 ** (row.attempts - 1)
+                )
+                failed.append(row)
+            else:
+                sent.append(row.pk)
+        OutboxMessage.objects.filter(pk__in=sent).delete()
+        OutboxMessage.objects.bulk_update(
+            failed, ["recipients", "attempts", "last_error", "available_at"]
+        )
+    return len(rows)
@@ -0,0 +1,110 @@
+import datetime
+import functools
+import os
+import sys
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from django_gov_notify import signals
+from django_gov_notify.backends import NotifyEmailBackend
+from django_gov_notify.templates import get_template, render_template
+
+
+class LazyClient:
+    """
+    Stands in for a Notify client, creating it only when a template has to be
+    fetched, so that previews need no real API key unless they use Notify.
+    """
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get_template(self, template_id):
+        with self._lock:
+            if self._client is None:
+                self._client = self._connect()
+        return self._client.get_template(template_id)
+
+
+class PreviewNotifyEmailBackend(NotifyEmailBackend):
+    """
+    An email backend that renders messages locally instead of sending them, for
+    development, tests and dry runs of large campaigns.
+
+    Each rendered email is written to `stream` (standard output by default), or
+    to a new file in the `file_path` directory. Templates are read from the
+    GOVUK_NOTIFY_TEMPLATES setting where they are defined there, so that no
+    requests are made to Notify at all, and no Notify client is created; other
+    templates are fetched once and cached.
+    """
+
+    def __init__(self, *args, stream=None, file_path=None, **kwargs):
+        self.stream = stream or sys.stdout
+        self.file_path = file_path or getattr(
+            settings, "GOVUK_NOTIFY_PREVIEW_FILE_PATH", None
+        )
+        if self.file_path:
+            self.file_path = os.path.abspath(self.file_path)
+            try:
+                os.makedirs(self.file_path, exist_ok=True)
+            except OSError as e:
+                raise ImproperlyConfigured(
+                    "Could not create directory for email previews: %s (%s)"
+                    % (self.file_path, e)
+                )
+            self.stream = None
+        self._write_lock = threading.Lock()
+        kwargs.setdefault("rate_limit", None)
+        super().__init__(*args, **kwargs)
+        # Nothing is sent, so nothing may be recorded as sent: a dry run must not
+        # stop the real send as a duplicate
+        self.dedup_store = None
+
+    def _get_client(self, api_key=None):
+        return LazyClient(functools.partial(super()._get_client, api_key))
+
+    def _open(self):
+        super()._open()
+        if self.stream is None:
+            timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+            filename = "%s-%s.log" % (timestamp, abs(id(self)))
+            self.stream = open(
+                os.path.join(self.file_path, filename), "a", encoding="utf-8"
+            )
+
+    def close(self):
+        with self._lock:
+            try:
+                if self.file_path and self.stream is not None:
+                    self.stream.close()
+                    self.stream = None
+            finally:
+                super().close()
+
+    def _request(self, client, recipient, message):
+        """Render the message, write it out, and return a Notify-like response."""
+        signals.notification_sending.send(
+            sender=self.__class__, recipient=recipient, message=message
+        )
+        template = get_template(client, message["template_id"])
+        content = render_template(template, message["personalisation"])
+        lines = ["To: %s" % recipient, "Template: %s" % message["template_id"]]
+        if message.get("email_reply_to_id"):
+            lines.append("Reply-To-ID: %s" % message["email_reply_to_id"])
+        if message.get("reference"):
+            lines.append("Reference: %s" % message["reference"])
+        lines += ["Subject: %s" % content["subject"], "", content["body"], "-" * 79]
+        with self._write_lock:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        return {
+            "id": str(uuid.uuid4()),
+            "reference": message.get("reference"),
+            "content": content,
+            "template": {"id": message["template_id"]},
+        }
@@ -0,0 +1,232 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django_gov_notify.clients import api_key_id
+from django_gov_notify.concurrency import AdaptiveLimiter
+
+# Messages a person is waiting for, such as sign-in codes and password resets
+TRANSACTIONAL = "transactional"
+# Campaigns and newsletters, which can wait
+BULK = "bulk"
+PRIORITIES = (TRANSACTIONAL, BULK)
+
+DEFAULT_WEIGHTS = {TRANSACTIONAL: 9, BULK: 1}
+
+_current = ContextVar("govuk_notify_priority", default=None)
+
+_schedulers = {}
+_lock = threading.Lock()
+
+
+def validate_priority(priority):
+    """Check an optional priority is one of PRIORITIES, raising ValueError."""
+    if priority is not None and priority not in PRIORITIES:
+        raise ValueError(
+            "priority must be one of %s." % ", ".join(repr(p) for p in PRIORITIES)
+        )
+
+
+def current_priority():
+    """Return the priority of the requests being made in this context."""
+    return _current.get() or TRANSACTIONAL
+
+
+@contextmanager
+def lane(priority):
+    """Make the requests sent in this context with the given priority."""
+    token = _current.set(priority)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+class PriorityScheduler:
+    """
+    Admits API requests one lane at a time, sharing out the rate limit and the
+    requests in flight between priorities by weight.
+
+    Waiting requests queue in a lane per priority. Whenever the rate limiter is
+    free, the next request is taken from the lane with the least weighted service
+    so far: with the default weights of 9 to 1, transactional requests get nine
+    turns in ten while both lanes are waiting, and a lane with nobody waiting gives
+    its share to the other. A transactional request therefore waits for at most
+    about one request already being rate limited, however many bulk requests are
+    queued. If `max_in_flight` is set, no more than that many requests admitted by
+    the scheduler are under way at once, and the free places are shared the same
+    way. If `concurrency` is given, an AdaptiveLimiter, its limit is used instead,
+    and it is told how each request went.
+    """
+
+    def __init__(self, weights=None, max_in_flight=None, concurrency=None):
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.max_in_flight = max_in_flight
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._lanes = {priority: [] for priority in self.weights}
+        self._served = dict.fromkeys(self.weights, 0.0)
+        self._virtual_time = 0.0
+        self._limiting = False
+        # Futures to wake coroutines in aacquire, by ticket, with their event loops
+        self._waiters = {}
+
+    def waiting(self, priority):
+        """Return the number of requests waiting in a lane."""
+        return len(self._lanes[priority])
+
+    def _start(self, priority):
+        return max(self._served[priority], self._virtual_time)
+
+    def _turn(self):
+        """Return the request whose turn it is, or None if none are waiting."""
+        lanes = [priority for priority in self._lanes if self._lanes[priority]]
+        if not lanes:
+            return None
+        priority = min(
+            lanes,
+            key=lambda p: self._start(p) + 1 / self.weights[p],
+        )
+        return self._lanes[priority][0]
+
+    @property
+    def limit(self):
+        """The most requests that may be under way at once, or None."""
+        if self.concurrency:
+            return self.concurrency.limit
+        return self.max_in_flight
+
+    def _can_admit(self, ticket):
+        limit = self.limit
+        return (
+            not self._limiting
+            and (limit is None or self.in_flight < limit)
+            and self._turn() is ticket
+        )
+
+    def _notify(self):
+        """Wake every waiting request to check its turn. Call with `_cond` held."""
+        self._cond.notify_all()
+        waiters, self._waiters = self._waiters, {}
+        for loop, future in waiters.values():
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # The loop has closed, and its coroutines with it
+                pass
+
+    def _admit(self, priority):
+        self._lanes[priority].pop(0)
+        self._virtual_time = self._start(priority)
+        self._served[priority] = self._virtual_time + 1 / self.weights[priority]
+        self._limiting = True
+        self.in_flight += 1
+        self._notify()
+
+    def _limited(self, failed=False):
+        with self._cond:
+            self._limiting = False
+            if failed:
+                self.in_flight -= 1
+            self._notify()
+
+    def acquire(self, priority, limiter=None):
+        """
+        Block until it is the turn of a request with the given priority, then take
+        a place for it from `limiter`, returning the seconds the limiter waited.
+
+        Call `release` when the request has finished.
+        """
+        ticket = object()
+        with self._cond:
+            self._lanes[priority].append(ticket)
+            try:
+                while not self._can_admit(ticket):
+                    self._cond.wait()
+            except BaseException:
+                self._lanes[priority].remove(ticket)
+                self._notify()
+                raise
+            self._admit(priority)
+        try:
+            waited = limiter.acquire() if limiter else 0
+        except BaseException:
+            self._limited(failed=True)
+            raise
+        self._limited()
+        return waited
+
+    async def aacquire(self, priority, limiter=None):
+        """
+        Like `acquire`, but waits without blocking the event loop, on a future that
+        is woken whenever another request is admitted or finishes.
+        """
+        loop = asyncio.get_running_loop()
+        ticket = object()
+        with self._cond:
+            self._lanes[priority].append(ticket)
+            self._notify()
+        try:
+            while True:
+                with self._cond:
+                    if self._can_admit(ticket):
+                        self._admit(priority)
+                        break
+                    woken = loop.create_future()
+                    self._waiters[ticket] = (loop, woken)
+                await woken
+        except BaseException:
+            with self._cond:
+                self._waiters.pop(ticket, None)
+                self._lanes[priority].remove(ticket)
+                self._notify()
+            raise
+        try:
+            waited = await limiter.aacquire() if limiter else 0
+        except BaseException:
+            self._limited(failed=True)
+            raise
+        self._limited()
+        return waited
+
+    def release(self, latency=None, error=None):
+        """
+        Give back the place of a request that has finished, after `latency` seconds,
+        raising `error` if it failed.
+        """
+        with self._cond:
+            in_flight = self.in_flight
+            self.in_flight -= 1
+        if self.concurrency and latency is not None:
+            self.concurrency.record(latency, error, in_flight)
+        with self._cond:
+            self._notify()
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def get_scheduler(api_key, weights=None, max_in_flight=None, adaptive=False):
+    """
+    Return the process-wide priority scheduler for an API key.
+
+    If `adaptive` is True the scheduler has an AdaptiveLimiter, which finds the
+    number of requests to have in flight, up to `max_in_flight` (or 100).
+    """
+    key = api_key_id(api_key)
+    weights = tuple(sorted((weights or {}).items()))
+    options = (key, weights, max_in_flight, adaptive)
+    with _lock:
+        scheduler = _schedulers.get(options)
+        if scheduler is None:
+            if adaptive:
+                concurrency = AdaptiveLimiter(key, max_limit=max_in_flight or 100)
+                scheduler = PriorityScheduler(dict(weights), concurrency=concurrency)
+            else:
+                scheduler = PriorityScheduler(dict(weights), max_in_flight)
+            _schedulers[options] = scheduler
+        return scheduler
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+
+from django.core.cache import caches
+
+from django_gov_notify.clients import api_key_id
+
+_limiters = {}
+_lock = threading.Lock()
+
+
+class RateLimiter:
+    """Base class for limiters allowing `rate` requests every `period` seconds."""
+
+    def __init__(self, rate, period=60):
+        self.rate = rate
+        self.period = period
+
+    def try_acquire(self):
+        """
+        Take permission for one request if it is available, and return 0. Otherwise
+        return the number of seconds to wait before trying again.
+        """
+        raise NotImplementedError
+
+    async def atry_acquire(self):
+        """Like `try_acquire`, for limiters whose state is not in this process."""
+        return self.try_acquire()
+
+    def acquire(self):
+        """Block until a request is allowed, and return the number of seconds waited."""
+        waited = 0
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def aacquire(self):
+        """Like `acquire`, but waits without blocking the event loop."""
+        waited = 0
+        while True:
+            delay = await self.atry_acquire()
+            if not delay:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+
+class TokenBucket(RateLimiter):
+    """
+    An in-process, thread-safe token bucket. Up to `capacity` requests may be made at
+    once, by default a second's share of the rate, after which tokens are refilled
+    evenly.
+
+    Tokens are refilled at `rate - capacity` per period, so that a full bucket and
+    a period's refill together never allow more than `rate` requests in any one
+    period.
+    """
+
+    def __init__(self, rate, period=60, capacity=None, clock=time.monotonic):
+        super().__init__(rate, period)
+        self.capacity = capacity or max(1, rate // period)
+        self.refill_rate = max(1, rate - self.capacity) / period
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.updated) * self.refill_rate,
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.refill_rate
+
+
+class CacheRateLimiter(RateLimiter):
+    """
+    A limiter whose counts are kept in a Django cache, so that it is shared by every
+    process using that cache.
+
+    Time is split into short windows, each allowing its share of the rate, so bursts
+    are spread over the period rather than used up at its start. The cache must
+    support atomic `incr`, as Redis and Memcached do.
+    """
+
+    def __init__(self, key, rate, period=60, cache_alias="default", clock=time.time):
+        super().__init__(rate, period)
+        self.key = key
+        self.cache = caches[cache_alias]
+        self.clock = clock
+        self.window = max(1.0, period / rate)
+        self.allowance = max(1, round(rate * self.window / period))
+
+    def try_acquire(self):
+        now = self.clock()
+        window = int(now // self.window)
+        cache_key = self._cache_key(window)
+        self.cache.add(cache_key, 0, timeout=int(self.window) + 1)
+        try:
+            count = self.cache.incr(cache_key)
+        except ValueError:
+            # The window expired between add() and incr(); try the next one
+            return 0.001
+        return self._delay(count, window, now)
+
+    async def atry_acquire(self):
+        """Like `try_acquire`, but uses the cache without blocking the event loop."""
+        now = self.clock()
+        window = int(now // self.window)
+        cache_key = self._cache_key(window)
+        await self.cache.aadd(cache_key, 0, timeout=int(self.window) + 1)
+        try:
+            count = await self.cache.aincr(cache_key)
+        except ValueError:
+            return 0.001
+        return self._delay(count, window, now)
+
+    def _cache_key(self, window):
+        return "govuk-notify-rate-limit:%s:%d" % (self.key, window)
+
+    def _delay(self, count, window, now):
+        if count <= self.allowance:
+            return 0
+        return (window + 1) * self.window - now
+
+
+def get_rate_limiter(api_key, rate, period=60, cache_alias=None):
+    """
+    Return the process-wide rate limiter for an API key, creating it on first use.
+
+    If `cache_alias` is given the limit is shared through that Django cache;
+    otherwise it applies to this process only.
+    """
+    key = api_key_id(api_key)
+    with _lock:
+        limiter = _limiters.get((key, rate, period, cache_alias))
+        if limiter is None:
+            if cache_alias:
+                limiter = CacheRateLimiter(key, rate, period, cache_alias=cache_alias)
+            else:
+                limiter = TokenBucket(rate, period)
+            _limiters[(key, rate, period, cache_alias)] = limiter
+        return limiter
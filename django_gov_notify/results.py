@@ -0,0 +1,36 @@
+from dataclasses import dataclass
+from typing import Optional
+
+SENT = "sent"
+FAILED = "failed"
+QUEUED = "queued"
+# Skipped because the dedup store shows the recipient has been sent it already
+DUPLICATE = "duplicate"
+# Not attempted, because the deadline for sending had passed
+SKIPPED = "skipped"
+
+
+@dataclass
+class DeliveryResult:
+    """The outcome of sending a message to one recipient."""
+
+    recipient: str
+    status: str
+    notification_id: Optional[str] = None
+    latency: Optional[float] = None
+    error: Optional[Exception] = None
+
+    @property
+    def sent(self):
+        """True if the recipient has been sent the message, by now or before."""
+        return self.status in (SENT, DUPLICATE)
+
+
+def all_sent(results):
+    """Return True if a message had recipients, and was sent to all of them."""
+    return bool(results) and all(result.sent for result in results)
+
+
+def all_queued(results):
+    """Return True if a message had recipients, and was queued for all of them."""
+    return bool(results) and all(result.status == QUEUED for result in results)
@@ -0,0 +1,120 @@
+import asyncio
+import email.utils
+import random
+import time
+
+from notifications_python_client.errors import APIError
+
+
+def is_overload(error):
+    """
+    Return whether an error means Notify wants fewer requests: a rate limit (429)
+    or server (5xx) error, or a failed connection.
+    """
+    # NotificationsAPIClient reports connection errors and timeouts as
+    # HTTP503Error, with no response
+    return isinstance(error, APIError) and (
+        error.status_code == 429 or error.status_code >= 500
+    )
+
+
+class RetryPolicy:
+    """
+    Retry requests that fail with a rate limit (429) or server (5xx) error, or that
+    could not connect at all.
+
+    Attempts are spaced with exponential backoff and full jitter, unless the response
+    has a Retry-After header, which is honoured instead. No attempt is started that
+    would end its wait after `deadline` seconds from the first attempt.
+    """
+
+    def __init__(
+        self,
+        max_attempts=3,
+        deadline=30,
+        base_delay=0.5,
+        max_delay=10,
+        clock=time.monotonic,
+    ):
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+
+    def is_retryable(self, error):
+        return is_overload(error)
+
+    def retry_after(self, error):
+        """Return the delay requested by a Retry-After header, if there is one."""
+        try:
+            value = error.response.headers["Retry-After"]
+        except (AttributeError, KeyError, TypeError):
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, retry_at.timestamp() - time.time())
+
+    def delay(self, attempt, error):
+        """Return the number of seconds to wait after the given failed attempt."""
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        )
+
+    def _next_delay(self, attempt, error, started, give_up_at=None):
+        """Return how long to wait before retrying, or None to give up."""
+        if attempt >= self.max_attempts or not self.is_retryable(error):
+            return None
+        delay = self.delay(attempt, error)
+        if self.deadline is not None and self.clock() + delay - started > self.deadline:
+            return None
+        if give_up_at is not None and self.clock() + delay > give_up_at:
+            return None
+        return delay
+
+    def call(self, func, *args, on_retry=None, give_up_at=None):
+        """
+        Call `func` with `args` until it succeeds or should not be retried.
+
+        `on_retry`, if given, is called with the error, the number of the attempt
+        that failed, and the delay before the next one. `give_up_at`, if given, is a
+        time from the policy's clock that no wait for a retry may go past.
+        """
+        started = self.clock()
+        attempt = 1
+        while True:
+            try:
+                return func(*args)
+            except Exception as e:
+                delay = self._next_delay(attempt, e, started, give_up_at)
+                if delay is None:
+                    raise
+                if on_retry:
+                    on_retry(e, attempt, delay)
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, func, *args, on_retry=None, give_up_at=None):
+        """The async equivalent of `call`, for a coroutine function."""
+        started = self.clock()
+        attempt = 1
+        while True:
+            try:
+                return await func(*args)
+            except Exception as e:
+                delay = self._next_delay(attempt, e, started, give_up_at)
+                if delay is None:
+                    raise
+                if on_retry:
+                    on_retry(e, attempt, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -0,0 +1,263 @@
+import threading
+import zlib
+from contextlib import contextmanager
+
+from django.core.exceptions import ImproperlyConfigured
+
+from django_gov_notify.circuitbreaker import OPEN
+
+TEMPLATE = "template"
+HASH = "hash"
+LEAST_USED = "least_used"
+STRATEGIES = (TEMPLATE, HASH, LEAST_USED)
+
+# The message fields holding IDs that belong to one service, with the name of the
+# Route attribute that maps them to another service's IDs
+SENDER_FIELDS = {
+    "email_reply_to_id": "email_reply_to_ids",
+    "sms_sender_id": "sms_sender_ids",
+}
+# The settings in GOVUK_NOTIFY_API_KEYS passed on to each key's Route
+ROUTE_OPTIONS = ("templates",) + tuple(SENDER_FIELDS.values())
+
+_usage = {}
+_lock = threading.Lock()
+
+
+class KeyUsage:
+    """Thread-safe counts of the requests made with one API key in this process."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.sent = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<KeyUsage: %d in flight, %d sent, %d failed>" % (
+            self.in_flight,
+            self.sent,
+            self.failed,
+        )
+
+    @property
+    def requests(self):
+        return self.sent + self.failed
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, ok):
+        with self._lock:
+            self.in_flight -= 1
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+
+    @contextmanager
+    def track(self):
+        """Count a request made in the block, as failed if it raises."""
+        self.started()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.finished(ok)
+
+
+def get_usage(api_key):
+    """Return the process-wide usage counters for an API key."""
+    with _lock:
+        usage = _usage.get(api_key)
+        if usage is None:
+            usage = _usage[api_key] = KeyUsage()
+        return usage
+
+
+def clear_usage():
+    """Forget the usage counters of every API key."""
+    with _lock:
+        _usage.clear()
+
+
+class Route:
+    """
+    One Notify service to send through: its API key, and the client, rate limiter,
+    priority scheduler, circuit breaker and usage counters that go with it.
+
+    `templates` maps template IDs used in code to the IDs of the same templates in
+    this service, for strategies that may send a template through any service.
+    `email_reply_to_ids` and `sms_sender_ids` do the same for reply-to addresses
+    and text message senders.
+    """
+
+    def __init__(
+        self,
+        name,
+        api_key,
+        client,
+        rate_limiter=None,
+        scheduler=None,
+        circuit_breaker=None,
+        templates=None,
+        email_reply_to_ids=None,
+        sms_sender_ids=None,
+    ):
+        self.name = name
+        self.api_key = api_key
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.scheduler = scheduler
+        self.circuit_breaker = circuit_breaker
+        self.templates = templates or {}
+        self.email_reply_to_ids = email_reply_to_ids or {}
+        self.sms_sender_ids = sms_sender_ids or {}
+        self.usage = get_usage(api_key)
+
+    def __repr__(self):
+        return "<Route %s>" % self.name
+
+    @property
+    def available(self):
+        """False if the route's circuit breaker is open."""
+        return self.circuit_breaker is None or self.circuit_breaker.state != OPEN
+
+    async def aavailable(self):
+        """Like `available`, but reads a shared breaker without blocking."""
+        return (
+            self.circuit_breaker is None or await self.circuit_breaker.astate() != OPEN
+        )
+
+    def maps_senders(self, message):
+        """
+        Return whether this service has its own ID for each reply-to address or
+        text message sender the message uses.
+        """
+        return all(
+            message[field] in getattr(self, ids)
+            for field, ids in SENDER_FIELDS.items()
+            if message.get(field)
+        )
+
+    def translate(self, message):
+        """
+        Return a rendered message with this service's IDs for its template, reply-to
+        address and text message sender.
+        """
+        changes = {}
+        template_id = self.templates.get(message["template_id"])
+        if template_id is not None:
+            changes["template_id"] = template_id
+        for field, ids in SENDER_FIELDS.items():
+            sender_id = getattr(self, ids).get(message.get(field))
+            if sender_id is not None:
+                changes[field] = sender_id
+        return dict(message, **changes) if changes else message
+
+
+def parse_api_keys(api_keys):
+    """
+    Return (name, API key, options) tuples from the GOVUK_NOTIFY_API_KEYS setting,
+    where options are keyword arguments for the key's Route.
+
+    The setting is a dict of names to API keys, or to dicts with an "api_key" and
+    optionally "templates", "email_reply_to_ids" and "sms_sender_ids", or a plain
+    list of API keys, named by their position.
+    """
+    if isinstance(api_keys, (list, tuple)):
+        api_keys = {str(index): api_key for index, api_key in enumerate(api_keys)}
+    if not api_keys:
+        raise ImproperlyConfigured("GOVUK_NOTIFY_API_KEYS must not be empty.")
+    parsed = []
+    for name, config in api_keys.items():
+        if isinstance(config, str):
+            config = {"api_key": config}
+        if "api_key" not in config:
+            raise ImproperlyConfigured(
+                "No api_key for %r in GOVUK_NOTIFY_API_KEYS." % name
+            )
+        options = {
+            option: config[option] for option in ROUTE_OPTIONS if option in config
+        }
+        parsed.append((name, config["api_key"], options))
+    return parsed
+
+
+class Router:
+    """
+    Choose which of several Notify services to send each request through.
+
+    Notify's rate and daily limits apply to each service, so spreading requests
+    over several services raises the total that can be sent. The strategies are:
+
+    - "hash": the recipient's address picks the service, so each recipient is
+      always sent to through the same one
+    - "least_used": the service with the fewest requests in flight, and then the
+      fewest made, skipping those whose circuit breaker is open
+    - "template": the service named for the message's template in
+      `template_routes`, or else the first, so that each service (for example,
+      each tenant's) sends only its own templates
+
+    IDs used in code, for reply-to addresses and text message senders, are those
+    of the first service. With "hash" and "least_used", a message using one is only
+    sent through the first service and those that map it to their own ID.
+    """
+
+    def __init__(self, routes, strategy=HASH, template_routes=None):
+        if strategy not in STRATEGIES:
+            raise ImproperlyConfigured(
+                "Unknown routing strategy %r; use one of %s."
+                % (strategy, ", ".join(STRATEGIES))
+            )
+        self.routes = list(routes)
+        self.strategy = strategy
+        self.by_name = {route.name: route for route in self.routes}
+        self.template_routes = template_routes or {}
+        for name in self.template_routes.values():
+            if name not in self.by_name:
+                raise ImproperlyConfigured(
+                    "GOVUK_NOTIFY_TEMPLATE_ROUTES names an unknown route, %r." % name
+                )
+
+    def route(self, recipient, message):
+        """Return the Route to send a rendered message to a recipient through."""
+        if self.strategy == HASH:
+            routes = self._senders(message)
+            index = zlib.crc32(recipient.encode()) % len(routes)
+            return routes[index]
+        if self.strategy == LEAST_USED:
+            senders = self._senders(message)
+            return self._least_used(
+                senders, [route for route in senders if route.available]
+            )
+        name = self.template_routes.get(message["template_id"])
+        return self.by_name[name] if name else self.routes[0]
+
+    async def aroute(self, recipient, message):
+        """
+        Like `route`, but checks circuit breakers shared through a cache without
+        blocking the event loop.
+        """
+        if self.strategy != LEAST_USED:
+            return self.route(recipient, message)
+        senders = self._senders(message)
+        return self._least_used(
+            senders, [route for route in senders if await route.aavailable()]
+        )
+
+    def _least_used(self, senders, available):
+        return min(
+            available or senders,
+            key=lambda route: (route.usage.in_flight, route.usage.requests),
+        )
+
+    def _senders(self, message):
+        """Return the routes that can send a message's reply-to address or sender."""
+        if not any(message.get(field) for field in SENDER_FIELDS):
+            return self.routes
+        return [self.routes[0]] + [
+            route for route in self.routes[1:] if route.maps_senders(message)
+        ]
@@ -0,0 +1,36 @@
+from django.dispatch import Signal
+
+# All signals are sent with the backend class as the sender. Receivers should be
+# quick, as they run on the sending thread; when nothing is connected, sending a
+# signal costs next to nothing.
+
+# Before each API request (including retries), with `recipient` and `message`, the
+# rendered message dict.
+notification_sending = Signal()
+
+# When a recipient has been dealt with, with `result`, a DeliveryResult whose
+# `latency` covers every attempt, and `message`.
+notification_sent = Signal()
+
+# When a request has failed and will be retried, with `recipient`, `message`,
+# `error`, `attempt` (the number of the attempt that failed) and `delay` (seconds).
+notification_retrying = Signal()
+
+# When the rate limiter held up a request, with `recipient`, `message` and `waited`
+# (seconds).
+notification_rate_limited = Signal()
+
+# After each call to send_messages, with `results` (as returned by
+# send_messages_detailed) and `timings`, a dict of the seconds spent converting
+# messages into payloads (`convert`), rendering their message dicts (`render`),
+# checking them against their templates (`validate`), waiting for the backend's
+# lock (`lock_wait`), opening the backend (`connect`) and sending (`send`).
+messages_sent = Signal()
+
+# When a circuit breaker changes state, with `breaker`, `old_state` and `new_state`
+# (one of "closed", "open" and "half-open"). The sender is the CircuitBreaker class.
+circuit_state_changed = Signal()
+
+# When an adaptive concurrency limiter changes its limit, with `limiter`,
+# `old_limit` and `new_limit`. The sender is the AdaptiveLimiter class.
+concurrency_limit_changed = Signal()
@@ -0,0 +1,145 @@
+from django.db import connections, router
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from django_gov_notify.backends import NotifyEmailBackend
+from django_gov_notify.clients import api_key_id
+from django_gov_notify.models import NotificationStatus, StatusSyncState
+from django_gov_notify.routing import parse_api_keys
+
+# Statuses that Notify will not change again. Any other status, such as "created"
+# or "sending", is still pending.
+FINAL_STATUSES = frozenset(
+    [
+        "delivered",
+        "sent",
+        "permanent-failure",
+        "temporary-failure",
+        "technical-failure",
+        "received",
+        "cancelled",
+        "validation-failed",
+        "virus-scan-failed",
+    ]
+)
+
+UPDATE_FIELDS = [
+    "reference",
+    "recipient",
+    "notification_type",
+    "template_id",
+    "status",
+    "created_at",
+    "sent_at",
+    "completed_at",
+    "updated_at",
+]
+
+
+def is_final(status):
+    return status in FINAL_STATUSES
+
+
+def to_model(notification):
+    """Build an unsaved NotificationStatus from a notification in Notify's listing."""
+    template = notification.get("template") or {}
+    return NotificationStatus(
+        notification_id=notification["id"],
+        reference=notification.get("reference") or "",
+        recipient=(
+            notification.get("email_address") or notification.get("phone_number") or ""
+        ),
+        notification_type=notification.get("type") or "",
+        template_id=template.get("id"),
+        status=notification["status"],
+        created_at=parse_datetime(notification["created_at"]),
+        sent_at=notification.get("sent_at") and parse_datetime(notification["sent_at"]),
+        completed_at=(
+            notification.get("completed_at")
+            and parse_datetime(notification["completed_at"])
+        ),
+    )
+
+
+def sync_statuses(backend=None, template_type=None, full=False):
+    """
+    Copy the status of recent notifications from Notify into NotificationStatus
+    rows, and return the number of notifications fetched.
+
+    Notify lists notifications a page at a time, newest first, and each page is
+    saved with a single bulk upsert before the next is fetched, so memory use does
+    not grow with the number of notifications. The sync then records a high-water
+    mark: the creation time of the oldest notification that was still pending, or
+    else of the newest notification seen. The next sync stops once it passes that
+    mark, because everything older had already reached a final status, so a
+    regular sync only fetches the pages that have changed. Pass `full=True` to
+    ignore the mark, and fetch everything Notify still holds.
+
+    `template_type` is "email", "sms" or "letter", or None for all notifications.
+    If the backend sends through several API keys, each is synced in turn, as each
+    service lists only its own notifications. Each API key and type keeps its own
+    mark. Requests are retried with the backend's retry policy.
+    """
+    if backend is None:
+        backend = NotifyEmailBackend()
+    if backend.api_keys:
+        api_keys = [
+            api_key for name, api_key, options in parse_api_keys(backend.api_keys)
+        ]
+    else:
+        api_keys = [backend.api_key]
+    return sum(_sync_key(backend, api_key, template_type, full) for api_key in api_keys)
+
+
+def _sync_key(backend, api_key, template_type, full):
+    """Sync the notifications sent with one API key, and return the number fetched."""
+    key = "%s:%s" % (
+        api_key_id(api_key),
+        template_type or "all",
+    )
+    state, _ = StatusSyncState.objects.get_or_create(key=key)
+    mark = None if full else state.high_water_mark
+    client = backend._get_client(api_key)
+
+    def fetch(older_than):
+        return client.get_all_notifications(
+            template_type=template_type, older_than=older_than
+        )
+
+    # MySQL and MariaDB upsert on any unique key, and reject a named one
+    connection = connections[router.db_for_write(NotificationStatus)]
+    unique_fields = None
+    if connection.features.supports_update_conflicts_with_target:
+        unique_fields = ["notification_id"]
+
+    count = 0
+    newest = None
+    oldest_pending = None
+    older_than = None
+    while True:
+        response = backend.retry_policy.call(fetch, older_than)
+        rows = [to_model(notification) for notification in response["notifications"]]
+        if not rows:
+            break
+        NotificationStatus.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=UPDATE_FIELDS,
+        )
+        count += len(rows)
+        if newest is None:
+            newest = rows[0].created_at
+        for row in rows:
+            if not is_final(row.status):
+                oldest_pending = row.created_at
+        if mark is not None and rows[-1].created_at < mark:
+            break
+        if not response.get("links", {}).get("next"):
+            break
+        older_than = str(rows[-1].notification_id)
+
+    state.high_water_mark = oldest_pending or newest or state.high_water_mark
+    state.last_synced_at = timezone.now()
+    state.save()
+    return count
@@ -0,0 +1,226 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+import requests
+from notifications_python_client.errors import APIError
+from urllib3.exceptions import NewConnectionError
+
+from django_gov_notify.backends import NotifyEmailBackend
+from django_gov_notify.circuitbreaker import CircuitOpenError
+from django_gov_notify.priority import lane
+from django_gov_notify.results import QUEUED, SKIPPED, DeliveryResult, all_queued
+from django_gov_notify.retry import is_overload
+
+try:
+    from celery import shared_task
+except ImportError:  # pragma: no cover
+    shared_task = None
+
+logger = logging.getLogger(__name__)
+
+
+def send_task_payload(payload):
+    """
+    Send a task payload made by TaskNotifyEmailBackend, from a worker, and return a
+    summary of the recipients sent and failed.
+
+    The payload is a dict with a rendered `message`, a list of sanitized
+    `recipients` and the `priority` to send them with. It is sent with a
+    NotifyEmailBackend configured by the worker's settings. Failed recipients are
+    reported rather than raised, so that a task queue retrying the task does not
+    send again to the recipients that succeeded; those that Notify is known not to
+    have accepted, and may accept later, are also listed as `retryable`. Failures
+    are logged, as task queues often discard what a task returns.
+    """
+    backend = NotifyEmailBackend(fail_silently=True, circuit_fallback=None)
+    # Payloads queued before priorities were recorded have none
+    with lane(payload.get("priority") or backend.priority):
+        results = backend._send_rendered(
+            backend._connect(), payload["recipients"], payload["message"]
+        )
+    failed = [result for result in results if not result.sent]
+    if failed:
+        # Recipients' addresses are personal data, so are not logged
+        logger.warning(
+            "Could not send template %s to %d of %d recipients: %s",
+            payload["message"].get("template_id"),
+            len(failed),
+            len(results),
+            failed[0].error,
+        )
+    return {
+        "sent": len(results) - len(failed),
+        "failed": [result.recipient for result in failed],
+        "retryable": [result.recipient for result in failed if _is_retryable(result)],
+    }
+
+
+def _is_retryable(result):
+    """
+    Return whether a failed recipient may be sent again without risk of sending
+    twice: it was never attempted, Notify answered with a rate limit (429) or server
+    (5xx) error, or the connection could not be made.
+
+    A request that timed out or lost its connection after it was sent may have been
+    accepted by Notify, which would send it again, so it is not retried.
+    """
+    if result.status == SKIPPED or isinstance(result.error, CircuitOpenError):
+        return True
+    error = result.error
+    if not isinstance(error, APIError):
+        return False
+    if error.response is None:
+        return _never_connected(error.__cause__)
+    return is_overload(error)
+
+
+def _never_connected(error):
+    """Return whether a requests exception was raised before anything was sent."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # A refused connection is a ConnectionError wrapping urllib3's
+    # NewConnectionError; one dropped after sending wraps a ProtocolError instead
+    reason = getattr(error.args[0], "reason", None) if error and error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(
+        reason, NewConnectionError
+    )
+
+
+def retry_task_payload(task, payload):
+    """
+    Send a task payload from a bound Celery task, and retry the task with just the
+    retryable recipients, up to GOVUK_NOTIFY_TASK_MAX_RETRIES times (default 3),
+    with an increasing delay.
+
+    Retrying with only the recipients that failed does not send again to those
+    that succeeded, and recipients whose request may have reached Notify without
+    an answer, such as after a read timeout, are not retried at all.
+    """
+    summary = send_task_payload(payload)
+    max_retries = getattr(settings, "GOVUK_NOTIFY_TASK_MAX_RETRIES", 3)
+    if summary["retryable"] and task.request.retries < max_retries:
+        raise task.retry(
+            args=(dict(payload, recipients=summary["retryable"]),),
+            countdown=60 * 2**task.request.retries,
+            max_retries=max_retries,
+        )
+    return summary
+
+
+send_notify_task = None
+if shared_task is not None:
+    # Found by Celery's autodiscover_tasks(), as this module is called tasks.py
+    send_notify_task = shared_task(
+        bind=True, name="django_gov_notify.send_task_payload"
+    )(retry_task_payload)
+
+
+class SyncRunner:
+    """Send each payload straight away, in this process. Useful in tests."""
+
+    def submit(self, payload):
+        return send_task_payload(payload)
+
+
+class ThreadedRunner:
+    """
+    Send payloads in the background, on a pool of threads shared by the process.
+
+    The pool has `GOVUK_NOTIFY_MAX_WORKERS` threads, or at least 4. Payloads still
+    waiting are lost if the process exits, so use a task queue where that matters.
+    """
+
+    _executor = None
+    _lock = threading.Lock()
+
+    def submit(self, payload):
+        return self.get_executor().submit(send_task_payload, payload)
+
+    @classmethod
+    def get_executor(cls):
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=max(
+                        4, getattr(settings, "GOVUK_NOTIFY_MAX_WORKERS", 1)
+                    ),
+                    thread_name_prefix="govuk-notify",
+                )
+            return cls._executor
+
+
+class CeleryRunner:
+    """
+    Send payloads with a Celery task, on the queue named by the
+    GOVUK_NOTIFY_TASK_QUEUE setting, or Celery's default queue.
+    """
+
+    def __init__(self):
+        if send_notify_task is None:
+            raise ImproperlyConfigured(
+                "CeleryRunner requires Celery; install django-gov-notify[celery]."
+            )
+        self.queue = getattr(settings, "GOVUK_NOTIFY_TASK_QUEUE", None)
+
+    def submit(self, payload):
+        options = {"queue": self.queue} if self.queue else {}
+        return send_notify_task.apply_async(args=(payload,), **options)
+
+
+def get_runner():
+    """Return an instance of the runner named by the GOVUK_NOTIFY_TASK_RUNNER setting."""
+    path = getattr(
+        settings, "GOVUK_NOTIFY_TASK_RUNNER", "django_gov_notify.tasks.SyncRunner"
+    )
+    return import_string(path)()
+
+
+class TaskNotifyEmailBackend(NotifyEmailBackend):
+    """
+    An email backend that hands messages to a task runner instead of sending them,
+    so that sending can be spread across a pool of workers.
+
+    Each message is rendered, then split into payloads of at most
+    GOVUK_NOTIFY_TASK_CHUNK_SIZE recipients, which are small JSON-serializable
+    dicts. The runner named by GOVUK_NOTIFY_TASK_RUNNER passes each payload to
+    `send_task_payload`, which sends it with a NotifyEmailBackend.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.runner = kwargs.pop("runner", None) or get_runner()
+        self.chunk_size = kwargs.pop(
+            "chunk_size", getattr(settings, "GOVUK_NOTIFY_TASK_CHUNK_SIZE", 100)
+        )
+        super().__init__(*args, **kwargs)
+
+    def enqueue(self, recipients, message, priority=None):
+        """Hand a rendered message dict for the given recipients to the runner."""
+        for start in range(0, len(recipients), self.chunk_size):
+            self.runner.submit(
+                {
+                    "message": message,
+                    "recipients": recipients[start : start + self.chunk_size],
+                    "priority": priority or self.priority,
+                }
+            )
+
+    def send_messages(self, email_messages):
+        """Hand messages to the task runner, and return the number queued."""
+        results = self.send_messages_detailed(email_messages)
+        return sum(1 for message_results in results if all_queued(message_results))
+
+    def send_messages_detailed(self, email_messages):
+        if not email_messages:
+            return []
+
+        for email_message, recipients, message in self._prepare(email_messages):
+            self.enqueue(recipients, message, self._priority(email_message))
+            email_message.notify_results = [
+                DeliveryResult(recipient, QUEUED) for recipient in recipients
+            ]
+        return [email_message.notify_results for email_message in email_messages]
@@ -0,0 +1,193 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+# ((name)) or, for optional content, ((name??text to show if name is true))
+PLACEHOLDER = re.compile(r"\(\(([^()]+?)\)\)")
+
+
+def normalise(name):
+    """Normalise a placeholder name the way Notify does, ignoring case and spacing."""
+    return "".join(name.split()).replace("_", "").replace("-", "").lower()
+
+
+def placeholders(text):
+    """Return the names of the placeholders in a template's text, in order."""
+    names = []
+    for match in PLACEHOLDER.finditer(text or ""):
+        name = match.group(1).split("??", 1)[0].strip()
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def template_placeholders(template):
+    """Return the placeholder names in a template's subject and body."""
+    names = placeholders(template.get("subject"))
+    names += [name for name in placeholders(template.get("body")) if name not in names]
+    return names
+
+
+# The values for which Notify shows a conditional ((name??text)), ignoring case
+TRUE_VALUES = frozenset(["yes", "y", "true", "t", "1"])
+
+
+def is_true(value):
+    """Return whether a personalisation value shows a conditional ((name??text))."""
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def render(text, personalisation):
+    """
+    Substitute personalisation values into a template's text, as Notify does.
+
+    Names are matched ignoring case and spacing, conditional placeholders show
+    their text when the value is true, and lists become bulleted lines.
+    Placeholders without a value are left as they are.
+    """
+    values = {normalise(key): value for key, value in (personalisation or {}).items()}
+
+    def replace(match):
+        name, _, conditional = match.group(1).partition("??")
+        key = normalise(name)
+        if key not in values:
+            return match.group(0)
+        value = values[key]
+        if conditional:
+            return conditional if is_true(value) else ""
+        if isinstance(value, (list, tuple)):
+            return "\n".join("* %s" % item for item in value)
+        return str(value)
+
+    return PLACEHOLDER.sub(replace, text or "")
+
+
+def render_template(template, personalisation):
+    """Render a template's subject and body, returning a dict of both."""
+    return {
+        "subject": render(template.get("subject"), personalisation),
+        "body": render(template.get("body"), personalisation),
+    }
+
+
+def local_template(template_id):
+    """
+    Return a template defined in the GOVUK_NOTIFY_TEMPLATES setting, or the plain
+    template, or None if the template is only known to Notify.
+    """
+    definitions = getattr(settings, "GOVUK_NOTIFY_TEMPLATES", {})
+    if template_id in definitions:
+        template = dict(definitions[template_id], id=template_id)
+    elif template_id == getattr(settings, "GOVUK_NOTIFY_PLAIN_EMAIL_TEMPLATE_ID", None):
+        template = {"id": template_id, "subject": "((subject))", "body": "((body))"}
+    else:
+        return None
+    template["placeholders"] = template_placeholders(template)
+    return template
+
+
+def get_template(client, template_id):
+    """
+    Return a template's definition, from the GOVUK_NOTIFY_TEMPLATES setting if it is
+    there, or else from Notify through the template cache.
+    """
+    return local_template(template_id) or get_template_cache().get(client, template_id)
+
+
+def validate_personalisation(template, personalisation):
+    """
+    Check a personalisation dict has a value for each of a template's placeholders,
+    raising ValueError if any are missing.
+    """
+    provided = {normalise(key) for key in personalisation or {}}
+    missing = [
+        name for name in template["placeholders"] if normalise(name) not in provided
+    ]
+    if missing:
+        raise ValueError(
+            "Missing personalisation for template %s: %s"
+            % (template["id"], ", ".join(missing))
+        )
+
+
+class TemplateCache:
+    """
+    Cache Notify template definitions, fetched with the client's get_template.
+
+    Each entry holds the template's `id`, `subject`, `body` and `placeholders`, for
+    `ttl` seconds. Entries are kept in this process, evicting the least recently
+    used beyond `maxsize`, or in a Django cache if `cache_alias` is given.
+    """
+
+    def __init__(self, ttl=300, maxsize=128, cache_alias=None, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.cache = caches[cache_alias] if cache_alias else None
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, client, template_id):
+        template = self._get(template_id)
+        if template is None:
+            response = client.get_template(template_id)
+            template = {
+                "id": template_id,
+                "subject": response.get("subject"),
+                "body": response.get("body"),
+            }
+            template["placeholders"] = template_placeholders(template)
+            self._set(template_id, template)
+        return template
+
+    def _get(self, template_id):
+        if self.cache is not None:
+            return self.cache.get("govuk-notify-template:%s" % template_id)
+        with self._lock:
+            entry = self._entries.get(template_id)
+            if entry is None:
+                return None
+            expires, template = entry
+            if expires < self.clock():
+                del self._entries[template_id]
+                return None
+            self._entries.move_to_end(template_id)
+            return template
+
+    def _set(self, template_id, template):
+        if self.cache is not None:
+            self.cache.set("govuk-notify-template:%s" % template_id, template, self.ttl)
+            return
+        with self._lock:
+            self._entries[template_id] = (self.clock() + self.ttl, template)
+            self._entries.move_to_end(template_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        if self.cache is not None:
+            # Entries in a shared cache expire by themselves
+            return
+        with self._lock:
+            self._entries.clear()
+
+
+_template_cache = None
+_lock = threading.Lock()
+
+
+def get_template_cache():
+    """Return the process-wide TemplateCache, configured from settings."""
+    global _template_cache
+    with _lock:
+        if _template_cache is None:
+            _template_cache = TemplateCache(
+                ttl=getattr(settings, "GOVUK_NOTIFY_TEMPLATE_CACHE_TTL", 300),
+                maxsize=getattr(settings, "GOVUK_NOTIFY_TEMPLATE_CACHE_SIZE", 128),
+                cache_alias=getattr(settings, "GOVUK_NOTIFY_TEMPLATE_CACHE", None),
+            )
+        return _template_cache
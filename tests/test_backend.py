@@ -1,17 +1,33 @@
+import json
+import threading
+import time
+import unittest
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from unittest import mock
 
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, send_mail, send_mass_mail
 from django.test import TestCase, override_settings
 
-from django_gov_notify.backends import NotifyEmailBackend
+from notifications_python_client.errors import HTTPError
+
+from django_gov_notify.backends import AsyncNotifyEmailBackend, NotifyEmailBackend
+from django_gov_notify.clients import close_clients
 from django_gov_notify.message import NotifyEmailMessage
+from django_gov_notify.results import FAILED, SENT, SKIPPED
 from tests.fixtures import NotifyEmailMessageFactory
 
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
 
-@mock.patch("django_gov_notify.backends.NotificationsAPIClient")
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
 class EmailBackendTest(TestCase):
     def setUp(self):
+        self.addCleanup(close_clients)
         self.backend = NotifyEmailBackend(govuk_notify_api_key="not a real key")
 
     @override_settings(GOVUK_NOTIFY_API_KEY="fake settings key")
@@ -114,7 +130,7 @@ class EmailBackendTest(TestCase):
             message.send()
 
 
-@mock.patch("django_gov_notify.backends.NotificationsAPIClient")
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
 @override_settings(
     EMAIL_BACKEND="django_gov_notify.backends.NotifyEmailBackend",
     GOVUK_NOTIFY_API_KEY="not_a_real_key",  # pragma: allowlist secret
@@ -122,6 +138,9 @@ class EmailBackendTest(TestCase):
 class DjangoInternalEmailAPITest(TestCase):
     """Tests of the django.core.send_mail function with the Notifications Backend"""
 
+    def setUp(self):
+        self.addCleanup(close_clients)
+
     def send_mail(self, **kwargs):
         options = {
             "subject": "Test Subject",
@@ -194,3 +213,378 @@ class DjangoInternalEmailAPITest(TestCase):
         self.assertEqual(self.send_mail(to=["a@example.com", "b@example.com"]), 1)
         # …even though two emails have been sent
         self.assertEqual(len(mock_client().send_email_notification.mock_calls), 2)
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class ConcurrentEmailBackendTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+        self.backend = NotifyEmailBackend(
+            govuk_notify_api_key="not a real key", max_workers=4
+        )
+
+    @override_settings(GOVUK_NOTIFY_MAX_WORKERS=8)
+    def test_max_workers_setting(self, mock_client):
+        self.assertEqual(NotifyEmailBackend().max_workers, 8)
+
+    def test_sequential_by_default(self, mock_client):
+        self.assertEqual(NotifyEmailBackend().max_workers, 1)
+
+    def test_every_recipient_is_sent(self, mock_client):
+        messages = [
+            NotifyEmailMessageFactory(
+                to=["%d-%d@example.com" % (i, j) for j in range(5)]
+            )
+            for i in range(10)
+        ]
+        self.assertEqual(self.backend.send_messages(messages), 10)
+        sent_to = sorted(
+            kwargs["email_address"]
+            for name, args, kwargs in mock_client().send_email_notification.mock_calls
+        )
+        self.assertEqual(
+            sent_to,
+            sorted("%d-%d@example.com" % (i, j) for i in range(10) for j in range(5)),
+        )
+
+    def test_recipients_are_submitted_in_a_bounded_window(self, mock_client):
+        mock_client().send_email_notification.side_effect = lambda **kwargs: time.sleep(
+            0.001
+        )
+        recipients = ["%d@example.com" % i for i in range(100)]
+        message = NotifyEmailMessageFactory(to=recipients)
+        submitted = []
+        outstanding = []
+        submit = ThreadPoolExecutor.submit
+
+        def track(executor, *args, **kwargs):
+            outstanding.append(sum(1 for future in submitted if not future.done()))
+            submitted.append(submit(executor, *args, **kwargs))
+            return submitted[-1]
+
+        with mock.patch.object(ThreadPoolExecutor, "submit", track):
+            self.assertEqual(self.backend.send_messages([message]), 1)
+        self.assertEqual(len(submitted), 100)
+        # No more than twice max_workers are queued or in flight
+        self.assertLessEqual(max(outstanding), 8)
+        self.assertEqual([r.recipient for r in message.notify_results], recipients)
+
+    def test_message_without_recipients_is_not_counted(self, mock_client):
+        messages = [
+            NotifyEmailMessageFactory(to=["a@example.com"]),
+            NotifyEmailMessageFactory(),
+        ]
+        self.assertEqual(self.backend.send_messages(messages), 1)
+
+    def test_failed_recipient_raises(self, mock_client):
+        mock_client().send_email_notification.side_effect = Exception("Boom")
+        with self.assertRaises(Exception):
+            self.backend.send_messages(
+                [NotifyEmailMessageFactory(to=["a@example.com"])]
+            )
+
+    def test_failed_recipient_fails_silently(self, mock_client):
+        def send(email_address, **kwargs):
+            if email_address == "bad@example.com":
+                raise Exception("Boom")
+
+        mock_client().send_email_notification.side_effect = send
+        self.backend.fail_silently = True
+        messages = [
+            NotifyEmailMessageFactory(to=["good@example.com", "bad@example.com"]),
+            NotifyEmailMessageFactory(to=["good@example.com"]),
+        ]
+        self.assertEqual(self.backend.send_messages(messages), 1)
+        self.assertEqual(len(mock_client().send_email_notification.mock_calls), 3)
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class PlainEmailMessageTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def test_sent_without_conversion(self, mock_client):
+        message = EmailMessage(
+            "Hello", "Body", "from@example.com", ["a@example.com", "b@example.com"]
+        )
+        with mock.patch(
+            "django_gov_notify.message.NotifyEmailMessage.__init__"
+        ) as init:
+            self.assertEqual(NotifyEmailBackend().send_messages([message]), 1)
+        init.assert_not_called()
+        self.assertEqual(mock_client().send_email_notification.call_count, 2)
+        self.assertEqual(len(message.notify_results), 2)
+
+    def test_invalid_message_fails_silently(self, mock_client):
+        invalid = EmailMessage(
+            "Hello", "Body", to=["a@example.com"], cc=["b@example.com"]
+        )
+        valid = EmailMessage("Hello", "Body", to=["c@example.com"])
+        backend = NotifyEmailBackend(fail_silently=True)
+        self.assertEqual(backend.send_messages([invalid, valid]), 1)
+        self.assertEqual(
+            [result.status for result in invalid.notify_results], [FAILED, FAILED]
+        )
+        self.assertEqual(mock_client().send_email_notification.call_count, 1)
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class CoalescingTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def test_send_mass_mail_counts(self, mock_client):
+        datatuples = [
+            ("Newsletter", "Same body", None, ["a@example.com", "b@example.com"]),
+            ("Other", "Different body", None, ["c@example.com"]),
+            ("Newsletter", "Same body", None, ["c@example.com", "a@example.com"]),
+        ]
+        connection = NotifyEmailBackend()
+        with mock.patch.object(
+            connection, "_send_rendered", wraps=connection._send_rendered
+        ) as send_rendered:
+            self.assertEqual(send_mass_mail(datatuples, connection=connection), 3)
+        self.assertEqual(send_rendered.call_count, 2)
+        self.assertEqual(
+            send_rendered.call_args_list[0].args[1],
+            ["a@example.com", "b@example.com", "c@example.com", "a@example.com"],
+        )
+        self.assertEqual(mock_client().send_email_notification.call_count, 5)
+
+    def test_results_are_returned_to_their_messages(self, mock_client):
+        def send(email_address, **kwargs):
+            if email_address == "bad@example.com":
+                raise Exception("Boom")
+            return {"id": email_address}
+
+        mock_client().send_email_notification.side_effect = send
+        first = NotifyEmailMessageFactory(to=["a@example.com", "bad@example.com"])
+        second = NotifyEmailMessageFactory(to=["b@example.com", "a@example.com"])
+        backend = NotifyEmailBackend(fail_silently=True, max_workers=3)
+        self.assertEqual(backend.send_messages([first, second]), 1)
+        self.assertEqual(
+            [r.recipient for r in first.notify_results],
+            ["a@example.com", "bad@example.com"],
+        )
+        self.assertEqual(
+            [r.recipient for r in second.notify_results],
+            ["b@example.com", "a@example.com"],
+        )
+        self.assertFalse(first.notify_results[1].sent)
+
+    def test_results_are_returned_when_sending_raises(self, mock_client):
+        mock_client().send_email_notification.side_effect = [{"id": "1"}, Exception()]
+        first = NotifyEmailMessageFactory(to=["a@example.com"])
+        second = NotifyEmailMessageFactory(to=["b@example.com"])
+        with self.assertRaises(Exception):
+            NotifyEmailBackend().send_messages([first, second])
+        self.assertEqual(len(first.notify_results), 1)
+        self.assertEqual(len(second.notify_results), 1)
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class DeadlineTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def slow_send(self, email_address, **kwargs):
+        time.sleep(0.05)
+        return {"id": email_address}
+
+    def test_recipients_after_deadline_are_skipped(self, mock_client):
+        mock_client().send_email_notification.side_effect = self.slow_send
+        first = NotifyEmailMessageFactory(to=["a@example.com", "b@example.com"])
+        second = NotifyEmailMessageFactory(
+            to=["%d@example.com" % i for i in range(10)], subject="Other"
+        )
+        backend = NotifyEmailBackend(send_deadline=0.12)
+        self.assertEqual(backend.send_messages([first, second]), 1)
+        self.assertEqual([r.status for r in first.notify_results], [SENT, SENT])
+        statuses = [r.status for r in second.notify_results]
+        self.assertEqual(len(statuses), 10)
+        self.assertEqual(statuses[-1], SKIPPED)
+        self.assertEqual(statuses, sorted(statuses, key=[SENT, SKIPPED].index))
+        self.assertLess(mock_client().send_email_notification.call_count, 12)
+
+    @override_settings(GOVUK_NOTIFY_SEND_DEADLINE=0)
+    def test_deadline_setting(self, mock_client):
+        message = NotifyEmailMessageFactory(to=["a@example.com"])
+        for backend in [NotifyEmailBackend(), NotifyEmailBackend(max_workers=4)]:
+            with self.subTest(max_workers=backend.max_workers):
+                self.assertEqual(backend.send_messages([message]), 0)
+                self.assertEqual(message.notify_results[0].status, SKIPPED)
+        mock_client().send_email_notification.assert_not_called()
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class SharedBackendTest(TestCase):
+    """One backend instance shared between many threads."""
+
+    def setUp(self):
+        self.addCleanup(close_clients)
+        self.lock = threading.Lock()
+        self.sent_to = []
+        self.in_flight = 0
+        self.most_in_flight = 0
+
+    def send(self, email_address, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        time.sleep(0.001)
+        with self.lock:
+            self.in_flight -= 1
+            self.sent_to.append(email_address)
+        return {"id": email_address}
+
+    def run_threads(self, target, count):
+        threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_counts_under_contention(self, mock_client):
+        mock_client().send_email_notification.side_effect = self.send
+        backend = NotifyEmailBackend(rate_limit=None)
+        counts = {}
+        closing = threading.Event()
+
+        def send_batches(i):
+            counts[i] = 0
+            for j in range(20):
+                messages = [
+                    NotifyEmailMessageFactory(
+                        to=["%d-%d-%d@example.com" % (i, j, k) for k in range(2)]
+                    ),
+                    NotifyEmailMessageFactory(),
+                ]
+                counts[i] += backend.send_messages(messages)
+
+        def keep_closing():
+            while not closing.is_set():
+                backend.close()
+                time.sleep(0.001)
+
+        closer = threading.Thread(target=keep_closing)
+        closer.start()
+        try:
+            self.run_threads(send_batches, 16)
+        finally:
+            closing.set()
+            closer.join()
+
+        self.assertEqual(counts, {i: 20 for i in range(16)})
+        self.assertEqual(len(self.sent_to), 16 * 20 * 2)
+        self.assertEqual(len(set(self.sent_to)), 16 * 20 * 2)
+        self.assertGreater(self.most_in_flight, 1)
+
+    def test_threads_send_in_parallel(self, mock_client):
+        mock_client().send_email_notification.side_effect = self.send
+        backend = NotifyEmailBackend(rate_limit=None)
+        backend.open()
+        self.run_threads(
+            lambda i: backend.send_messages(
+                [NotifyEmailMessageFactory(to=["%d@example.com" % i])]
+            ),
+            8,
+        )
+        self.assertEqual(len(self.sent_to), 8)
+        self.assertGreater(self.most_in_flight, 1)
+
+
+@unittest.skipIf(httpx is None, "httpx is not installed")
+class AsyncEmailBackendTest(TestCase):
+    def setUp(self):
+        self.requests = []
+        self.status_code = 201
+        # Notify API keys end with the service ID and the secret, both UUIDs
+        api_key = "test_key-%s-%s" % (uuid.uuid4(), uuid.uuid4())
+        self.backend = AsyncNotifyEmailBackend(govuk_notify_api_key=api_key)
+        self.backend.async_client = httpx.AsyncClient(
+            base_url="https://notify.example.com",
+            transport=httpx.MockTransport(self.handle),
+        )
+
+    def handle(self, request):
+        self.requests.append(request)
+        return httpx.Response(self.status_code, json={"id": "fake-id"})
+
+    async def test_asend_messages(self):
+        messages = [
+            NotifyEmailMessageFactory(to=["a@example.com", "b@example.com"]),
+            NotifyEmailMessageFactory(to=["c@example.com"]),
+        ]
+        self.assertEqual(await self.backend.asend_messages(messages), 2)
+        self.assertEqual(len(self.requests), 3)
+        request = self.requests[0]
+        self.assertEqual(request.url.path, "/v2/notifications/email")
+        self.assertTrue(request.headers["Authorization"].startswith("Bearer "))
+        self.assertEqual(
+            json.loads(request.content),
+            {
+                "email_address": "a@example.com",
+                "template_id": settings.GOVUK_NOTIFY_PLAIN_EMAIL_TEMPLATE_ID,
+                "personalisation": {
+                    "subject": "Test Subject",
+                    "body": "Test body content",
+                },
+            },
+        )
+
+    @mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+    @mock.patch("django_gov_notify.templates.get_template_cache")
+    async def test_templates_are_checked_off_the_event_loop(
+        self, mock_cache, mock_client
+    ):
+        self.addCleanup(close_clients)
+        threads = []
+
+        def get(client, template_id):
+            threads.append(threading.get_ident())
+            return {"id": template_id, "placeholders": ["name"]}
+
+        mock_cache().get.side_effect = get
+        self.backend.validate_templates = True
+        message = NotifyEmailMessage(
+            to=["a@example.com"],
+            template_id="43573f75-80e7-402f-b308-e5f1c2a0eca8",
+            personalisation={"name": "A"},
+        )
+        self.assertEqual(await self.backend.asend_messages([message]), 1)
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+    async def test_limits_are_set_up_once(self):
+        with mock.patch.object(
+            self.backend, "_get_router", wraps=self.backend._get_router
+        ) as get_router:
+            for _ in range(3):
+                await self.backend.asend_messages(
+                    [NotifyEmailMessageFactory(to=["a@example.com"])]
+                )
+        get_router.assert_called_once()
+
+    async def test_message_asend_uses_connection(self):
+        message = NotifyEmailMessageFactory(
+            to=["a@example.com"], connection=self.backend
+        )
+        self.assertEqual(await message.asend(), 1)
+        self.assertEqual(len(self.requests), 1)
+
+    async def test_api_error_raises(self):
+        self.status_code = 400
+        with self.assertRaises(HTTPError):
+            await self.backend.asend_messages(
+                [NotifyEmailMessageFactory(to=["a@example.com"])]
+            )
+
+    async def test_api_error_fails_silently(self):
+        self.status_code = 500
+        self.backend.fail_silently = True
+        self.assertEqual(
+            await self.backend.asend_messages(
+                [NotifyEmailMessageFactory(to=["a@example.com"])]
+            ),
+            0,
+        )
@@ -0,0 +1,102 @@
+import uuid
+from unittest import mock
+
+from django.test import TestCase
+
+from django_gov_notify.backends import NotifyEmailBackend
+from django_gov_notify.clients import close_clients
+from django_gov_notify.message import NotifyBulkMessage
+
+TEMPLATE_ID = "43573f75-80e7-402f-b308-e5f1066fbd6f"
+
+
+def rows(count):
+    for index in range(count):
+        yield "user-%d@example.com" % index, {"name": "User %d" % index}
+
+
+class NotifyBulkMessageTest(TestCase):
+    def test_template_id_is_required(self):
+        with self.assertRaises(ValueError):
+            NotifyBulkMessage(None, [])
+
+    def test_bad_template_id(self):
+        with self.assertRaises(ValueError):
+            NotifyBulkMessage("foo", [])
+        with self.assertRaises(TypeError):
+            NotifyBulkMessage(uuid.uuid4(), [])
+
+    def test_bad_email_reply_to_id(self):
+        with self.assertRaises(ValueError):
+            NotifyBulkMessage(TEMPLATE_ID, [], email_reply_to_id="foo")
+
+    def test_rows_are_not_read_until_sent(self):
+        generator = rows(3)
+        NotifyBulkMessage(TEMPLATE_ID, generator)
+        self.assertEqual(next(generator)[0], "user-0@example.com")
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class SendBulkTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def test_send(self, mock_client):
+        message = NotifyBulkMessage(TEMPLATE_ID, rows(3))
+        self.assertEqual(message.send(), 3)
+        mock_client().send_email_notification.assert_has_calls(
+            [
+                mock.call(
+                    email_address="user-%d@example.com" % index,
+                    template_id=TEMPLATE_ID,
+                    personalisation={"name": "User %d" % index},
+                )
+                for index in range(3)
+            ]
+        )
+
+    def test_email_reply_to_id(self, mock_client):
+        reply_to_id = str(uuid.uuid4())
+        NotifyEmailBackend().send_bulk(
+            TEMPLATE_ID, [("a@example.com", None)], email_reply_to_id=reply_to_id
+        )
+        mock_client().send_email_notification.assert_called_once_with(
+            email_address="a@example.com",
+            template_id=TEMPLATE_ID,
+            personalisation={},
+            email_reply_to_id=reply_to_id,
+        )
+
+    def test_concurrent_send(self, mock_client):
+        backend = NotifyEmailBackend(max_workers=4)
+        self.assertEqual(backend.send_bulk(TEMPLATE_ID, rows(100)), 100)
+        self.assertEqual(mock_client().send_email_notification.call_count, 100)
+
+    def test_rows_are_read_lazily(self, mock_client):
+        read = []
+
+        def tracked_rows():
+            for row in rows(100):
+                read.append(row)
+                # No more than 2 * max_workers rows are read ahead of those sent
+                self.assertLessEqual(
+                    len(read) - mock_client().send_email_notification.call_count, 9
+                )
+                yield row
+
+        backend = NotifyEmailBackend(max_workers=4)
+        self.assertEqual(backend.send_bulk(TEMPLATE_ID, tracked_rows()), 100)
+
+    def test_failure_raises(self, mock_client):
+        mock_client().send_email_notification.side_effect = Exception("Boom")
+        with self.assertRaises(Exception):
+            NotifyEmailBackend(max_workers=4).send_bulk(TEMPLATE_ID, rows(10))
+
+    def test_failure_fails_silently(self, mock_client):
+        def send(email_address, **kwargs):
+            if email_address == "user-1@example.com":
+                raise Exception("Boom")
+
+        mock_client().send_email_notification.side_effect = send
+        backend = NotifyEmailBackend(fail_silently=True)
+        self.assertEqual(backend.send_bulk(TEMPLATE_ID, rows(3)), 2)
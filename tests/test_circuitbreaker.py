@@ -0,0 +1,235 @@
+import asyncio
+import threading
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from notifications_python_client.errors import HTTP503Error, HTTPError
+
+from django_gov_notify.backends import NotifyEmailBackend
+from django_gov_notify.circuitbreaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+from django_gov_notify.clients import close_clients
+from django_gov_notify.models import OutboxMessage
+from django_gov_notify.results import FAILED, QUEUED
+from django_gov_notify.signals import circuit_state_changed
+from tests.fixtures import NotifyEmailMessageFactory
+
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "circuit-tests",
+    }
+}
+
+
+def fail(*args, **kwargs):
+    raise HTTP503Error(message="Connection refused")
+
+
+class CircuitBreakerTest(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.breaker = CircuitBreaker(
+            "key", failure_threshold=2, reset_timeout=30, clock=lambda: self.now
+        )
+        self.changes = []
+
+        def record(sender, old_state, new_state, **kwargs):
+            self.changes.append((old_state, new_state))
+
+        circuit_state_changed.connect(record)
+        self.addCleanup(circuit_state_changed.disconnect, record)
+
+    def test_opens_after_threshold(self):
+        for _ in range(2):
+            with self.assertRaises(HTTP503Error):
+                self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, OPEN)
+        func = mock.Mock()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(func)
+        func.assert_not_called()
+        self.assertEqual(self.changes, [(CLOSED, OPEN)])
+
+    def test_success_resets_failure_count(self):
+        with self.assertRaises(HTTP503Error):
+            self.breaker.call(fail)
+        self.breaker.call(mock.Mock())
+        with self.assertRaises(HTTP503Error):
+            self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_client_errors_do_not_count(self):
+        error = HTTPError(mock.Mock(status_code=400))
+        for _ in range(3):
+            with self.assertRaises(HTTPError):
+                self.breaker.call(mock.Mock(side_effect=error))
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_half_open_trial(self):
+        for _ in range(2):
+            with self.assertRaises(HTTP503Error):
+                self.breaker.call(fail)
+        self.now = 31
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+        # Only one trial at a time
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(
+            self.changes, [(CLOSED, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, CLOSED)]
+        )
+
+    def test_failed_trial_reopens(self):
+        for _ in range(2):
+            with self.assertRaises(HTTP503Error):
+                self.breaker.call(fail)
+        self.now = 31
+        with self.assertRaises(HTTP503Error):
+            self.breaker.call(fail)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.now = 60
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_receivers_can_read_state(self):
+        states = []
+
+        def record(sender, breaker, **kwargs):
+            states.append(breaker.state)
+
+        circuit_state_changed.connect(record)
+        self.addCleanup(circuit_state_changed.disconnect, record)
+        self.breaker.record_failure()
+        thread = threading.Thread(target=self.breaker.record_failure, daemon=True)
+        thread.start()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(states, [OPEN])
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_cache_read_outside_lock(self):
+        breaker = CircuitBreaker("unlocked", cache_alias="default")
+        self.addCleanup(breaker.cache.clear)
+        locked = []
+        get = breaker.cache.get
+
+        def cache_get(*args, **kwargs):
+            locked.append(breaker._lock.locked())
+            return get(*args, **kwargs)
+
+        with mock.patch.object(breaker.cache, "get", cache_get):
+            self.assertTrue(breaker.allow())
+            self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(locked, [False, False])
+
+    def test_cancelled_trial_is_released(self):
+        async def cancelled():
+            raise asyncio.CancelledError
+
+        for _ in range(2):
+            with self.assertRaises(HTTP503Error):
+                self.breaker.call(fail)
+        self.now = 31
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(self.breaker.acall(cancelled))
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_shared_through_cache(self):
+        first = CircuitBreaker("shared", failure_threshold=2, cache_alias="default")
+        second = CircuitBreaker("shared", failure_threshold=2, cache_alias="default")
+        self.addCleanup(first.cache.clear)
+        with self.assertRaises(HTTP503Error):
+            first.call(fail)
+        with self.assertRaises(HTTP503Error):
+            second.call(fail)
+        self.assertEqual(first.state, OPEN)
+        self.assertFalse(second.allow())
+        first.cache.delete(first.key + ":open")
+        self.assertEqual(second.state, HALF_OPEN)
+
+    async def test_async_does_not_block_on_the_cache(self):
+        breaker = CircuitBreaker("key", failure_threshold=1)
+        blocking = ["get", "add", "incr", "set", "delete"]
+        breaker.cache = mock.Mock(
+            **{"%s.side_effect" % name: AssertionError for name in blocking}
+        )
+        for name in blocking:
+            setattr(breaker.cache, "a" + name, mock.AsyncMock(return_value=1))
+        breaker.cache.aget.return_value = None
+
+        async def ok():
+            return "response"
+
+        async def afail():
+            fail()
+
+        self.assertEqual(await breaker.acall(ok), "response")
+        breaker.cache.adelete.assert_awaited_with(breaker.key + ":failures")
+        with self.assertRaises(HTTP503Error):
+            await breaker.acall(afail)
+        breaker.cache.aset.assert_awaited_with(breaker.key + ":open", True, 30)
+        breaker.cache.aget.return_value = True
+        self.assertEqual(await breaker.astate(), OPEN)
+
+
+@override_settings(GOVUK_NOTIFY_CIRCUIT_FAILURE_THRESHOLD=2)
+@mock.patch("django_gov_notify.retry.time.sleep")
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class BackendCircuitBreakerTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+        patcher = mock.patch.dict("django_gov_notify.circuitbreaker._breakers")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def message(self):
+        return NotifyEmailMessageFactory(
+            to=["%d@example.com" % index for index in range(5)]
+        )
+
+    def test_disabled_by_default(self, mock_client, mock_sleep):
+        with self.settings(GOVUK_NOTIFY_CIRCUIT_FAILURE_THRESHOLD=None):
+            backend = NotifyEmailBackend()
+            backend.open()
+        self.assertIsNone(backend.circuit_breaker)
+
+    def test_fails_fast_when_open(self, mock_client, mock_sleep):
+        mock_client().send_email_notification.side_effect = fail
+        message = self.message()
+        backend = NotifyEmailBackend(fail_silently=True, retry_max_attempts=1)
+        self.assertEqual(backend.send_messages([message]), 0)
+        self.assertEqual(mock_client().send_email_notification.call_count, 2)
+        self.assertEqual([r.status for r in message.notify_results], [FAILED] * 5)
+        self.assertIsInstance(message.notify_results[4].error, CircuitOpenError)
+
+    def test_open_breaker_stops_retries(self, mock_client, mock_sleep):
+        mock_client().send_email_notification.side_effect = fail
+        backend = NotifyEmailBackend(retry_max_attempts=5)
+        with self.assertRaises(CircuitOpenError):
+            backend.send_messages([self.message()])
+        self.assertEqual(mock_client().send_email_notification.call_count, 2)
+
+    @override_settings(
+        GOVUK_NOTIFY_CIRCUIT_FALLBACK="django_gov_notify.outbox.OutboxNotifyEmailBackend"
+    )
+    def test_fallback_backend(self, mock_client, mock_sleep):
+        mock_client().send_email_notification.side_effect = fail
+        message = self.message()
+        backend = NotifyEmailBackend(fail_silently=True, retry_max_attempts=1)
+        backend.send_messages([message])
+        self.assertEqual(
+            [r.status for r in message.notify_results], [FAILED] * 2 + [QUEUED] * 3
+        )
+        self.assertEqual(
+            sorted(row.recipients[0] for row in OutboxMessage.objects.all()),
+            ["2@example.com", "3@example.com", "4@example.com"],
+        )
@@ -0,0 +1,78 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from django_gov_notify.backends import NotifyEmailBackend
+from django_gov_notify.clients import api_key_id, close_clients, get_client
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class ClientRegistryTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def test_client_is_shared_per_api_key(self, mock_client):
+        mock_client.side_effect = lambda api_key: mock.Mock()
+        self.assertIs(get_client("key one"), get_client("key one"))
+        self.assertIsNot(get_client("key one"), get_client("key two"))
+        self.assertEqual(mock_client.call_count, 2)
+
+    def test_pool_size(self, mock_client):
+        client = get_client("key one", pool_size=25)
+        name, (prefix, adapter), kwargs = client.request_session.mount.mock_calls[0]
+        self.assertEqual(prefix, "https://")
+        self.assertEqual(adapter._pool_maxsize, 25)
+
+    def test_backends_share_a_client(self, mock_client):
+        first = NotifyEmailBackend(govuk_notify_api_key="key one")
+        second = NotifyEmailBackend(govuk_notify_api_key="key one")
+        first.open()
+        second.open()
+        self.assertIs(first.client, second.client)
+        mock_client.assert_called_once_with("key one")
+
+    def test_close_releases_client(self, mock_client):
+        backend = NotifyEmailBackend(govuk_notify_api_key="key one")
+        backend.open()
+        backend.close()
+        self.assertIsNone(backend.client)
+
+    def test_close_clients(self, mock_client):
+        client = get_client("key one")
+        close_clients()
+        client.request_session.close.assert_called_once_with()
+        get_client("key one")
+        self.assertEqual(mock_client.call_count, 2)
+
+    def test_base_url(self, mock_client):
+        mock_client.side_effect = lambda api_key, **kwargs: mock.Mock()
+        get_client("key one", base_url="http://localhost:8000")
+        mock_client.assert_called_once_with("key one", base_url="http://localhost:8000")
+        self.assertIsNot(
+            get_client("key one", base_url="http://localhost:8000"),
+            get_client("key one"),
+        )
+
+    def test_timeout(self, mock_client):
+        mock_client.side_effect = lambda api_key, **kwargs: mock.Mock()
+        get_client("key one", timeout=(2, 10))
+        mock_client.assert_called_once_with("key one", timeout=(2, 10))
+        self.assertIsNot(get_client("key one", timeout=(2, 10)), get_client("key one"))
+
+    @override_settings(GOVUK_NOTIFY_CONNECT_TIMEOUT=2, GOVUK_NOTIFY_READ_TIMEOUT=10)
+    def test_timeout_settings(self, mock_client):
+        NotifyEmailBackend().open()
+        mock_client.assert_called_once_with("not a real API key", timeout=(2, 10))
+
+    def test_read_timeout_only(self, mock_client):
+        NotifyEmailBackend(read_timeout=5).open()
+        mock_client.assert_called_once_with("not a real API key", timeout=(30, 5))
+
+
+class APIKeyIDTest(TestCase):
+    def test_id_hides_the_key(self):
+        key_id = api_key_id("secret key")
+        self.assertEqual(key_id, api_key_id("secret key"))
+        self.assertNotEqual(key_id, api_key_id("other key"))
+        self.assertEqual(len(key_id), 16)
+        self.assertNotIn("secret", key_id)
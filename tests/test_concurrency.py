@@ -0,0 +1,144 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from notifications_python_client.errors import HTTP503Error, HTTPError
+
+from django_gov_notify import metrics, signals
+from django_gov_notify.backends import NotifyEmailBackend
+from django_gov_notify.clients import close_clients
+from django_gov_notify.concurrency import AdaptiveLimiter, is_overload
+from django_gov_notify.priority import BULK, PriorityScheduler
+from tests.fixtures import NotifyEmailMessageFactory
+
+
+def api_error(status_code):
+    return HTTPError(mock.Mock(status_code=status_code))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class AdaptiveLimiterTest(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def limiter(self, **kwargs):
+        return AdaptiveLimiter(clock=self.clock, **kwargs)
+
+    def test_is_overload(self):
+        self.assertTrue(is_overload(api_error(429)))
+        self.assertTrue(is_overload(api_error(500)))
+        self.assertTrue(is_overload(HTTP503Error(message="Connection refused")))
+        self.assertFalse(is_overload(api_error(400)))
+        self.assertFalse(is_overload(ValueError()))
+
+    def test_additive_increase(self):
+        limiter = self.limiter(initial_limit=4)
+        for _ in range(6):
+            limiter.record(0.1, in_flight=4)
+        self.assertEqual(limiter.limit, 5)
+
+    def test_no_increase_while_the_limit_is_not_used(self):
+        limiter = self.limiter(initial_limit=10)
+        for _ in range(50):
+            limiter.record(0.1, in_flight=1)
+        self.assertEqual(limiter.limit, 10)
+
+    def test_increase_stops_at_max_limit(self):
+        limiter = self.limiter(initial_limit=2, max_limit=3)
+        for _ in range(50):
+            limiter.record(0.1)
+        self.assertEqual(limiter.limit, 3)
+
+    def test_slow_responses_decrease_once_per_round_trip(self):
+        limiter = self.limiter(initial_limit=20)
+        limiter.record(0.1)
+        self.clock.now += 1
+        # Requests that all started before the first slow answer came back
+        for _ in range(5):
+            limiter.record(0.5)
+        self.assertEqual(limiter.limit, 18)
+        self.clock.now += 1
+        limiter.record(0.5)
+        self.assertEqual(limiter.limit, 16)
+
+    def test_overload_halves_the_limit(self):
+        limiter = self.limiter(initial_limit=20, min_limit=8)
+        limiter.record(0.1, error=api_error(429))
+        self.assertEqual(limiter.limit, 10)
+        self.clock.now += 1
+        limiter.record(0.1, error=api_error(503))
+        self.assertEqual(limiter.limit, 8)
+
+    def test_bad_requests_are_ignored(self):
+        limiter = self.limiter(initial_limit=20)
+        limiter.record(0.1, error=api_error(400))
+        self.assertEqual(limiter.limit, 20)
+        self.assertIsNone(limiter.baseline)
+
+    def test_signal(self):
+        receiver = mock.Mock()
+        signals.concurrency_limit_changed.connect(receiver)
+        self.addCleanup(signals.concurrency_limit_changed.disconnect, receiver)
+        limiter = self.limiter(initial_limit=4)
+        limiter.record(0.1, error=api_error(429))
+        receiver.assert_called_once_with(
+            signal=signals.concurrency_limit_changed,
+            sender=AdaptiveLimiter,
+            limiter=limiter,
+            old_limit=4,
+            new_limit=2,
+        )
+
+    def test_prometheus_gauge(self):
+        metrics.enable()
+        self.addCleanup(metrics.disable)
+        self.limiter(key="abc", initial_limit=4).record(0.1, error=api_error(429))
+        self.assertIn(
+            'govuk_notify_concurrency_limit{key="abc"} 2', metrics.render_prometheus()
+        )
+
+
+class SchedulerConcurrencyTest(TestCase):
+    def test_admits_up_to_the_adaptive_limit(self):
+        concurrency = AdaptiveLimiter(initial_limit=2)
+        scheduler = PriorityScheduler(concurrency=concurrency)
+        scheduler.acquire(BULK)
+        scheduler.acquire(BULK)
+        self.assertFalse(scheduler._can_admit(object()))
+        scheduler.release(0.1, api_error(429))
+        self.assertEqual(scheduler.limit, 1)
+        self.assertEqual(scheduler.in_flight, 1)
+
+
+@mock.patch("django_gov_notify.retry.time.sleep")
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class BackendConcurrencyTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def test_rate_limit_errors_lower_the_limit(self, mock_client, mock_sleep):
+        mock_client().send_email_notification.side_effect = [api_error(429), {}]
+        backend = NotifyEmailBackend(
+            govuk_notify_api_key="adaptive key",
+            adaptive_concurrency=True,
+            max_in_flight=40,
+        )
+        backend.open()
+        self.assertEqual(backend.concurrency_limit, 10)
+        self.assertEqual(backend.scheduler.concurrency.max_limit, 40)
+        backend.send_messages([NotifyEmailMessageFactory(to=["a@example.com"])])
+        self.assertEqual(backend.concurrency_limit, 5)
+        self.assertEqual(backend.scheduler.in_flight, 0)
+
+    def test_fixed_limit(self, mock_client, mock_sleep):
+        backend = NotifyEmailBackend(govuk_notify_api_key="fixed key", max_in_flight=3)
+        backend.open()
+        self.assertEqual(backend.concurrency_limit, 3)
+        self.assertIsNone(backend.scheduler.concurrency)
@@ -0,0 +1,90 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from django_gov_notify.backends import NotifyEmailBackend
+from django_gov_notify.clients import close_clients
+from django_gov_notify.dedup import CacheDedupStore, make_reference, with_reference
+from django_gov_notify.results import DUPLICATE, SENT
+from tests.fixtures import NotifyEmailMessageFactory
+
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "dedup-tests",
+    }
+}
+
+
+class ReferenceTest(TestCase):
+    def test_reference_is_deterministic(self):
+        message = {"template_id": "abc", "personalisation": {"a": 1, "b": 2}}
+        reordered = {"personalisation": {"b": 2, "a": 1}, "template_id": "abc"}
+        self.assertEqual(
+            make_reference("a@example.com", message),
+            make_reference("a@example.com", reordered),
+        )
+        self.assertNotEqual(
+            make_reference("a@example.com", message),
+            make_reference("b@example.com", message),
+        )
+
+    def test_supplied_reference_is_kept(self):
+        message = {"template_id": "abc", "reference": "invoice-1"}
+        self.assertEqual(with_reference("a@example.com", message), message)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, GOVUK_NOTIFY_DEDUP_CACHE="default")
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class BackendDedupTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def tearDown(self):
+        from django.core.cache import cache
+
+        cache.clear()
+
+    def test_dedup_store_from_settings(self, mock_client):
+        self.assertIsInstance(NotifyEmailBackend().dedup_store, CacheDedupStore)
+
+    def test_replay_only_sends_to_new_recipients(self, mock_client):
+        mock_client().send_email_notification.return_value = {"id": "notification-1"}
+        first = NotifyEmailMessageFactory(to=["a@example.com"])
+        NotifyEmailBackend().send_messages([first])
+
+        replay = NotifyEmailMessageFactory(to=["a@example.com", "b@example.com"])
+        self.assertEqual(NotifyEmailBackend().send_messages([replay]), 1)
+        self.assertEqual(mock_client().send_email_notification.call_count, 2)
+        duplicate, sent = replay.notify_results
+        self.assertEqual(duplicate.status, DUPLICATE)
+        self.assertEqual(duplicate.notification_id, "notification-1")
+        self.assertEqual(sent.status, SENT)
+
+    def test_generated_reference_is_sent(self, mock_client):
+        NotifyEmailBackend().send_messages(
+            [NotifyEmailMessageFactory(to=["a@example.com"])]
+        )
+        name, args, kwargs = mock_client().send_email_notification.mock_calls[0]
+        self.assertEqual(len(kwargs["reference"]), 64)
+
+    def test_failed_recipient_is_not_remembered(self, mock_client):
+        mock_client().send_email_notification.side_effect = [Exception("Boom"), {}]
+        backend = NotifyEmailBackend(fail_silently=True)
+        self.assertEqual(
+            backend.send_messages([NotifyEmailMessageFactory(to=["a@example.com"])]), 0
+        )
+        self.assertEqual(
+            backend.send_messages([NotifyEmailMessageFactory(to=["a@example.com"])]), 1
+        )
+
+    def test_supplied_reference_is_used(self, mock_client):
+        message = NotifyEmailMessageFactory(
+            to=["a@example.com", "b@example.com"], reference="invoice-1"
+        )
+        NotifyEmailBackend().send_messages([message])
+        references = [
+            kwargs["reference"]
+            for name, args, kwargs in mock_client().send_email_notification.mock_calls
+        ]
+        self.assertEqual(references, ["invoice-1", "invoice-1"])
@@ -0,0 +1,153 @@
+import io
+from unittest import mock
+
+from django.test import TestCase
+
+from django_gov_notify.backends import NotifyEmailBackend
+from django_gov_notify.clients import close_clients
+from django_gov_notify.jobs import (
+    FINISHED,
+    BatchJob,
+    read_csv,
+    read_rows,
+    write_csv,
+    write_rows,
+)
+from django_gov_notify.results import SENT
+from tests.fixtures import NotifyEmailMessageFactory
+
+TEMPLATE_ID = "43573f75-80e7-402f-b308-e5f1066fbd6f"
+
+
+def rows(count):
+    for index in range(count):
+        yield "user-%d@example.com" % index, {"name": "User %d" % index}
+
+
+class CSVTest(TestCase):
+    def test_write_csv(self):
+        output = io.StringIO()
+        self.assertEqual(write_csv(rows(2), output, chunk_size=1), 2)
+        self.assertEqual(
+            output.getvalue().splitlines(),
+            [
+                "email address,name",
+                "user-0@example.com,User 0",
+                "user-1@example.com,User 1",
+            ],
+        )
+
+    def test_round_trip(self):
+        output = io.StringIO()
+        write_csv(rows(3), output)
+        output.seek(0)
+        self.assertEqual(list(read_csv(output)), list(rows(3)))
+
+
+class RowsTest(TestCase):
+    def test_round_trip_keeps_types_and_keys(self):
+        written = [
+            ("a@example.com", {"items": ["x", "y"], "flag": True}),
+            ("b@example.com", {"items": [], "extra": "z"}),
+            ("c@example.com", None),
+        ]
+        output = io.StringIO()
+        self.assertEqual(write_rows(written, output), 3)
+        output.seek(0)
+        self.assertEqual(
+            list(read_rows(output)),
+            [
+                ("a@example.com", {"items": ["x", "y"], "flag": True}),
+                ("b@example.com", {"items": [], "extra": "z"}),
+                ("c@example.com", {}),
+            ],
+        )
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class BatchJobTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def test_run(self, mock_client):
+        progress = []
+        job = BatchJob(TEMPLATE_ID, rows(5), chunk_size=2)
+        self.assertEqual(
+            job.run(on_progress=lambda job: progress.append(job.progress)), 5
+        )
+        self.assertEqual(job.status, FINISHED)
+        self.assertEqual((job.total, job.processed, job.sent), (5, 5, 5))
+        self.assertEqual(progress, [0.4, 0.8, 1.0])
+        mock_client().send_email_notification.assert_any_call(
+            email_address="user-4@example.com",
+            template_id=TEMPLATE_ID,
+            personalisation={"name": "User 4"},
+        )
+
+    def test_spooling_keeps_personalisation(self, mock_client):
+        job = BatchJob(
+            TEMPLATE_ID,
+            [
+                ("a@example.com", {"items": ["x", "y"], "flag": True}),
+                ("b@example.com", {"items": ["z"], "flag": False, "extra": 1}),
+            ],
+        )
+        self.assertEqual(job.run(), 2)
+        self.assertEqual(
+            [
+                call.kwargs["personalisation"]
+                for call in mock_client().send_email_notification.call_args_list
+            ],
+            [
+                {"items": ["x", "y"], "flag": True},
+                {"items": ["z"], "flag": False, "extra": 1},
+            ],
+        )
+
+    def test_failures_can_be_resent(self, mock_client):
+        def send(email_address, **kwargs):
+            if email_address == "user-1@example.com":
+                raise Exception("Boom")
+
+        mock_client().send_email_notification.side_effect = send
+        connection = NotifyEmailBackend(fail_silently=True, max_workers=2)
+        job = BatchJob(TEMPLATE_ID, rows(3), connection=connection)
+        self.assertEqual(job.run(), 2)
+        self.assertEqual(job.failed, 1)
+        job.failures.seek(0)
+        self.assertEqual(
+            list(read_rows(job.failures)), [("user-1@example.com", {"name": "User 1"})]
+        )
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class BatchThresholdTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def test_large_message_is_sent_as_job(self, mock_client):
+        backend = NotifyEmailBackend(batch_threshold=3, max_workers=2)
+        small = NotifyEmailMessageFactory(to=["a@example.com"], subject="Other")
+        large = NotifyEmailMessageFactory(
+            to=["user-%d@example.com" % index for index in range(5)]
+        )
+        self.assertEqual(backend.send_messages([large, small]), 2)
+        self.assertFalse(hasattr(small, "notify_job"))
+        self.assertEqual(large.notify_job.status, FINISHED)
+        self.assertEqual(large.notify_job.sent, 5)
+        self.assertEqual(len(large.notify_results), 5)
+        self.assertTrue(all(result.status == SENT for result in large.notify_results))
+        self.assertEqual(mock_client().send_email_notification.call_count, 6)
+
+    def test_identical_small_messages_are_sent_as_job(self, mock_client):
+        backend = NotifyEmailBackend(batch_threshold=3)
+        messages = [
+            NotifyEmailMessageFactory(to=["user-%d@example.com" % index])
+            for index in range(3)
+        ]
+        self.assertEqual(backend.send_messages(messages), 3)
+        self.assertIs(messages[0].notify_job, messages[2].notify_job)
+        self.assertEqual(messages[0].notify_job.sent, 3)
+        for index, message in enumerate(messages):
+            (result,) = message.notify_results
+            self.assertEqual(result.recipient, "user-%d@example.com" % index)
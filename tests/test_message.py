@@ -1,8 +1,15 @@
 import uuid
 
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.mail.message import sanitize_address
 from django.test import TestCase, override_settings
 
-from django_gov_notify.message import NotifyEmailMessage
+from django_gov_notify.message import (
+    NotifyEmailMessage,
+    NotifyPayload,
+    sanitize_recipient,
+)
 from tests.fixtures import NotifyEmailMessageFactory
 
 
@@ -129,3 +136,75 @@ class EmailMessageTest(TestCase):
         uuid_email_reply_to_id = uuid.uuid4()
         with self.assertRaises(TypeError):
             NotifyEmailMessageFactory(email_reply_to_id=uuid_email_reply_to_id)
+
+    def test_reference_not_included_if_not_supplied(self):
+        message = NotifyEmailMessageFactory().message()
+        self.assertNotIn("reference", message)
+
+    def test_custom_reference(self):
+        message = NotifyEmailMessageFactory(reference="invoice-1").message()
+        self.assertEqual(message["reference"], "invoice-1")
+
+    def test_non_string_reference(self):
+        with self.assertRaises(TypeError):
+            NotifyEmailMessageFactory(reference=1)
+
+
+class NotifyPayloadTest(TestCase):
+    def test_from_notify_email_message(self):
+        message = NotifyEmailMessageFactory(
+            to=["Ann <a@example.com>"], reference="invoice-1"
+        )
+        payload = NotifyPayload.from_email_message(message)
+        self.assertEqual(payload.recipients, ["Ann <a@example.com>"])
+        self.assertEqual(payload.message(), message.message())
+
+    def test_from_plain_email_message(self):
+        message = EmailMessage(
+            "Hello", "Body", "from@example.com", ["a@example.com"], headers={"X": "1"}
+        )
+        payload = NotifyPayload.from_email_message(message)
+        self.assertEqual(
+            payload.message(),
+            {
+                "template_id": settings.GOVUK_NOTIFY_PLAIN_EMAIL_TEMPLATE_ID,
+                "personalisation": {"subject": "Hello", "body": "Body"},
+            },
+        )
+        self.assertEqual(payload.recipients, ["a@example.com"])
+
+    def test_plain_email_message_is_validated(self):
+        for kwargs in [
+            {"cc": ["b@example.com"]},
+            {"bcc": ["b@example.com"]},
+            {"attachments": [("foo.txt", "Foo", "text/plain")]},
+            {"body": ""},
+        ]:
+            with self.subTest(**kwargs):
+                message = EmailMessage(
+                    **dict(
+                        {"subject": "Hi", "body": "Body", "to": ["a@example.com"]},
+                        **kwargs
+                    )
+                )
+                with self.assertRaises(ValueError):
+                    NotifyPayload.from_email_message(message)
+
+    def test_sanitize_recipient_matches_django(self):
+        for address in [
+            "a@example.com",
+            "First.Last+tag@Sub.Example.co.uk",
+            "Ann <a@example.com>",
+            "ann@exämple.com",
+            "a.@example.com",
+            '"quoted"@example.com',
+        ]:
+            with self.subTest(address=address):
+                self.assertEqual(
+                    sanitize_recipient(address, "utf-8"),
+                    sanitize_address(address, "utf-8"),
+                )
+
+    def test_slots(self):
+        payload = NotifyPayload("id", {}, ["a@example.com"])
+        self.assertFalse(hasattr(payload, "__dict__"))
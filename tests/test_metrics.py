@@ -0,0 +1,128 @@
+import itertools
+from unittest import mock
+
+from django.test import TestCase
+
+from notifications_python_client.errors import HTTPError
+
+from django_gov_notify import metrics, signals
+from django_gov_notify.backends import NotifyEmailBackend
+from django_gov_notify.clients import close_clients
+from django_gov_notify.results import SENT
+from tests.fixtures import NotifyEmailMessageFactory
+
+
+@mock.patch("django_gov_notify.retry.time.sleep")
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class SignalsTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+        self.backend = NotifyEmailBackend(govuk_notify_api_key="not a real key")
+
+    def connect(self, signal):
+        receiver = mock.Mock()
+        signal.connect(receiver)
+        self.addCleanup(signal.disconnect, receiver)
+        return receiver
+
+    def test_notification_signals(self, mock_client, mock_sleep):
+        sending = self.connect(signals.notification_sending)
+        sent = self.connect(signals.notification_sent)
+        self.backend.send_messages([NotifyEmailMessageFactory(to=["a@example.com"])])
+        sending.assert_called_once_with(
+            signal=signals.notification_sending,
+            sender=NotifyEmailBackend,
+            recipient="a@example.com",
+            message=mock.ANY,
+        )
+        result = sent.call_args.kwargs["result"]
+        self.assertEqual(result.status, SENT)
+
+    def test_retrying_signal(self, mock_client, mock_sleep):
+        retrying = self.connect(signals.notification_retrying)
+        error = HTTPError(mock.Mock(status_code=500, headers={}))
+        mock_client().send_email_notification.side_effect = [error, {}]
+        self.backend.send_messages([NotifyEmailMessageFactory(to=["a@example.com"])])
+        kwargs = retrying.call_args.kwargs
+        self.assertEqual(kwargs["error"], error)
+        self.assertEqual(kwargs["attempt"], 1)
+
+    def test_messages_sent_timings(self, mock_client, mock_sleep):
+        messages_sent = self.connect(signals.messages_sent)
+        self.backend.send_messages([NotifyEmailMessageFactory(to=["a@example.com"])])
+        timings = messages_sent.call_args.kwargs["timings"]
+        self.assertEqual(
+            set(timings),
+            {"convert", "render", "validate", "lock_wait", "connect", "send"},
+        )
+
+    def test_messages_sent_timings_are_separate(self, mock_client, mock_sleep):
+        messages_sent = self.connect(signals.messages_sent)
+        clock = itertools.count()
+        message = NotifyEmailMessageFactory(to=["a@example.com"])
+        with mock.patch(
+            "django_gov_notify.backends.time.perf_counter",
+            side_effect=lambda: next(clock),
+        ):
+            self.backend.send_messages([message])
+        timings = messages_sent.call_args.kwargs["timings"]
+        # Each step reads the clock once between the previous step and the next
+        self.assertEqual(
+            [timings[key] for key in ["convert", "render", "validate", "lock_wait"]],
+            [1, 1, 1, 1],
+        )
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+        metrics.enable()
+        self.addCleanup(metrics.disable)
+        for metric in metrics.METRICS:
+            metric.values.clear()
+
+    def test_sends_are_counted(self, mock_client):
+        def send(email_address, **kwargs):
+            if email_address == "bad@example.com":
+                raise Exception("Boom")
+
+        mock_client().send_email_notification.side_effect = send
+        message = NotifyEmailMessageFactory(to=["a@example.com", "bad@example.com"])
+        NotifyEmailBackend(fail_silently=True).send_messages([message])
+        self.assertEqual(metrics.notifications.values, {("sent",): 1, ("failed",): 1})
+        ((counts, total),) = metrics.latency.values.values()
+        self.assertEqual(sum(counts), 2)
+
+    def test_render_prometheus(self, mock_client):
+        metrics.notifications.inc("sent")
+        metrics.latency.observe(0.2, "template-1")
+        text = metrics.render_prometheus()
+        self.assertIn("# TYPE govuk_notify_notifications_total counter", text)
+        self.assertIn('govuk_notify_notifications_total{status="sent"} 1', text)
+        self.assertIn(
+            'govuk_notify_send_seconds_bucket{template_id="template-1",le="0.25"} 1',
+            text,
+        )
+        self.assertIn(
+            'govuk_notify_send_seconds_bucket{template_id="template-1",le="0.1"} 0',
+            text,
+        )
+        self.assertIn(
+            'govuk_notify_send_seconds_count{template_id="template-1"} 1', text
+        )
+
+    def test_statsd_exporter(self, mock_client):
+        exporter = metrics.StatsdExporter(prefix="test")
+        exporter.socket = mock.Mock()
+        exporter.connect()
+        self.addCleanup(signals.notification_sent.disconnect, exporter.on_sent)
+        self.addCleanup(signals.notification_retrying.disconnect, exporter.on_retrying)
+        self.addCleanup(
+            signals.notification_rate_limited.disconnect, exporter.on_rate_limited
+        )
+        NotifyEmailBackend().send_messages(
+            [NotifyEmailMessageFactory(to=["a@example.com"])]
+        )
+        packets = [call.args[0] for call in exporter.socket.sendto.mock_calls]
+        self.assertIn(b"test.notifications.sent:1|c", packets)
@@ -0,0 +1,127 @@
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from django_gov_notify.clients import close_clients
+from django_gov_notify.models import OutboxMessage
+from django_gov_notify.outbox import OutboxNotifyEmailBackend, drain_outbox
+from django_gov_notify.priority import BULK, current_priority
+from django_gov_notify.results import FAILED, QUEUED
+from tests.fixtures import NotifyEmailMessageFactory
+
+
+class OutboxBackendTest(TestCase):
+    def setUp(self):
+        self.backend = OutboxNotifyEmailBackend(govuk_notify_api_key="not a real key")
+
+    @mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+    def test_messages_are_saved_not_sent(self, mock_client):
+        messages = [
+            NotifyEmailMessageFactory(to=["a@example.com", "b@example.com"]),
+            NotifyEmailMessageFactory(to=["c@example.com"]),
+            NotifyEmailMessageFactory(),
+        ]
+        self.assertEqual(self.backend.send_messages(messages), 2)
+        mock_client.assert_not_called()
+        rows = OutboxMessage.objects.order_by("pk")
+        self.assertEqual(
+            [row.recipients for row in rows],
+            [["a@example.com", "b@example.com"], ["c@example.com"]],
+        )
+        self.assertEqual(
+            rows[0].payload,
+            {
+                "template_id": settings.GOVUK_NOTIFY_PLAIN_EMAIL_TEMPLATE_ID,
+                "personalisation": {
+                    "subject": "Test Subject",
+                    "body": "Test body content",
+                },
+            },
+        )
+        self.assertEqual(messages[0].notify_results[0].status, QUEUED)
+
+    def test_invalid_message_is_not_saved(self):
+        message = NotifyEmailMessageFactory(to=["a@example.com"], body="")
+        with self.assertRaises(ValueError):
+            self.backend.send_messages([message])
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_unsendable_message_is_not_counted(self):
+        backend = OutboxNotifyEmailBackend(
+            govuk_notify_api_key="not a real key", fail_silently=True
+        )
+        message = EmailMessage(
+            "Subject", "Body", to=["a@example.com"], cc=["b@example.com"]
+        )
+        self.assertEqual(backend.send_messages([message]), 0)
+        self.assertEqual(message.notify_results[0].status, FAILED)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    @override_settings(
+        EMAIL_BACKEND="django_gov_notify.outbox.OutboxNotifyEmailBackend"
+    )
+    def test_send_mail(self):
+        from django.core.mail import send_mail
+
+        self.assertEqual(
+            send_mail("Subject", "Body", "from@example.com", ["a@example.com"]), 1
+        )
+        self.assertEqual(OutboxMessage.objects.get().recipients, ["a@example.com"])
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class DrainOutboxTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+        OutboxNotifyEmailBackend().send_messages(
+            [
+                NotifyEmailMessageFactory(to=["a@example.com", "bad@example.com"]),
+                NotifyEmailMessageFactory(to=["c@example.com"]),
+            ]
+        )
+
+    def test_sent_messages_are_deleted(self, mock_client):
+        self.assertEqual(drain_outbox(), 2)
+        self.assertEqual(mock_client().send_email_notification.call_count, 3)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_only_failed_recipients_are_kept(self, mock_client):
+        def send(email_address, **kwargs):
+            if email_address == "bad@example.com":
+                raise Exception("Boom")
+
+        mock_client().send_email_notification.side_effect = send
+        self.assertEqual(drain_outbox(), 2)
+        row = OutboxMessage.objects.get()
+        self.assertEqual(row.recipients, ["bad@example.com"])
+        self.assertEqual(row.attempts, 1)
+        self.assertEqual(row.last_error, "Boom")
+        # It is not retried straight away
+        self.assertEqual(drain_outbox(), 0)
+
+    def test_messages_are_sent_with_their_priority(self, mock_client):
+        OutboxMessage.objects.all().delete()
+        OutboxNotifyEmailBackend().send_messages(
+            [NotifyEmailMessageFactory(to=["a@example.com"], priority=BULK)]
+        )
+        self.assertEqual(OutboxMessage.objects.get().priority, BULK)
+        priorities = []
+        mock_client().send_email_notification.side_effect = (
+            lambda **kwargs: priorities.append(current_priority())
+        )
+        drain_outbox()
+        self.assertEqual(priorities, [BULK])
+
+    def test_batch_size(self, mock_client):
+        self.assertEqual(drain_outbox(batch_size=1), 1)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_notify_worker_command(self, mock_client):
+        stdout = StringIO()
+        call_command("notify_worker", once=True, stdout=stdout)
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assertIn("Processed 2 messages", stdout.getvalue())
@@ -0,0 +1,177 @@
+import io
+import os
+import tempfile
+from unittest import mock
+
+from django.core.mail import send_mail
+from django.test import TestCase, override_settings
+
+from django_gov_notify.backends import NotifyEmailBackend
+from django_gov_notify.clients import close_clients
+from django_gov_notify.message import NotifyBulkMessage, NotifyEmailMessage
+from django_gov_notify.preview import PreviewNotifyEmailBackend
+from django_gov_notify.results import SENT
+from django_gov_notify.templates import render
+
+TEMPLATE_ID = "43573f75-80e7-402f-b308-e5f1c2a0eca8"
+TEMPLATES = {
+    TEMPLATE_ID: {
+        "subject": "Hello ((first name))",
+        "body": "Ref: ((ref)).((urgent??\nThis is urgent.))\n((items))",
+    }
+}
+
+
+class RenderTest(TestCase):
+    def test_placeholders(self):
+        self.assertEqual(
+            render("Hello ((First_Name)), ((missing))", {"first name": "Ada"}),
+            "Hello Ada, ((missing))",
+        )
+
+    def test_conditionals(self):
+        text = "A((show??, B))"
+        self.assertEqual(render(text, {"show": "yes"}), "A, B")
+        self.assertEqual(render(text, {"show": True}), "A, B")
+        self.assertEqual(render(text, {"show": "Y"}), "A, B")
+        self.assertEqual(render(text, {"show": 1}), "A, B")
+        self.assertEqual(render(text, {"show": "no"}), "A")
+        self.assertEqual(render(text, {"show": ""}), "A")
+        # Notify only shows the text for yes, y, true, t and 1
+        self.assertEqual(render(text, {"show": "n"}), "A")
+        self.assertEqual(render(text, {"show": "maybe"}), "A")
+        self.assertEqual(render(text, {"show": False}), "A")
+
+    def test_lists(self):
+        self.assertEqual(render("((items))", {"items": ["a", "b"]}), "* a\n* b")
+
+
+@override_settings(GOVUK_NOTIFY_TEMPLATES=TEMPLATES)
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class PreviewBackendTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def test_renders_without_calling_notify(self, mock_client):
+        stream = io.StringIO()
+        message = NotifyEmailMessage(
+            to=["a@example.com"],
+            template_id=TEMPLATE_ID,
+            personalisation={"first_name": "Ada", "ref": "X1", "urgent": "yes"},
+            reference="ref-1",
+        )
+        backend = PreviewNotifyEmailBackend(stream=stream)
+        self.assertEqual(backend.send_messages([message]), 1)
+        output = stream.getvalue()
+        self.assertIn("To: a@example.com\n", output)
+        self.assertIn("Reference: ref-1\n", output)
+        self.assertIn("Subject: Hello Ada\n\nRef: X1.\nThis is urgent.\n", output)
+        self.assertEqual(message.notify_results[0].status, SENT)
+        self.assertTrue(message.notify_results[0].notification_id)
+        mock_client().send_email_notification.assert_not_called()
+        mock_client().get_template.assert_not_called()
+
+    def test_plain_template(self, mock_client):
+        stream = io.StringIO()
+        send_mail(
+            "Subject line",
+            "Body text",
+            None,
+            ["a@example.com"],
+            connection=PreviewNotifyEmailBackend(stream=stream),
+        )
+        self.assertIn("Subject: Subject line\n\nBody text\n", stream.getvalue())
+
+    def test_bulk_preview(self, mock_client):
+        stream = io.StringIO()
+        rows = (
+            ("user%d@example.com" % i, {"first name": str(i), "ref": i})
+            for i in range(50)
+        )
+        message = NotifyBulkMessage(
+            TEMPLATE_ID, rows, connection=PreviewNotifyEmailBackend(stream=stream)
+        )
+        self.assertEqual(message.send(), 50)
+        self.assertEqual(stream.getvalue().count("Subject: Hello "), 50)
+
+    def test_fetches_other_templates_once(self, mock_client):
+        mock_client().get_template.return_value = {"subject": "S", "body": "((x))"}
+        template_id = "5ba8d0b4-6bf2-4cd8-9b8a-0cc9b64e68d8"
+        stream = io.StringIO()
+        messages = [
+            NotifyEmailMessage(
+                to=["a@example.com"], template_id=template_id, personalisation={"x": i}
+            )
+            for i in range(3)
+        ]
+        with mock.patch("django_gov_notify.templates._template_cache", None):
+            PreviewNotifyEmailBackend(stream=stream).send_messages(messages)
+        self.assertEqual(mock_client().get_template.call_count, 1)
+        self.assertIn("S\n\n2\n", stream.getvalue())
+
+    def test_file_path(self, mock_client):
+        with tempfile.TemporaryDirectory() as path:
+            backend = PreviewNotifyEmailBackend(file_path=path)
+            message = NotifyEmailMessage(
+                to=["a@example.com"], subject="Subject line", body="Body text"
+            )
+            backend.send_messages([message])
+            backend.close()
+            (filename,) = os.listdir(path)
+            with open(os.path.join(path, filename)) as f:
+                self.assertIn("Subject: Subject line", f.read())
+
+
+@override_settings(GOVUK_NOTIFY_TEMPLATES=TEMPLATES)
+class PreviewWithoutAPIKeyTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def test_local_templates_need_no_client(self):
+        # The test settings' API key is not in Notify's format
+        stream = io.StringIO()
+        messages = [
+            NotifyEmailMessage(
+                to=["a@example.com"], subject="Subject line", body="Body text"
+            ),
+            NotifyEmailMessage(
+                to=["b@example.com"],
+                template_id=TEMPLATE_ID,
+                personalisation={"first name": "Ada", "ref": "X1"},
+            ),
+        ]
+        with mock.patch("django_gov_notify.clients.NotificationsAPIClient") as client:
+            self.assertEqual(
+                PreviewNotifyEmailBackend(stream=stream).send_messages(messages), 2
+            )
+        client.assert_not_called()
+        self.assertIn("Subject: Hello Ada\n", stream.getvalue())
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "preview-dedup-tests",
+        }
+    },
+    GOVUK_NOTIFY_DEDUP_CACHE="default",
+)
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class PreviewDedupTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def test_preview_does_not_suppress_the_real_send(self, mock_client):
+        def message():
+            return NotifyEmailMessage(
+                to=["a@example.com"], subject="Subject line", body="Body text"
+            )
+
+        backend = PreviewNotifyEmailBackend(stream=io.StringIO())
+        self.assertIsNone(backend.dedup_store)
+        backend.send_messages([message()])
+        real = message()
+        self.assertEqual(NotifyEmailBackend().send_messages([real]), 1)
+        self.assertEqual(real.notify_results[0].status, SENT)
+        self.assertEqual(mock_client().send_email_notification.call_count, 1)
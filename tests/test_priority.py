@@ -0,0 +1,270 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from django_gov_notify.backends import AsyncNotifyEmailBackend, NotifyEmailBackend
+from django_gov_notify.clients import close_clients
+from django_gov_notify.jobs import BatchJob
+from django_gov_notify.priority import (
+    BULK,
+    TRANSACTIONAL,
+    PriorityScheduler,
+    current_priority,
+    lane,
+)
+from tests.fixtures import NotifyEmailMessageFactory
+
+TEMPLATE_ID = "43573f75-80e7-402f-b308-e5f1066fbd6f"
+
+
+class GateLimiter:
+    """A limiter that records who asks it, and holds them until the gate opens."""
+
+    def __init__(self):
+        self.order = []
+        self.gate = threading.Event()
+
+    def acquire(self):
+        self.order.append(current_priority())
+        self.gate.wait(5)
+        return 0
+
+
+def wait_for(condition):
+    for _ in range(500):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("Timed out")
+
+
+class PrioritySchedulerTest(TestCase):
+    def start(self, scheduler, priority, limiter=None):
+        def run():
+            with lane(priority):
+                scheduler.acquire(priority, limiter)
+            scheduler.release()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.addCleanup(thread.join)
+        return thread
+
+    def test_transactional_requests_go_first(self):
+        scheduler = PriorityScheduler()
+        limiter = GateLimiter()
+        self.start(scheduler, BULK, limiter)
+        wait_for(lambda: limiter.order)
+        threads = [self.start(scheduler, BULK, limiter) for _ in range(5)]
+        threads += [self.start(scheduler, TRANSACTIONAL, limiter) for _ in range(5)]
+        wait_for(
+            lambda: scheduler.waiting(BULK) + scheduler.waiting(TRANSACTIONAL) == 10
+        )
+        limiter.gate.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(limiter.order, [BULK] + [TRANSACTIONAL] * 5 + [BULK] * 5)
+        self.assertEqual(scheduler.in_flight, 0)
+
+    def test_lanes_share_by_weight(self):
+        scheduler = PriorityScheduler(weights={TRANSACTIONAL: 1, BULK: 1})
+        limiter = GateLimiter()
+        self.start(scheduler, TRANSACTIONAL, limiter)
+        wait_for(lambda: limiter.order)
+        threads = []
+        for _ in range(3):
+            threads.append(self.start(scheduler, BULK, limiter))
+            wait_for(lambda: scheduler.waiting(BULK) == len(threads))
+        for _ in range(3):
+            threads.append(self.start(scheduler, TRANSACTIONAL, limiter))
+            wait_for(lambda: scheduler.waiting(TRANSACTIONAL) == len(threads) - 3)
+        limiter.gate.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(
+            limiter.order,
+            [
+                TRANSACTIONAL,
+                BULK,
+                TRANSACTIONAL,
+                BULK,
+                TRANSACTIONAL,
+                BULK,
+                TRANSACTIONAL,
+            ],
+        )
+
+    def test_max_in_flight(self):
+        scheduler = PriorityScheduler(max_in_flight=1)
+        self.assertEqual(scheduler.acquire(BULK), 0)
+        self.start(scheduler, TRANSACTIONAL)
+        wait_for(lambda: scheduler.waiting(TRANSACTIONAL) == 1)
+        self.assertEqual(scheduler.in_flight, 1)
+        scheduler.release()
+        wait_for(lambda: scheduler.waiting(TRANSACTIONAL) == 0)
+
+    def test_limiter_error_gives_back_place(self):
+        scheduler = PriorityScheduler(max_in_flight=1)
+        limiter = mock.Mock(**{"acquire.side_effect": RuntimeError})
+        with self.assertRaises(RuntimeError):
+            scheduler.acquire(BULK, limiter)
+        self.assertEqual(scheduler.in_flight, 0)
+        self.assertEqual(scheduler.acquire(BULK), 0)
+
+
+class AsyncPrioritySchedulerTest(TestCase):
+    async def test_waiter_is_woken_from_another_thread(self):
+        scheduler = PriorityScheduler(max_in_flight=1)
+        await scheduler.aacquire(BULK)
+        # A waiter must be woken by the release, not by polling
+        with mock.patch("asyncio.sleep", side_effect=AssertionError("Polled")):
+            waiter = asyncio.ensure_future(scheduler.aacquire(TRANSACTIONAL))
+            await asyncio.wait([waiter], timeout=0.01)
+            self.assertEqual(scheduler.waiting(TRANSACTIONAL), 1)
+            thread = threading.Thread(target=scheduler.release)
+            thread.start()
+            self.assertEqual(await asyncio.wait_for(waiter, 5), 0)
+        thread.join()
+        self.assertEqual(scheduler.in_flight, 1)
+
+    async def test_cancelled_waiter_leaves_its_lane(self):
+        scheduler = PriorityScheduler(max_in_flight=1)
+        await scheduler.aacquire(BULK)
+        waiter = asyncio.ensure_future(scheduler.aacquire(TRANSACTIONAL))
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.waiting(TRANSACTIONAL), 1)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual(scheduler.waiting(TRANSACTIONAL), 0)
+        self.assertEqual(scheduler._waiters, {})
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class BackendPriorityTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+        self.sent = []
+
+    def record(self, mock_client):
+        def send(email_address, **kwargs):
+            self.sent.append((email_address, current_priority()))
+
+        mock_client().send_email_notification.side_effect = send
+
+    def test_message_priority(self, mock_client):
+        self.record(mock_client)
+        messages = [
+            NotifyEmailMessageFactory(to=["bulk@example.com"], priority=BULK),
+            NotifyEmailMessageFactory(to=["reset@example.com"], subject="Reset"),
+        ]
+        NotifyEmailBackend().send_messages(messages)
+        self.assertEqual(
+            self.sent,
+            [("reset@example.com", TRANSACTIONAL), ("bulk@example.com", BULK)],
+        )
+
+    def test_priority_is_kept_in_worker_threads(self, mock_client):
+        self.record(mock_client)
+        messages = [
+            NotifyEmailMessageFactory(to=["a@example.com", "b@example.com"]),
+            NotifyEmailMessageFactory(
+                to=["c@example.com", "d@example.com"], subject="News", priority=BULK
+            ),
+        ]
+        NotifyEmailBackend(max_workers=3).send_messages(messages)
+        self.assertEqual(
+            sorted(self.sent),
+            [
+                ("a@example.com", TRANSACTIONAL),
+                ("b@example.com", TRANSACTIONAL),
+                ("c@example.com", BULK),
+                ("d@example.com", BULK),
+            ],
+        )
+
+    @override_settings(GOVUK_NOTIFY_DEFAULT_PRIORITY=BULK)
+    def test_default_priority(self, mock_client):
+        self.record(mock_client)
+        NotifyEmailBackend().send_messages(
+            [NotifyEmailMessageFactory(to=["a@example.com"])]
+        )
+        NotifyEmailBackend(priority=TRANSACTIONAL).send_messages(
+            [NotifyEmailMessageFactory(to=["b@example.com"])]
+        )
+        self.assertEqual(
+            self.sent, [("a@example.com", BULK), ("b@example.com", TRANSACTIONAL)]
+        )
+
+    def test_coalesced_messages_take_the_most_urgent_priority(self, mock_client):
+        self.record(mock_client)
+        NotifyEmailBackend().send_messages(
+            [
+                NotifyEmailMessageFactory(to=["a@example.com"], priority=BULK),
+                NotifyEmailMessageFactory(to=["b@example.com"]),
+            ]
+        )
+        self.assertEqual(
+            self.sent,
+            [("a@example.com", TRANSACTIONAL), ("b@example.com", TRANSACTIONAL)],
+        )
+
+    def test_bulk_sends(self, mock_client):
+        self.record(mock_client)
+        backend = NotifyEmailBackend(max_workers=2)
+        backend.send_bulk(TEMPLATE_ID, [("a@example.com", {})])
+        BatchJob(TEMPLATE_ID, [("b@example.com", {})], connection=backend).run()
+        self.assertEqual(self.sent, [("a@example.com", BULK), ("b@example.com", BULK)])
+
+    def test_requests_go_through_the_scheduler(self, mock_client):
+        backend = NotifyEmailBackend(govuk_notify_api_key="scheduled key")
+        backend.open()
+        with mock.patch.object(
+            backend.scheduler, "acquire", wraps=backend.scheduler.acquire
+        ) as acquire:
+            backend.send_messages(
+                [NotifyEmailMessageFactory(to=["a@example.com"], priority=BULK)]
+            )
+        acquire.assert_called_once_with(BULK, backend.rate_limiter)
+        self.assertEqual(backend.scheduler.in_flight, 0)
+
+    @override_settings(GOVUK_NOTIFY_RATE_LIMIT=None)
+    def test_no_scheduler_without_limits(self, mock_client):
+        backend = NotifyEmailBackend(govuk_notify_api_key="unscheduled key")
+        backend.open()
+        self.assertIsNone(backend.scheduler)
+        backend = NotifyEmailBackend(
+            govuk_notify_api_key="unscheduled key", max_in_flight=5
+        )
+        backend.open()
+        self.assertEqual(backend.scheduler.max_in_flight, 5)
+
+    def test_invalid_priority(self, mock_client):
+        with self.assertRaises(ValueError):
+            NotifyEmailMessageFactory(priority="urgent")
+        with self.assertRaises(ValueError):
+            NotifyEmailBackend(priority="urgent")
+
+
+class AsyncBackendPriorityTest(TestCase):
+    async def test_async_priority(self):
+        sent = []
+
+        async def post(url, data, **kwargs):
+            sent.append((data["email_address"], current_priority()))
+            return {"id": "fake-id"}
+
+        backend = AsyncNotifyEmailBackend()
+        with mock.patch.object(backend, "_apost", side_effect=post):
+            await backend.asend_messages(
+                [
+                    NotifyEmailMessageFactory(to=["a@example.com"], priority=BULK),
+                    NotifyEmailMessageFactory(to=["b@example.com"], subject="Other"),
+                ]
+            )
+        self.assertEqual(
+            sorted(sent), [("a@example.com", BULK), ("b@example.com", TRANSACTIONAL)]
+        )
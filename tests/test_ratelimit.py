@@ -0,0 +1,134 @@
+import bisect
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from django_gov_notify.backends import NotifyEmailBackend
+from django_gov_notify.clients import close_clients
+from django_gov_notify.ratelimit import CacheRateLimiter, TokenBucket, get_rate_limiter
+from tests.fixtures import NotifyEmailMessageFactory
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTest(TestCase):
+    def test_burst_up_to_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(63, period=60, capacity=3, clock=clock)
+        self.assertEqual([bucket.try_acquire() for i in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.try_acquire(), 1.0)
+
+    def test_default_capacity_is_a_second_of_tokens(self):
+        self.assertEqual(TokenBucket(3000, period=60).capacity, 50)
+        self.assertEqual(TokenBucket(30, period=60).capacity, 1)
+
+    def test_no_period_exceeds_the_rate(self):
+        clock = FakeClock(0.0)
+        bucket = TokenBucket(3000, period=60, clock=clock)
+        times = []
+        while clock.now < 180:
+            if bucket.try_acquire() == 0:
+                times.append(clock.now)
+            else:
+                clock.now += 0.001
+        busiest = max(
+            bisect.bisect_left(times, start + 60) - index
+            for index, start in enumerate(times)
+        )
+        self.assertLessEqual(busiest, 3000)
+        self.assertLessEqual(bisect.bisect_left(times, 1.0), 100)
+
+    def test_tokens_refill_over_time(self):
+        clock = FakeClock()
+        bucket = TokenBucket(61, period=60, capacity=1, clock=clock)
+        self.assertEqual(bucket.try_acquire(), 0)
+        clock.now += 0.5
+        self.assertAlmostEqual(bucket.try_acquire(), 0.5)
+        clock.now += 0.5
+        self.assertEqual(bucket.try_acquire(), 0)
+
+    @mock.patch("django_gov_notify.ratelimit.time.sleep")
+    def test_acquire_waits(self, mock_sleep):
+        clock = FakeClock()
+        bucket = TokenBucket(61, period=60, capacity=1, clock=clock)
+        bucket.acquire()
+        mock_sleep.side_effect = lambda delay: setattr(clock, "now", clock.now + delay)
+        self.assertAlmostEqual(bucket.acquire(), 1.0)
+        mock_sleep.assert_called_once()
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class CacheRateLimiterTest(TestCase):
+    def test_allowance_per_window(self):
+        clock = FakeClock(120.0)
+        limiter = CacheRateLimiter("test-key", 120, period=60, clock=clock)
+        self.assertEqual(limiter.window, 1.0)
+        self.assertEqual(limiter.allowance, 2)
+        self.assertEqual(limiter.try_acquire(), 0)
+        self.assertEqual(limiter.try_acquire(), 0)
+        self.assertAlmostEqual(limiter.try_acquire(), 1.0)
+        clock.now += 1
+        self.assertEqual(limiter.try_acquire(), 0)
+
+    async def test_async_does_not_block_on_the_cache(self):
+        clock = FakeClock(120.0)
+        limiter = CacheRateLimiter("async-key", 120, period=60, clock=clock)
+        limiter.cache = mock.Mock(
+            **{"add.side_effect": AssertionError, "incr.side_effect": AssertionError}
+        )
+        limiter.cache.aadd = mock.AsyncMock()
+        limiter.cache.aincr = mock.AsyncMock(side_effect=[1, 2, 3])
+        self.assertEqual(await limiter.aacquire(), 0)
+        self.assertEqual(await limiter.atry_acquire(), 0)
+        self.assertAlmostEqual(await limiter.atry_acquire(), 1.0)
+
+    def test_limit_is_shared_between_limiters(self):
+        clock = FakeClock(60.0)
+        first = CacheRateLimiter("shared-key", 60, period=60, clock=clock)
+        second = CacheRateLimiter("shared-key", 60, period=60, clock=clock)
+        self.assertEqual(first.try_acquire(), 0)
+        self.assertGreater(second.try_acquire(), 0)
+
+
+class GetRateLimiterTest(TestCase):
+    def test_limiter_is_shared_per_api_key(self):
+        self.assertIs(
+            get_rate_limiter("key one", 100), get_rate_limiter("key one", 100)
+        )
+        self.assertIsNot(
+            get_rate_limiter("key one", 100), get_rate_limiter("key two", 100)
+        )
+
+    def test_cache_alias_uses_cache_limiter(self):
+        limiter = get_rate_limiter("key one", 100, cache_alias="default")
+        self.assertIsInstance(limiter, CacheRateLimiter)
+        self.assertNotIn("key one", limiter.key)
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class BackendRateLimitTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def test_each_request_is_rate_limited(self, mock_client):
+        limiter = mock.Mock()
+        backend = NotifyEmailBackend(govuk_notify_api_key="rate limited key")
+        with mock.patch.object(backend, "_get_rate_limiter", return_value=limiter):
+            backend.send_messages(
+                [NotifyEmailMessageFactory(to=["a@example.com", "b@example.com"])]
+            )
+        self.assertEqual(limiter.acquire.call_count, 2)
+
+    @override_settings(GOVUK_NOTIFY_RATE_LIMIT=None)
+    def test_rate_limit_can_be_disabled(self, mock_client):
+        backend = NotifyEmailBackend(govuk_notify_api_key="unlimited key")
+        backend.open()
+        self.assertIsNone(backend.rate_limiter)
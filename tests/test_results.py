@@ -0,0 +1,90 @@
+from unittest import mock
+
+from django.core.mail import EmailMessage
+from django.test import TestCase
+
+from django_gov_notify.backends import NotifyEmailBackend
+from django_gov_notify.clients import close_clients
+from django_gov_notify.results import FAILED, SENT, DeliveryResult, all_sent
+from tests.fixtures import NotifyEmailMessageFactory
+
+
+def send(email_address, **kwargs):
+    if email_address.startswith("bad"):
+        raise Exception("Boom")
+    return {"id": "id-for-%s" % email_address}
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class DeliveryResultsTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+        self.backend = NotifyEmailBackend(
+            govuk_notify_api_key="not a real key", fail_silently=True
+        )
+
+    def test_results_are_stored_on_message(self, mock_client):
+        mock_client().send_email_notification.side_effect = send
+        message = NotifyEmailMessageFactory(to=["a@example.com", "bad@example.com"])
+        self.backend.send_messages([message])
+        first, second = message.notify_results
+        self.assertEqual(first.recipient, "a@example.com")
+        self.assertEqual(first.status, SENT)
+        self.assertEqual(first.notification_id, "id-for-a@example.com")
+        self.assertIsNotNone(first.latency)
+        self.assertIsNone(first.error)
+        self.assertEqual(second.status, FAILED)
+        self.assertEqual(str(second.error), "Boom")
+
+    def test_remaining_recipients_sent_after_failure(self, mock_client):
+        mock_client().send_email_notification.side_effect = send
+        message = NotifyEmailMessageFactory(
+            to=["bad@example.com", "a@example.com", "b@example.com"]
+        )
+        self.assertEqual(self.backend.send_messages([message]), 0)
+        self.assertEqual(
+            [result.status for result in message.notify_results], [FAILED, SENT, SENT]
+        )
+
+    def test_send_messages_detailed(self, mock_client):
+        mock_client().send_email_notification.side_effect = send
+        messages = [
+            NotifyEmailMessageFactory(to=["a@example.com"]),
+            NotifyEmailMessageFactory(),
+            NotifyEmailMessageFactory(to=["bad@example.com"]),
+        ]
+        results = self.backend.send_messages_detailed(messages)
+        self.assertEqual(
+            [
+                [result.status for result in message_results]
+                for message_results in results
+            ],
+            [[SENT], [], [FAILED]],
+        )
+
+    def test_concurrent_results(self, mock_client):
+        mock_client().send_email_notification.side_effect = send
+        self.backend.max_workers = 4
+        message = NotifyEmailMessageFactory(
+            to=["a@example.com", "bad@example.com", "b@example.com"]
+        )
+        self.backend.send_messages([message])
+        self.assertEqual(
+            [result.recipient for result in message.notify_results],
+            ["a@example.com", "bad@example.com", "b@example.com"],
+        )
+
+    def test_results_stored_on_converted_message(self, mock_client):
+        mock_client().send_email_notification.side_effect = send
+        message = EmailMessage("Subject", "Body", to=["a@example.com"])
+        self.backend.send_messages([message])
+        self.assertEqual(message.notify_results[0].status, SENT)
+
+
+class AllSentTest(TestCase):
+    def test_all_sent(self):
+        sent = DeliveryResult("a@example.com", SENT)
+        failed = DeliveryResult("b@example.com", FAILED)
+        self.assertTrue(all_sent([sent, sent]))
+        self.assertFalse(all_sent([sent, failed]))
+        self.assertFalse(all_sent([]))
@@ -0,0 +1,107 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from notifications_python_client.errors import HTTP503Error, HTTPError
+
+from django_gov_notify.backends import NotifyEmailBackend
+from django_gov_notify.clients import close_clients
+from django_gov_notify.retry import RetryPolicy
+from tests.fixtures import NotifyEmailMessageFactory
+
+
+def api_error(status_code, headers=None):
+    return HTTPError(mock.Mock(status_code=status_code, headers=headers or {}))
+
+
+@mock.patch("django_gov_notify.retry.time.sleep")
+class RetryPolicyTest(TestCase):
+    def test_retries_rate_limit_errors(self, mock_sleep):
+        func = mock.Mock(side_effect=[api_error(429), "ok"])
+        self.assertEqual(RetryPolicy().call(func), "ok")
+        self.assertEqual(func.call_count, 2)
+        mock_sleep.assert_called_once()
+
+    def test_retries_server_and_connection_errors(self, mock_sleep):
+        func = mock.Mock(side_effect=[api_error(500), HTTP503Error(), "ok"])
+        self.assertEqual(RetryPolicy().call(func), "ok")
+        self.assertEqual(func.call_count, 3)
+
+    def test_does_not_retry_client_errors(self, mock_sleep):
+        func = mock.Mock(side_effect=api_error(400))
+        with self.assertRaises(HTTPError):
+            RetryPolicy().call(func)
+        func.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    def test_gives_up_after_max_attempts(self, mock_sleep):
+        func = mock.Mock(side_effect=api_error(500))
+        with self.assertRaises(HTTPError):
+            RetryPolicy(max_attempts=4).call(func)
+        self.assertEqual(func.call_count, 4)
+
+    def test_honours_retry_after(self, mock_sleep):
+        func = mock.Mock(side_effect=[api_error(429, {"Retry-After": "7"}), "ok"])
+        RetryPolicy(deadline=None).call(func)
+        mock_sleep.assert_called_once_with(7.0)
+
+    def test_gives_up_at_deadline(self, mock_sleep):
+        func = mock.Mock(side_effect=api_error(429, {"Retry-After": "60"}))
+        with self.assertRaises(HTTPError):
+            RetryPolicy(deadline=30).call(func)
+        func.assert_called_once()
+
+    def test_gives_up_at_time(self, mock_sleep):
+        func = mock.Mock(side_effect=[api_error(429, {"Retry-After": "5"}), "ok"])
+        policy = RetryPolicy(clock=lambda: 100)
+        with self.assertRaises(HTTPError):
+            policy.call(func, give_up_at=104)
+        self.assertEqual(policy.call(func, give_up_at=106), "ok")
+
+    def test_backoff_is_exponential_with_jitter(self, mock_sleep):
+        policy = RetryPolicy(base_delay=1, max_delay=5)
+        error = api_error(500)
+        with mock.patch("django_gov_notify.retry.random.uniform") as mock_uniform:
+            for attempt in range(1, 5):
+                policy.delay(attempt, error)
+        self.assertEqual(
+            mock_uniform.mock_calls,
+            [mock.call(0, 1), mock.call(0, 2), mock.call(0, 4), mock.call(0, 5)],
+        )
+
+
+@mock.patch("django_gov_notify.retry.time.sleep")
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class BackendRetryTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def test_only_failed_recipient_is_resent(self, mock_client, mock_sleep):
+        failures = [api_error(503)]
+
+        def send(email_address, **kwargs):
+            if email_address == "b@example.com" and failures:
+                raise failures.pop()
+
+        mock_client().send_email_notification.side_effect = send
+        backend = NotifyEmailBackend(govuk_notify_api_key="retry key")
+        message = NotifyEmailMessageFactory(
+            to=["a@example.com", "b@example.com", "c@example.com"]
+        )
+        self.assertEqual(backend.send_messages([message]), 1)
+        sent_to = [
+            kwargs["email_address"]
+            for name, args, kwargs in mock_client().send_email_notification.mock_calls
+        ]
+        self.assertEqual(
+            sent_to,
+            ["a@example.com", "b@example.com", "b@example.com", "c@example.com"],
+        )
+
+    @override_settings(GOVUK_NOTIFY_RETRY_MAX_ATTEMPTS=1)
+    def test_retries_can_be_disabled(self, mock_client, mock_sleep):
+        mock_client().send_email_notification.side_effect = api_error(503)
+        backend = NotifyEmailBackend(govuk_notify_api_key="retry key")
+        with self.assertRaises(HTTPError):
+            backend.send_messages([NotifyEmailMessageFactory(to=["a@example.com"])])
+        mock_client().send_email_notification.assert_called_once()
@@ -0,0 +1,263 @@
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+
+from django_gov_notify.backends import AsyncNotifyEmailBackend, NotifyEmailBackend
+from django_gov_notify.circuitbreaker import CircuitBreaker
+from django_gov_notify.clients import close_clients
+from django_gov_notify.results import FAILED, SENT
+from django_gov_notify.routing import (
+    HASH,
+    LEAST_USED,
+    TEMPLATE,
+    KeyUsage,
+    Route,
+    Router,
+    clear_usage,
+    parse_api_keys,
+)
+from tests.fixtures import NotifyEmailMessageFactory
+
+TEMPLATE_ID = "43573f75-80e7-402f-b308-e5f1066fbd6f"
+OTHER_TEMPLATE_ID = "2fb0f5d3-6d4b-4ca1-9a55-d6fe1c9ac9d1"
+REPLY_TO_ID = "0d3b6e3c-2f37-4c5b-9d8c-1f4e6a2b7c90"
+SMS_SENDER_ID = "8a1c4f02-5e6b-4d7a-b3c9-6e2f0d1a9b48"
+API_KEYS = {"main": "main key", "campaigns": "campaigns key"}
+
+
+def make_route(name):
+    route = Route(name, "%s key" % name, mock.Mock())
+    route.usage = KeyUsage()
+    return route
+
+
+class ParseAPIKeysTest(TestCase):
+    def test_formats(self):
+        self.assertEqual(
+            parse_api_keys(
+                {"a": "key a", "b": {"api_key": "key b", "templates": {"x": "y"}}}
+            ),
+            [("a", "key a", {}), ("b", "key b", {"templates": {"x": "y"}})],
+        )
+        self.assertEqual(
+            parse_api_keys(["key a", "key b"]),
+            [("0", "key a", {}), ("1", "key b", {})],
+        )
+        self.assertEqual(
+            parse_api_keys(
+                {
+                    "a": {
+                        "api_key": "key a",
+                        "email_reply_to_ids": {"r": "s"},
+                        "sms_sender_ids": {"t": "u"},
+                    }
+                }
+            ),
+            [
+                (
+                    "a",
+                    "key a",
+                    {"email_reply_to_ids": {"r": "s"}, "sms_sender_ids": {"t": "u"}},
+                )
+            ],
+        )
+
+    def test_invalid(self):
+        with self.assertRaises(ImproperlyConfigured):
+            parse_api_keys({})
+        with self.assertRaises(ImproperlyConfigured):
+            parse_api_keys({"a": {"templates": {}}})
+
+
+class RouterTest(TestCase):
+    def setUp(self):
+        self.routes = [make_route("a"), make_route("b"), make_route("c")]
+        self.message = {"template_id": TEMPLATE_ID, "personalisation": {}}
+
+    def test_hash(self):
+        router = Router(self.routes, HASH)
+        chosen = [
+            router.route("user-%d@example.com" % index, self.message)
+            for index in range(30)
+        ]
+        self.assertEqual(set(chosen), set(self.routes))
+        self.assertIs(router.route("user-0@example.com", self.message), chosen[0])
+
+    def test_least_used(self):
+        router = Router(self.routes, LEAST_USED)
+        self.routes[0].usage.started()
+        self.routes[1].usage.started()
+        self.routes[1].usage.finished(ok=True)
+        self.assertEqual(router.route("a@example.com", self.message).name, "c")
+        self.routes[2].usage.started()
+        self.assertEqual(router.route("a@example.com", self.message).name, "b")
+
+    def test_least_used_skips_open_circuits(self):
+        router = Router(self.routes, LEAST_USED)
+        for route in self.routes:
+            route.circuit_breaker = CircuitBreaker(route.name, failure_threshold=1)
+        self.routes[0].circuit_breaker.record_failure()
+        self.assertEqual(router.route("a@example.com", self.message).name, "b")
+
+    async def test_aroute_skips_open_circuits(self):
+        router = Router(self.routes, LEAST_USED)
+        for route in self.routes:
+            route.circuit_breaker = CircuitBreaker(route.name, failure_threshold=1)
+        self.routes[0].circuit_breaker.record_failure()
+        route = await router.aroute("a@example.com", self.message)
+        self.assertEqual(route.name, "b")
+
+    def test_template(self):
+        router = Router(self.routes, TEMPLATE, {TEMPLATE_ID: "b"})
+        self.assertEqual(router.route("a@example.com", self.message).name, "b")
+        other = dict(self.message, template_id=OTHER_TEMPLATE_ID)
+        self.assertEqual(router.route("a@example.com", other).name, "a")
+
+    def test_invalid(self):
+        with self.assertRaises(ImproperlyConfigured):
+            Router(self.routes, "random")
+        with self.assertRaises(ImproperlyConfigured):
+            Router(self.routes, TEMPLATE, {TEMPLATE_ID: "d"})
+
+    def test_translate(self):
+        route = Route("a", "a key", mock.Mock(), templates={TEMPLATE_ID: "other"})
+        self.assertEqual(route.translate(self.message)["template_id"], "other")
+        self.assertEqual(self.message["template_id"], TEMPLATE_ID)
+
+    def test_translate_senders(self):
+        route = Route(
+            "a",
+            "a key",
+            mock.Mock(),
+            email_reply_to_ids={REPLY_TO_ID: "other reply-to"},
+            sms_sender_ids={SMS_SENDER_ID: "other sender"},
+        )
+        email = dict(self.message, email_reply_to_id=REPLY_TO_ID)
+        self.assertEqual(
+            route.translate(email),
+            dict(self.message, email_reply_to_id="other reply-to"),
+        )
+        sms = dict(self.message, sms_sender_id=SMS_SENDER_ID)
+        self.assertEqual(route.translate(sms)["sms_sender_id"], "other sender")
+        self.assertIs(route.translate(self.message), self.message)
+
+    def test_senders_stay_on_routes_that_map_them(self):
+        self.routes[2].email_reply_to_ids = {REPLY_TO_ID: "c reply-to"}
+        message = dict(self.message, email_reply_to_id=REPLY_TO_ID)
+        router = Router(self.routes, HASH)
+        chosen = {
+            router.route("user-%d@example.com" % index, message).name
+            for index in range(30)
+        }
+        self.assertEqual(chosen, {"a", "c"})
+        # "b" is least used, but can't send from this reply-to address
+        router = Router(self.routes, LEAST_USED)
+        self.routes[0].usage.started()
+        self.routes[2].usage.started()
+        self.routes[2].usage.finished(ok=True)
+        self.assertEqual(router.route("a@example.com", message).name, "c")
+        self.assertEqual(router.route("a@example.com", self.message).name, "b")
+
+
+@override_settings(GOVUK_NOTIFY_API_KEYS=API_KEYS)
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class BackendRoutingTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+        self.addCleanup(clear_usage)
+        self.clients = {api_key: mock.Mock() for api_key in API_KEYS.values()}
+
+    def use_clients(self, mock_client):
+        mock_client.side_effect = lambda api_key, **kwargs: self.clients.setdefault(
+            api_key, mock.Mock()
+        )
+
+    def sent_with(self, api_key):
+        return [
+            call.kwargs["email_address"]
+            for call in self.clients[api_key].send_email_notification.call_args_list
+        ]
+
+    def test_each_key_has_its_own_client(self, mock_client):
+        self.use_clients(mock_client)
+        backend = NotifyEmailBackend(routing=HASH, max_workers=4)
+        recipients = ["user-%d@example.com" % index for index in range(20)]
+        message = NotifyEmailMessageFactory(to=recipients)
+        self.assertEqual(backend.send_messages([message]), 1)
+        main, campaigns = self.sent_with("main key"), self.sent_with("campaigns key")
+        self.assertTrue(main and campaigns)
+        self.assertEqual(sorted(main + campaigns), sorted(recipients))
+        routes = backend.router.by_name
+        self.assertEqual(routes["main"].usage.sent, len(main))
+        self.assertEqual(routes["campaigns"].usage.sent, len(campaigns))
+        self.assertEqual(routes["main"].usage.in_flight, 0)
+        self.assertIsNot(routes["main"].rate_limiter, routes["campaigns"].rate_limiter)
+        self.assertIsNot(routes["main"].scheduler, routes["campaigns"].scheduler)
+
+    @override_settings(
+        GOVUK_NOTIFY_API_KEYS={
+            "main": "main key",
+            "campaigns": {
+                "api_key": "campaigns key",
+                "templates": {TEMPLATE_ID: OTHER_TEMPLATE_ID},
+            },
+        },
+        GOVUK_NOTIFY_ROUTING=TEMPLATE,
+        GOVUK_NOTIFY_TEMPLATE_ROUTES={TEMPLATE_ID: "campaigns"},
+    )
+    def test_template_routes(self, mock_client):
+        self.use_clients(mock_client)
+        NotifyEmailBackend().send_messages(
+            [
+                NotifyEmailMessageFactory(
+                    to=["a@example.com"], subject="", body="", template_id=TEMPLATE_ID
+                ),
+                NotifyEmailMessageFactory(to=["b@example.com"]),
+            ]
+        )
+        self.assertEqual(self.sent_with("main key"), ["b@example.com"])
+        self.clients["campaigns key"].send_email_notification.assert_called_once_with(
+            email_address="a@example.com",
+            template_id=OTHER_TEMPLATE_ID,
+            personalisation={},
+        )
+
+    def test_failures_are_counted(self, mock_client):
+        self.use_clients(mock_client)
+        for client in self.clients.values():
+            client.send_email_notification.side_effect = ValueError("Bad request")
+        backend = NotifyEmailBackend(fail_silently=True, routing=LEAST_USED)
+        message = NotifyEmailMessageFactory(to=["a@example.com", "b@example.com"])
+        backend.send_messages([message])
+        self.assertEqual([r.status for r in message.notify_results], [FAILED, FAILED])
+        self.assertEqual(
+            [route.usage.failed for route in backend.router.routes], [1, 1]
+        )
+
+    def test_a_given_key_is_not_routed(self, mock_client):
+        self.use_clients(mock_client)
+        backend = NotifyEmailBackend(govuk_notify_api_key="main key")
+        message = NotifyEmailMessageFactory(to=["a@example.com", "b@example.com"])
+        backend.send_messages([message])
+        self.assertIsNone(backend.router)
+        self.assertEqual(self.sent_with("main key"), ["a@example.com", "b@example.com"])
+
+
+@override_settings(GOVUK_NOTIFY_API_KEYS=API_KEYS, GOVUK_NOTIFY_ROUTING=TEMPLATE)
+class AsyncBackendRoutingTest(TestCase):
+    @mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+    async def test_async_routing(self, mock_client):
+        self.addCleanup(close_clients)
+        posts = []
+
+        async def post(url, data, api_key=None):
+            posts.append((data["email_address"], api_key))
+            return {"id": "fake-id"}
+
+        backend = AsyncNotifyEmailBackend()
+        with mock.patch.object(backend, "_apost", side_effect=post):
+            message = NotifyEmailMessageFactory(to=["a@example.com"])
+            self.assertEqual(await backend.asend_messages([message]), 1)
+        self.assertEqual(posts, [("a@example.com", "main key")])
+        self.assertEqual(message.notify_results[0].status, SENT)
@@ -0,0 +1,144 @@
+import uuid
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from django_gov_notify.backends import NotifySMSBackend
+from django_gov_notify.clients import close_clients
+from django_gov_notify.message import NotifySMSMessage, normalise_phone_number
+from django_gov_notify.results import FAILED, SENT
+
+TEMPLATE_ID = str(uuid.uuid4())
+SENDER_ID = str(uuid.uuid4())
+
+
+class PhoneNumberTest(TestCase):
+    def test_normalise(self):
+        for number in [
+            "07700 900123",
+            "07700-900-123",
+            "(07700) 900 123",
+            "+44 7700 900123",
+            "447700900123",
+            "0044 7700 900123",
+            "+44 (0)7700 900123",
+            "0044 (0) 7700 900123",
+            "7700900123",
+            "7700 900 123",
+        ]:
+            with self.subTest(number=number):
+                self.assertEqual(normalise_phone_number(number), "+447700900123")
+        self.assertEqual(normalise_phone_number("+1 202 555 0143"), "+12025550143")
+
+    def test_invalid(self):
+        for number in [
+            "",
+            "hello",
+            "0123",
+            "01632 960 001",
+            "+0 123 456 789",
+            # UK, like Notify, so too short rather than +7 (Russia)
+            "770090012",
+        ]:
+            with self.subTest(number=number):
+                with self.assertRaises(ValueError):
+                    normalise_phone_number(number)
+        with self.assertRaises(TypeError):
+            normalise_phone_number(7700900123)
+
+
+class SMSMessageTest(TestCase):
+    def test_message(self):
+        message = NotifySMSMessage(
+            to=["07700 900123"],
+            template_id=TEMPLATE_ID,
+            personalisation={"code": "1234"},
+            sms_sender_id=SENDER_ID,
+            reference="login-1",
+        )
+        self.assertEqual(
+            message.message(),
+            {
+                "template_id": TEMPLATE_ID,
+                "personalisation": {"code": "1234"},
+                "sms_sender_id": SENDER_ID,
+                "reference": "login-1",
+            },
+        )
+
+    def test_template_id_required(self):
+        with self.assertRaises(ValueError):
+            NotifySMSMessage(to=["07700 900123"])
+
+    def test_bad_sms_sender_id(self):
+        with self.assertRaises(ValueError):
+            NotifySMSMessage(template_id=TEMPLATE_ID, sms_sender_id="foo")
+
+    def test_to_must_be_a_list(self):
+        with self.assertRaises(TypeError):
+            NotifySMSMessage(to="07700 900123", template_id=TEMPLATE_ID)
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class SMSBackendTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def test_send(self, mock_client):
+        mock_client().send_sms_notification.return_value = {"id": "notification-1"}
+        message = NotifySMSMessage(
+            to=["07700 900123", "07700 900456"],
+            template_id=TEMPLATE_ID,
+            personalisation={"code": "1234"},
+        )
+        self.assertEqual(message.send(), 1)
+        mock_client().send_sms_notification.assert_has_calls(
+            [
+                mock.call(
+                    phone_number=number,
+                    template_id=TEMPLATE_ID,
+                    personalisation={"code": "1234"},
+                )
+                for number in ["+447700900123", "+447700900456"]
+            ]
+        )
+        mock_client().send_email_notification.assert_not_called()
+        self.assertEqual(
+            [(r.recipient, r.status) for r in message.notify_results],
+            [("+447700900123", SENT), ("+447700900456", SENT)],
+        )
+
+    @override_settings(GOVUK_NOTIFY_SMS_SENDER_ID=SENDER_ID)
+    def test_sms_sender_id_setting(self, mock_client):
+        message = NotifySMSMessage(to=["07700 900123"], template_id=TEMPLATE_ID)
+        NotifySMSBackend(max_workers=4).send_messages([message])
+        self.assertEqual(
+            mock_client().send_sms_notification.call_args.kwargs["sms_sender_id"],
+            SENDER_ID,
+        )
+
+    def test_invalid_number(self, mock_client):
+        message = NotifySMSMessage(to=["07700 900123", "0123"], template_id=TEMPLATE_ID)
+        with self.assertRaises(ValueError):
+            NotifySMSBackend().send_messages([message])
+        mock_client().send_sms_notification.assert_not_called()
+
+        self.assertEqual(
+            NotifySMSBackend(fail_silently=True).send_messages([message]), 0
+        )
+        self.assertEqual([r.status for r in message.notify_results], [FAILED, FAILED])
+
+    def test_send_bulk(self, mock_client):
+        rows = (
+            (number, {"name": str(index)})
+            for index, number in enumerate(["07700 900123", "bad", "07700 900456"])
+        )
+        backend = NotifySMSBackend(fail_silently=True, max_workers=2)
+        self.assertEqual(backend.send_bulk(TEMPLATE_ID, rows, SENDER_ID), 2)
+        self.assertEqual(
+            sorted(
+                call.kwargs["phone_number"]
+                for call in mock_client().send_sms_notification.call_args_list
+            ),
+            ["+447700900123", "+447700900456"],
+        )
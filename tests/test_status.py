@@ -0,0 +1,150 @@
+import uuid
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from django_gov_notify.clients import close_clients
+from django_gov_notify.models import NotificationStatus, StatusSyncState
+from django_gov_notify.status import sync_statuses
+
+
+def notification(minute, status="delivered"):
+    return {
+        "id": str(uuid.UUID(int=minute)),
+        "reference": "ref-%d" % minute,
+        "email_address": "user-%d@example.com" % minute,
+        "type": "email",
+        "template": {"id": str(uuid.UUID(int=1000)), "version": 1},
+        "status": status,
+        "created_at": "2026-10-18T09:%02d:00.000000Z" % minute,
+        "sent_at": "2026-10-18T09:%02d:01.000000Z" % minute,
+        "completed_at": None,
+    }
+
+
+class FakeNotify:
+    """Pages through a list of notifications, newest first, as Notify does."""
+
+    page_size = 2
+
+    def __init__(self, notifications):
+        self.notifications = notifications
+        self.requests = []
+
+    def get_all_notifications(self, template_type=None, older_than=None):
+        self.requests.append(older_than)
+        ids = [n["id"] for n in self.notifications]
+        start = ids.index(older_than) + 1 if older_than else 0
+        page = self.notifications[start : start + self.page_size]
+        links = {"current": "/v2/notifications"}
+        if start + self.page_size < len(self.notifications):
+            links["next"] = "/v2/notifications?older_than=%s" % page[-1]["id"]
+        return {"notifications": page, "links": links}
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class SyncStatusesTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def use(self, mock_client, fake):
+        mock_client().get_all_notifications.side_effect = fake.get_all_notifications
+        return fake
+
+    def test_sync(self, mock_client):
+        fake = self.use(
+            mock_client,
+            FakeNotify([notification(minute) for minute in range(5, 0, -1)]),
+        )
+        self.assertEqual(sync_statuses(), 5)
+        self.assertEqual(len(fake.requests), 3)
+        row = NotificationStatus.objects.get(reference="ref-3")
+        self.assertEqual(row.recipient, "user-3@example.com")
+        self.assertEqual(row.status, "delivered")
+        self.assertEqual(row.created_at.minute, 3)
+        self.assertEqual(StatusSyncState.objects.get().high_water_mark.minute, 5)
+
+    def test_later_syncs_stop_at_the_high_water_mark(self, mock_client):
+        fake = self.use(
+            mock_client,
+            FakeNotify(
+                [
+                    notification(6),
+                    notification(5, status="sending"),
+                    notification(4, status="created"),
+                    notification(3),
+                    notification(2),
+                    notification(1),
+                ]
+            ),
+        )
+        self.assertEqual(sync_statuses(), 6)
+        self.assertEqual(StatusSyncState.objects.get().high_water_mark.minute, 4)
+
+        fake.notifications[1]["status"] = "delivered"
+        fake.notifications[2]["status"] = "permanent-failure"
+        fake.notifications[:0] = [notification(8), notification(7)]
+        fake.requests = []
+        # Pages end at minutes 7, 5, 3 and 1; the one ending at 3 passes the mark
+        self.assertEqual(sync_statuses(), 6)
+        self.assertEqual(len(fake.requests), 3)
+        self.assertEqual(NotificationStatus.objects.count(), 8)
+        self.assertEqual(
+            NotificationStatus.objects.get(reference="ref-4").status,
+            "permanent-failure",
+        )
+        self.assertEqual(StatusSyncState.objects.get().high_water_mark.minute, 8)
+
+        fake.requests = []
+        self.assertEqual(sync_statuses(), 2)
+        self.assertEqual(sync_statuses(full=True), 8)
+
+    def test_types_are_synced_separately(self, mock_client):
+        self.use(mock_client, FakeNotify([notification(1)]))
+        sync_statuses(template_type="email")
+        sync_statuses(template_type="sms")
+        self.assertEqual(StatusSyncState.objects.count(), 2)
+
+    @override_settings(
+        GOVUK_NOTIFY_API_KEY=None,
+        GOVUK_NOTIFY_API_KEYS={"main": "main key", "campaigns": "campaigns key"},
+    )
+    def test_every_routed_key_is_synced(self, mock_client):
+        fakes = {
+            "main key": FakeNotify([notification(2)]),
+            "campaigns key": FakeNotify([notification(3), notification(1)]),
+        }
+        mock_client.side_effect = lambda api_key, **kwargs: mock.Mock(
+            get_all_notifications=fakes[api_key].get_all_notifications
+        )
+        self.assertEqual(sync_statuses(), 3)
+        self.assertEqual(NotificationStatus.objects.count(), 3)
+        marks = sorted(
+            state.high_water_mark.minute for state in StatusSyncState.objects.all()
+        )
+        self.assertEqual(marks, [2, 3])
+
+    def test_nothing_to_sync(self, mock_client):
+        self.use(mock_client, FakeNotify([]))
+        self.assertEqual(sync_statuses(), 0)
+        self.assertIsNone(StatusSyncState.objects.get().high_water_mark)
+
+    def test_upsert_without_conflict_target(self, mock_client):
+        # As on MySQL and MariaDB, which can't name the unique field to upsert on
+        self.use(mock_client, FakeNotify([notification(1)]))
+        features = connection.features
+        with mock.patch.object(
+            features, "supports_update_conflicts_with_target", False
+        ), mock.patch.object(NotificationStatus.objects, "bulk_create") as create:
+            sync_statuses()
+        self.assertIsNone(create.call_args.kwargs["unique_fields"])
+        self.assertTrue(create.call_args.kwargs["update_conflicts"])
+
+    def test_command(self, mock_client):
+        self.use(mock_client, FakeNotify([notification(2), notification(1)]))
+        out = StringIO()
+        call_command("notify_sync_status", stdout=out)
+        self.assertEqual(out.getvalue(), "Synced 2 notifications.\n")
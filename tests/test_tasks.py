@@ -0,0 +1,234 @@
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import EmailMessage
+from django.test import TestCase, override_settings
+
+import requests
+from notifications_python_client.errors import HTTP503Error
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from django_gov_notify.clients import close_clients
+from django_gov_notify.priority import BULK, TRANSACTIONAL, current_priority
+from django_gov_notify.results import FAILED, QUEUED
+from django_gov_notify.tasks import (
+    CeleryRunner,
+    SyncRunner,
+    TaskNotifyEmailBackend,
+    ThreadedRunner,
+    retry_task_payload,
+    send_notify_task,
+    send_task_payload,
+)
+from tests.fixtures import NotifyEmailMessageFactory
+
+
+class RecordingRunner:
+    def __init__(self):
+        self.payloads = []
+
+    def submit(self, payload):
+        self.payloads.append(payload)
+
+
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class TaskBackendTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def test_sync_runner_by_default(self, mock_client):
+        backend = TaskNotifyEmailBackend()
+        self.assertIsInstance(backend.runner, SyncRunner)
+        message = NotifyEmailMessageFactory(to=["a@example.com", "b@example.com"])
+        self.assertEqual(backend.send_messages([message]), 1)
+        self.assertEqual(mock_client().send_email_notification.call_count, 2)
+
+    @override_settings(GOVUK_NOTIFY_TASK_RUNNER="tests.test_tasks.RecordingRunner")
+    def test_payloads_are_chunked(self, mock_client):
+        backend = TaskNotifyEmailBackend(chunk_size=2)
+        message = NotifyEmailMessageFactory(to=["%d@example.com" % i for i in range(5)])
+        self.assertEqual(
+            backend.send_messages([message, NotifyEmailMessageFactory()]), 1
+        )
+        self.assertEqual(
+            [payload["recipients"] for payload in backend.runner.payloads],
+            [
+                ["0@example.com", "1@example.com"],
+                ["2@example.com", "3@example.com"],
+                ["4@example.com"],
+            ],
+        )
+        self.assertEqual(backend.runner.payloads[0]["message"], message.message())
+        self.assertEqual([r.status for r in message.notify_results], [QUEUED] * 5)
+        mock_client().send_email_notification.assert_not_called()
+
+    @override_settings(GOVUK_NOTIFY_TASK_RUNNER="tests.test_tasks.RecordingRunner")
+    def test_payloads_carry_priority(self, mock_client):
+        backend = TaskNotifyEmailBackend(priority=BULK)
+        backend.send_messages(
+            [
+                NotifyEmailMessageFactory(to=["a@example.com"]),
+                NotifyEmailMessageFactory(to=["b@example.com"], priority=TRANSACTIONAL),
+            ]
+        )
+        payloads = backend.runner.payloads
+        self.assertEqual(
+            [payload["priority"] for payload in payloads], [BULK, TRANSACTIONAL]
+        )
+
+        priorities = []
+        mock_client().send_email_notification.side_effect = (
+            lambda **kwargs: priorities.append(current_priority())
+        )
+        for payload in payloads:
+            send_task_payload(payload)
+        self.assertEqual(priorities, [BULK, TRANSACTIONAL])
+
+    @override_settings(GOVUK_NOTIFY_TASK_RUNNER="tests.test_tasks.RecordingRunner")
+    def test_unsendable_message_is_not_counted(self, mock_client):
+        backend = TaskNotifyEmailBackend(fail_silently=True)
+        message = EmailMessage(
+            "Subject", "Body", to=["a@example.com"], cc=["b@example.com"]
+        )
+        self.assertEqual(backend.send_messages([message]), 0)
+        self.assertEqual(message.notify_results[0].status, FAILED)
+        self.assertEqual(backend.runner.payloads, [])
+
+    def test_threaded_runner(self, mock_client):
+        futures = []
+
+        class Runner(ThreadedRunner):
+            def submit(self, payload):
+                futures.append(super().submit(payload))
+
+        backend = TaskNotifyEmailBackend(runner=Runner(), chunk_size=1)
+        backend.send_messages(
+            [NotifyEmailMessageFactory(to=["a@example.com", "b@example.com"])]
+        )
+        self.assertEqual([future.result()["sent"] for future in futures], [1, 1])
+
+    def test_send_task_payload_reports_failures(self, mock_client):
+        def send(email_address, **kwargs):
+            if email_address == "bad@example.com":
+                raise Exception("Boom")
+
+        mock_client().send_email_notification.side_effect = send
+        payload = {
+            "message": NotifyEmailMessageFactory().message(),
+            "recipients": ["good@example.com", "bad@example.com"],
+        }
+        with self.assertLogs("django_gov_notify.tasks", "WARNING") as logs:
+            summary = send_task_payload(payload)
+        self.assertEqual(
+            summary, {"sent": 1, "failed": ["bad@example.com"], "retryable": []}
+        )
+        self.assertIn("1 of 2 recipients: Boom", logs.output[0])
+        self.assertNotIn("bad@example.com", logs.output[0])
+
+    @mock.patch("django_gov_notify.retry.time.sleep")
+    def test_server_errors_are_retryable(self, mock_sleep, mock_client):
+        def send(email_address, **kwargs):
+            if email_address == "bad@example.com":
+                raise Exception("Boom")
+            if email_address == "later@example.com":
+                raise HTTP503Error() from requests.ConnectTimeout()
+
+        mock_client().send_email_notification.side_effect = send
+        payload = {
+            "message": NotifyEmailMessageFactory().message(),
+            "recipients": ["bad@example.com", "later@example.com"],
+        }
+        with self.assertLogs("django_gov_notify.tasks", "WARNING"):
+            summary = send_task_payload(payload)
+        self.assertEqual(summary["retryable"], ["later@example.com"])
+
+    @mock.patch("django_gov_notify.retry.time.sleep")
+    def test_refused_connections_are_retryable(self, mock_sleep, mock_client):
+        refused = requests.ConnectionError(
+            MaxRetryError(None, "/", NewConnectionError(None, "Connection refused"))
+        )
+
+        def send(email_address, **kwargs):
+            raise HTTP503Error() from refused
+
+        mock_client().send_email_notification.side_effect = send
+        payload = {
+            "message": NotifyEmailMessageFactory().message(),
+            "recipients": ["later@example.com"],
+        }
+        with self.assertLogs("django_gov_notify.tasks", "WARNING"):
+            summary = send_task_payload(payload)
+        self.assertEqual(summary["retryable"], ["later@example.com"])
+
+    @mock.patch("django_gov_notify.retry.time.sleep")
+    def test_unanswered_requests_are_not_retryable(self, mock_sleep, mock_client):
+        # Notify may have accepted these, so sending again could send twice
+        errors = {
+            "timeout@example.com": requests.ReadTimeout(),
+            "dropped@example.com": requests.ConnectionError(
+                MaxRetryError(None, "/", ProtocolError("Connection aborted."))
+            ),
+        }
+
+        def send(email_address, **kwargs):
+            raise HTTP503Error() from errors[email_address]
+
+        mock_client().send_email_notification.side_effect = send
+        payload = {
+            "message": NotifyEmailMessageFactory().message(),
+            "recipients": list(errors),
+        }
+        with self.assertLogs("django_gov_notify.tasks", "WARNING"):
+            summary = send_task_payload(payload)
+        self.assertEqual(summary["failed"], list(errors))
+        self.assertEqual(summary["retryable"], [])
+
+    @override_settings(GOVUK_NOTIFY_TASK_MAX_RETRIES=2)
+    def test_task_retries_retryable_recipients(self, mock_client):
+        summary = {"sent": 1, "failed": ["b@example.com"], "retryable": []}
+        payload = {"message": {}, "recipients": ["a@example.com", "b@example.com"]}
+        task = mock.Mock()
+        task.request.retries = 1
+        task.retry.return_value = Exception("Retry")
+        with mock.patch(
+            "django_gov_notify.tasks.send_task_payload",
+            return_value=dict(summary, retryable=["b@example.com"]),
+        ):
+            with self.assertRaisesMessage(Exception, "Retry"):
+                retry_task_payload(task, payload)
+        task.retry.assert_called_once_with(
+            args=({"message": {}, "recipients": ["b@example.com"]},),
+            countdown=120,
+            max_retries=2,
+        )
+
+        # No retries left, or nothing worth retrying
+        task.request.retries = 2
+        with mock.patch(
+            "django_gov_notify.tasks.send_task_payload",
+            return_value=dict(summary, retryable=["b@example.com"]),
+        ):
+            retry_task_payload(task, payload)
+        task.request.retries = 0
+        with mock.patch(
+            "django_gov_notify.tasks.send_task_payload", return_value=summary
+        ):
+            self.assertEqual(retry_task_payload(task, payload), summary)
+        task.retry.assert_called_once()
+
+
+class CeleryRunnerTest(TestCase):
+    def test_requires_celery(self):
+        if send_notify_task is not None:
+            self.skipTest("Celery is installed")
+        with self.assertRaises(ImproperlyConfigured):
+            CeleryRunner()
+
+    @override_settings(GOVUK_NOTIFY_TASK_QUEUE="email")
+    def test_submit(self):
+        task = mock.Mock()
+        with mock.patch("django_gov_notify.tasks.send_notify_task", task):
+            CeleryRunner().submit({"message": {}, "recipients": []})
+        task.apply_async.assert_called_once_with(
+            args=({"message": {}, "recipients": []},), queue="email"
+        )
@@ -0,0 +1,156 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from notifications_python_client.errors import HTTP503Error
+
+from django_gov_notify.backends import NotifyEmailBackend
+from django_gov_notify.clients import close_clients
+from django_gov_notify.message import NotifyBulkMessage, NotifyEmailMessage
+from django_gov_notify.models import OutboxMessage
+from django_gov_notify.outbox import OutboxNotifyEmailBackend
+from django_gov_notify.results import FAILED, SENT
+from django_gov_notify.templates import (
+    TemplateCache,
+    normalise,
+    placeholders,
+    validate_personalisation,
+)
+
+TEMPLATE_ID = "43573f75-80e7-402f-b308-e5f1c2a0eca8"
+TEMPLATE = {
+    "id": TEMPLATE_ID,
+    "subject": "Hello ((first name))",
+    "body": "Your reference is ((Ref_Number)).((show_help??Call us for help.))",
+}
+
+
+class PlaceholderTest(TestCase):
+    def test_placeholders(self):
+        self.assertEqual(placeholders(TEMPLATE["body"]), ["Ref_Number", "show_help"])
+        self.assertEqual(placeholders("((a)) ((b)) ((a))"), ["a", "b"])
+        self.assertEqual(placeholders(None), [])
+
+    def test_normalise(self):
+        self.assertEqual(normalise("Ref_Number"), normalise("ref number"))
+        self.assertEqual(normalise("First-Name"), "firstname")
+
+    def test_validate_personalisation(self):
+        template = dict(TEMPLATE, placeholders=["first name", "Ref_Number"])
+        validate_personalisation(template, {"First_Name": "A", "ref number": "1"})
+        with self.assertRaisesRegex(ValueError, "Ref_Number"):
+            validate_personalisation(template, {"first name": "A"})
+
+
+class TemplateCacheTest(TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.get_template.return_value = TEMPLATE
+        self.now = 0
+        self.cache = TemplateCache(ttl=60, maxsize=2, clock=lambda: self.now)
+
+    def test_fetches_once(self):
+        template = self.cache.get(self.client, TEMPLATE_ID)
+        self.cache.get(self.client, TEMPLATE_ID)
+        self.assertEqual(self.client.get_template.call_count, 1)
+        self.assertEqual(
+            template["placeholders"], ["first name", "Ref_Number", "show_help"]
+        )
+
+    def test_expiry(self):
+        self.cache.get(self.client, TEMPLATE_ID)
+        self.now = 61
+        self.cache.get(self.client, TEMPLATE_ID)
+        self.assertEqual(self.client.get_template.call_count, 2)
+
+    def test_least_recently_used_is_evicted(self):
+        for template_id in ["a", "b", "a", "c", "a"]:
+            self.cache.get(self.client, template_id)
+        self.assertEqual(self.client.get_template.call_count, 3)
+        self.cache.get(self.client, "b")
+        self.assertEqual(self.client.get_template.call_count, 4)
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "template-tests",
+            }
+        }
+    )
+    def test_django_cache(self):
+        cache = TemplateCache(cache_alias="default")
+        cache.get(self.client, TEMPLATE_ID)
+        cache.get(self.client, TEMPLATE_ID)
+        self.assertEqual(self.client.get_template.call_count, 1)
+
+
+@override_settings(GOVUK_NOTIFY_VALIDATE_TEMPLATES=True)
+@mock.patch("django_gov_notify.templates.get_template_cache")
+@mock.patch("django_gov_notify.clients.NotificationsAPIClient")
+class BackendValidationTest(TestCase):
+    def setUp(self):
+        self.addCleanup(close_clients)
+
+    def message(self, personalisation, to=("a@example.com",)):
+        return NotifyEmailMessage(
+            to=list(to), template_id=TEMPLATE_ID, personalisation=personalisation
+        )
+
+    def test_valid_message_is_sent(self, mock_client, mock_cache):
+        mock_cache().get.return_value = dict(TEMPLATE, placeholders=["first name"])
+        message = self.message({"first_name": "A"})
+        self.assertEqual(NotifyEmailBackend().send_messages([message]), 1)
+        self.assertEqual(message.notify_results[0].status, SENT)
+
+    def test_invalid_message_raises_before_sending(self, mock_client, mock_cache):
+        mock_cache().get.return_value = dict(TEMPLATE, placeholders=["first name"])
+        valid = self.message({"first_name": "A"})
+        with self.assertRaises(ValueError):
+            NotifyEmailBackend().send_messages([valid, self.message({})])
+        mock_client().send_email_notification.assert_not_called()
+
+    def test_invalid_message_fails_silently(self, mock_client, mock_cache):
+        mock_cache().get.return_value = dict(TEMPLATE, placeholders=["first name"])
+        invalid = self.message({}, to=["a@example.com", "b@example.com"])
+        valid = self.message({"first_name": "A"})
+        backend = NotifyEmailBackend(fail_silently=True)
+        self.assertEqual(backend.send_messages([invalid, valid]), 1)
+        self.assertEqual([r.status for r in invalid.notify_results], [FAILED] * 2)
+        self.assertEqual(mock_client().send_email_notification.call_count, 1)
+
+    def test_bulk_rows_are_validated(self, mock_client, mock_cache):
+        mock_cache().get.return_value = dict(TEMPLATE, placeholders=["first name"])
+        rows = [("a@example.com", {"first name": "A"}), ("b@example.com", {})]
+        backend = NotifyEmailBackend(fail_silently=True)
+        message = NotifyBulkMessage(TEMPLATE_ID, rows, connection=backend)
+        self.assertEqual(message.send(), 1)
+        self.assertEqual(mock_client().send_email_notification.call_count, 1)
+
+    def test_template_fetch_error_fails_silently(self, mock_client, mock_cache):
+        error = HTTP503Error(message="Connection refused")
+        mock_cache().get.side_effect = error
+        message = self.message({"first_name": "A"})
+        backend = NotifyEmailBackend(fail_silently=True)
+        self.assertEqual(backend.send_messages([message]), 0)
+        self.assertEqual(message.notify_results[0].status, FAILED)
+        self.assertIs(message.notify_results[0].error, error)
+        mock_client().send_email_notification.assert_not_called()
+
+        rows = [("a@example.com", {"first name": "A"})]
+        self.assertEqual(
+            NotifyBulkMessage(TEMPLATE_ID, rows, connection=backend).send(), 0
+        )
+
+    def test_template_fetch_error_is_not_queued(self, mock_client, mock_cache):
+        mock_cache().get.side_effect = HTTP503Error(message="Connection refused")
+        backend = OutboxNotifyEmailBackend(fail_silently=True)
+        self.assertEqual(backend.send_messages([self.message({"first_name": "A"})]), 0)
+        self.assertFalse(OutboxMessage.objects.exists())
+        with self.assertRaises(HTTP503Error):
+            OutboxNotifyEmailBackend().send_messages([self.message({})])
+
+    @override_settings(GOVUK_NOTIFY_VALIDATE_TEMPLATES=False)
+    def test_disabled_by_default(self, mock_client, mock_cache):
+        NotifyEmailBackend().send_messages([self.message({})])
+        mock_cache().get.assert_not_called()